@@ -0,0 +1,311 @@
+import argparse
+import logging
+import random
+import sys
+import types
+from threading import Thread
+from time import sleep, time
+
+# The benchmark never talks to a real timing system - the timing PV is replaced below.
+try:
+    import epics
+except ImportError:
+    sys.modules["epics"] = types.ModuleType("epics")
+
+from sf_dia import manager, timing_pv
+from sf_dia.client.detector_pipeline import DetectorPipeline
+from sf_dia.validation import IntegrationStatus
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_DETECTORS = "1,2,4,8,16"
+START_CODE = 254
+STOP_CODE = 255
+PHASES = ("configure", "start", "stop", "reset")
+
+CONFIG = {
+    "backend": {"bit_depth": 16, "n_frames": 10},
+    "detector": {"dr": 16, "cycles": 10, "exptime": 0.001},
+    "writer": {"n_frames": 10, "output_file": "/dev/null", "user_id": 11057,
+               "general/created": "today", "general/user": "p11057",
+               "general/process": "dia", "general/instrument": "jungfrau"},
+    "bsread": {"output_file": "/dev/null", "user_id": 11057,
+               "general/created": "today", "general/user": "p11057",
+               "general/process": "dia", "general/instrument": "jungfrau"}
+}
+
+
+class SimulatedTiming(object):
+    # Shared between the mock clients: the detectors acquire for run_time seconds after the start trigger.
+
+    def __init__(self, run_time, latency):
+        self.run_time = run_time
+        self.latency = latency
+        self.trigger_time = None
+
+    def get_pv(self, pv_name, connection_callback=None):
+        return SimulatedPV(self)
+
+    def put(self, value):
+        sleep(self.latency)
+        self.trigger_time = time() if value == START_CODE else None
+
+    def is_acquiring(self):
+        return self.trigger_time is not None and time() - self.trigger_time < self.run_time
+
+
+class SimulatedPV(object):
+    # Implements the part of epics.PV used by the timing event PV.
+    connected = True
+
+    def __init__(self, timing):
+        self.timing = timing
+
+    def wait_for_connection(self, timeout=None):
+        return True
+
+    def put(self, value, wait=False, timeout=None, use_complete=False, callback=None):
+        if wait:
+            self.timing.put(value)
+            return 1
+
+        def complete():
+            self.timing.put(value)
+            if callback is not None:
+                callback(pvname="SIMULATED:TIMING")
+
+        Thread(target=complete, daemon=True).start()
+        return 1
+
+
+class MockClient(object):
+    # Every call sleeps latency +- jitter and fails with the given probability.
+
+    def __init__(self, timing, latency, jitter, failure_rate):
+        self.timing = timing
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+        self.backend_url = "http://localhost:8080"
+        self.broker_url = "http://localhost:10002"
+        self.url = "http://localhost:10001"
+
+    def _call(self, name):
+        sleep(max(0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Injected failure in %s.%s()." % (type(self).__name__, name))
+
+    def get_statistics(self):
+        self._call("get_statistics")
+        return {}
+
+
+class MockBackendClient(MockClient):
+    status = "INITIALIZED"
+
+    def get_status(self):
+        self._call("get_status")
+        return self.status
+
+    def set_config(self, configuration):
+        self._call("set_config")
+        self.status = "CONFIGURED"
+
+    def open(self):
+        self._call("open")
+        self.status = "OPEN"
+
+    def close(self):
+        self._call("close")
+        self.status = "CONFIGURED"
+
+    def reset(self):
+        self._call("reset")
+        self.status = "INITIALIZED"
+
+    def get_metrics(self):
+        self._call("get_metrics")
+        return {}
+
+
+class MockDetectorClient(MockClient):
+    started = False
+
+    def get_status(self):
+        self._call("get_status")
+        return "running" if self.started and self.timing.is_acquiring() else "idle"
+
+    def set_config(self, configuration):
+        self._call("set_config")
+
+    def start(self):
+        self._call("start")
+        self.started = True
+
+    def stop(self):
+        self._call("stop")
+        self.started = False
+
+
+class MockProcessClient(MockClient):
+    # Writer and bsread writer: running while the detectors acquire, finished after.
+    status = "stopped"
+
+    def get_status(self):
+        self._call("get_status")
+
+        if self.status == self.running_status and self.timing.trigger_time is not None \
+                and not self.timing.is_acquiring():
+            return self.finished_status
+
+        return self.status
+
+    def set_parameters(self, process_parameters):
+        self._call("set_parameters")
+        self.status = self.configured_status
+
+    def start(self):
+        self._call("start")
+        self.status = self.running_status
+
+    def stop(self):
+        self._call("stop")
+        self.status = "stopped"
+
+    def reset(self):
+        self._call("reset")
+        self.status = "stopped"
+
+    def kill(self):
+        self._call("kill")
+        self.status = "stopped"
+
+    def crash(self):
+        # Brings the integration to ERROR, until the next reset or kill.
+        self.status = "error"
+
+
+class MockWriterClient(MockProcessClient):
+    configured_status = "stopped"
+    running_status = "writing"
+    finished_status = "finished"
+
+
+class MockBsreadClient(MockProcessClient):
+    configured_status = "configured"
+    running_status = "receiving"
+    finished_status = "stopped"
+
+
+def get_benchmark_manager(n_detectors, timing, latency, jitter, failure_rate, async_timing_trigger=False):
+    def client(client_type):
+        return client_type(timing, latency, jitter, failure_rate)
+
+    enabled_detectors = {}
+    for index in range(n_detectors):
+        enabled_detectors["JF%02d" % index] = DetectorPipeline(client(MockDetectorClient),
+                                                               client(MockBackendClient),
+                                                               client(MockWriterClient))
+
+    timing_pv.epics.PV = timing.get_pv
+
+    return manager.IntegrationManager(enabled_detectors=enabled_detectors,
+                                      bsread_client=client(MockBsreadClient),
+                                      timing_pv="SIMULATED:TIMING",
+                                      timing_start_code=START_CODE,
+                                      timing_stop_code=STOP_CODE,
+                                      async_timing_trigger=async_timing_trigger)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_cycles(integration_manager, n_cycles, run_time):
+    timings = {phase: [] for phase in PHASES}
+    n_failures = 0
+
+    for _ in range(n_cycles):
+        try:
+            start_time = time()
+            integration_manager.set_acquisition_config(CONFIG)
+            timings["configure"].append(time() - start_time)
+
+            start_time = time()
+            integration_manager.start_acquisition({"trigger_start": True})
+            timings["start"].append(time() - start_time)
+
+            integration_manager.wait_for_status(IntegrationStatus.FINISHED, timeout=run_time + 10)
+
+            start_time = time()
+            integration_manager.stop_acquisition()
+            timings["stop"].append(time() - start_time)
+
+            # Stopping already resets the clients: reset is measured recovering from a crashed bsread writer
+            # instead, with every other client configured.
+            integration_manager.set_acquisition_config(CONFIG)
+            integration_manager.bsread_client.client.crash()
+            integration_manager.wait_for_status(IntegrationStatus.ERROR)
+
+            start_time = time()
+            integration_manager.reset()
+            timings["reset"].append(time() - start_time)
+
+        except Exception as e:
+            n_failures += 1
+            _logger.info("Cycle failed: %s", e)
+
+            # Bring the integration back to a known state for the next cycle.
+            try:
+                integration_manager.kill()
+            except Exception as e:
+                _logger.info("Recovery failed: %s", e)
+
+    return timings, n_failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmark of the IntegrationManager state machine "
+                                                 "with mock clients.")
+    parser.add_argument("--detectors", default=DEFAULT_DETECTORS,
+                        help="Comma separated numbers of detectors to benchmark.")
+    parser.add_argument("--cycles", type=int, default=20, help="Configure/start/stop/reset cycles per point.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Mean latency of each client call in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.002, help="Standard deviation of the latency in seconds.")
+    parser.add_argument("--failure_rate", type=float, default=0.0, help="Probability of each client call to fail.")
+    parser.add_argument("--caput_latency", type=float, default=0.005, help="Latency of the timing caput in seconds.")
+    parser.add_argument("--async_timing_trigger", action="store_true",
+                        help="Do not block on the timing event puts.")
+    parser.add_argument("--run_time", type=float, default=0.0, help="Acquisition time of each run in seconds.")
+    parser.add_argument("--log_level", default="WARNING",
+                        choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help="Log level to use.")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=arguments.log_level, format='[%(levelname)s] %(message)s')
+    # The audit trail logs every client call - not what we want to measure.
+    logging.getLogger("audit_trail").setLevel(logging.WARNING)
+
+    print("%9s %10s %10s %10s %9s" % ("detectors", "phase", "p50 [ms]", "p99 [ms]", "failures"))
+
+    for n_detectors in [int(x) for x in arguments.detectors.split(",")]:
+        timing = SimulatedTiming(arguments.run_time, arguments.caput_latency)
+        integration_manager = get_benchmark_manager(n_detectors, timing, arguments.latency, arguments.jitter,
+                                                    arguments.failure_rate, arguments.async_timing_trigger)
+
+        timings, n_failures = run_cycles(integration_manager, arguments.cycles, arguments.run_time)
+
+        for phase in PHASES:
+            print("%9d %10s %10.1f %10.1f %9d" % (n_detectors, phase,
+                                                  percentile(timings[phase], 0.5) * 1000,
+                                                  percentile(timings[phase], 0.99) * 1000,
+                                                  n_failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+from copy import deepcopy
+from logging import getLogger
+from threading import Thread, Lock, Event
+from time import time
+
+_logger = getLogger(__name__)
+_audit_logger = getLogger("audit_trail")
+
+
+class AcquisitionQueue(object):
+    # Runs a batch of acquisition configs back to back: configure, start, wait for FINISHED, next.
+    # While a run is acquiring, the config of the next one is validated and its per-detector configs derived.
+
+    def __init__(self, integration_manager):
+        self.integration_manager = integration_manager
+
+        self._lock = Lock()
+        self._cancel = Event()
+        self._thread = None
+
+        self._state = "idle"
+        self._runs = []
+        self._current_run = None
+
+    def submit(self, configs, parameters=None):
+        if not configs:
+            raise ValueError("Specify at least one acquisition config.")
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ValueError("Cannot submit acquisition queue, the previous one is still %s." % self._state)
+
+            self._cancel.clear()
+            self._state = "running"
+            self._current_run = None
+            self._runs = [{"index": index, "state": "pending", "error": None, "timings": {}}
+                          for index in range(len(configs))]
+
+            self._thread = Thread(target=self._execute, args=(deepcopy(configs), parameters), daemon=True)
+            self._thread.start()
+
+        _audit_logger.info("Acquisition queue submitted with %d runs.", len(configs))
+
+        return self.get_status()
+
+    def cancel(self):
+        # The run being acquired cannot be interrupted, the queue stops once it is finished.
+        with self._lock:
+            if self._state == "running":
+                self._state = "cancelling"
+                self._cancel.set()
+
+        _audit_logger.info("Acquisition queue cancelled.")
+
+        return self.get_status()
+
+    def get_status(self):
+        with self._lock:
+            return {"state": self._state,
+                    "current_run": self._current_run,
+                    "n_runs": len(self._runs),
+                    "runs": deepcopy(self._runs)}
+
+    def _set_run(self, index, state, error=None):
+        with self._lock:
+            self._runs[index]["state"] = state
+            if error is not None:
+                self._runs[index]["error"] = str(error)
+
+    def _set_timing(self, index, name, start_time):
+        with self._lock:
+            self._runs[index]["timings"][name] = time() - start_time
+
+    def _prepare(self, index, config):
+        start_time = time()
+
+        try:
+            prepared_config = self.integration_manager.prepare_acquisition_config(config)
+            self._set_run(index, "prepared")
+        except Exception as e:
+            _logger.warning("Acquisition queue run %d has an invalid config: %s", index, e)
+            self._set_run(index, "invalid", e)
+            prepared_config = None
+
+        self._set_timing(index, "prepare", start_time)
+
+        return prepared_config
+
+    def _execute(self, configs, parameters):
+        prepared_configs = {0: self._prepare(0, configs[0])}
+        finished_run = None
+
+        try:
+            for index in range(len(configs)):
+
+                if self._cancel.is_set():
+                    break
+
+                # Runs after an invalid one were not prepared in advance.
+                if index in prepared_configs:
+                    prepared_config = prepared_configs.pop(index)
+                else:
+                    prepared_config = self._prepare(index, configs[index])
+
+                if prepared_config is None:
+                    continue
+
+                with self._lock:
+                    self._current_run = index
+
+                try:
+                    self._set_run(index, "configuring")
+                    start_time = time()
+
+                    # Right after a finished run the pipelines are re-armed, so unchanged clients are not reset.
+                    if finished_run is not None:
+                        self.integration_manager.rearm_acquisition(prepared_config)
+                    else:
+                        self.integration_manager.set_prepared_acquisition_config(prepared_config)
+                    finished_run = None
+                    self._set_timing(index, "configure", start_time)
+
+                    self._set_run(index, "running")
+                    start_time = time()
+                    self.integration_manager.start_acquisition(parameters)
+                    self._set_timing(index, "start", start_time)
+
+                    # Pipeline the next run: validate and derive its configs while this one acquires.
+                    if index + 1 < len(configs):
+                        prepared_configs[index + 1] = self._prepare(index + 1, configs[index + 1])
+
+                    start_time = time()
+                    self.integration_manager.wait_for_acquisition_end()
+                    self._set_timing(index, "acquisition", start_time)
+
+                    finished_run = index
+                    self._set_run(index, "finished")
+
+                except Exception as e:
+                    _logger.error("Acquisition queue run %d failed: %s", index, e)
+                    self._set_run(index, "failed", e)
+                    raise
+
+        except Exception:
+            with self._lock:
+                self._state = "failed"
+
+        finally:
+            # Stopping brings the integration back to INITIALIZED, as after a single acquisition.
+            if finished_run is not None:
+                start_time = time()
+                try:
+                    self.integration_manager.stop_acquisition()
+                except Exception as e:
+                    _logger.error("Acquisition queue cannot stop the last run: %s", e)
+                    self._set_run(finished_run, "failed", e)
+                self._set_timing(finished_run, "stop", start_time)
+
+            with self._lock:
+                for run in self._runs:
+                    if run["state"] in ("pending", "prepared"):
+                        run["state"] = "cancelled"
+
+                self._current_run = None
+                if self._state != "failed":
+                    self._state = "cancelled" if self._cancel.is_set() else "finished"
+
+            _audit_logger.info("Acquisition queue %s.", self._state)
@@ -0,0 +1,121 @@
+from logging import getLogger
+from threading import Thread, Event, Lock
+from time import time
+
+_logger = getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+# Time after opening before the first probe. It doubles after every failed probe, up to the maximum.
+DEFAULT_RESET_TIMEOUT = 5
+DEFAULT_MAX_RESET_TIMEOUT = 60
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class StaleStatus(str):
+    # Last known status of a client that cannot be reached at the moment, with the time it was received.
+    # For reporting only: the client cannot be commanded until it is reachable again.
+    stale = True
+
+    def __new__(cls, status, timestamp=None):
+        stale_status = super(StaleStatus, cls).__new__(cls, status)
+        stale_status.timestamp = timestamp
+        return stale_status
+
+
+class CircuitBreaker(object):
+    # After failure_threshold consecutive failures the calls fail fast with CircuitOpenError, while the probe
+    # function is retried in the background (half-open). The first successful probe closes the circuit.
+
+    def __init__(self, name, probe, failure_threshold=None, reset_timeout=None, max_reset_timeout=None):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold or DEFAULT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or DEFAULT_RESET_TIMEOUT
+        self.max_reset_timeout = max_reset_timeout or DEFAULT_MAX_RESET_TIMEOUT
+
+        self._lock = Lock()
+        self._state = STATE_CLOSED
+        self._n_failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._n_probes = 0
+
+        self._stop = Event()
+        self._prober = None
+
+    def check(self):
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                raise CircuitOpenError("%s unavailable since %s seconds, retrying in the background. Last error: %s" %
+                                       (self.name, round(time() - self._opened_at, 1), self._last_error))
+
+    def record_success(self):
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                self._n_failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._n_failures += 1
+            self._last_error = str(error)
+
+            if self._state != STATE_CLOSED or self._n_failures < self.failure_threshold:
+                return
+
+            self._state = STATE_OPEN
+            self._opened_at = time()
+
+        _logger.warning("Opening circuit for %s after %d consecutive failures: %s",
+                        self.name, self._n_failures, error)
+
+        self._stop.clear()
+        self._prober = Thread(target=self._probe_until_closed, daemon=True)
+        self._prober.start()
+
+    def _probe_until_closed(self):
+        reset_timeout = self.reset_timeout
+
+        while not self._stop.wait(reset_timeout):
+            with self._lock:
+                self._state = STATE_HALF_OPEN
+                self._n_probes += 1
+
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self._state = STATE_OPEN
+                    self._last_error = str(e)
+
+                reset_timeout = min(reset_timeout * 2, self.max_reset_timeout)
+                _logger.debug("Probe of %s failed, next one in %s seconds: %s", self.name, reset_timeout, e)
+                continue
+
+            with self._lock:
+                self._state = STATE_CLOSED
+                self._n_failures = 0
+
+            _logger.info("Closing circuit for %s, available again.", self.name)
+            return
+
+    def stop(self):
+        self._stop.set()
+
+    def is_closed(self):
+        return self._state == STATE_CLOSED
+
+    def get_status(self):
+        with self._lock:
+            return {"name": self.name,
+                    "state": self._state,
+                    "consecutive_failures": self._n_failures,
+                    "opened_at": self._opened_at if self._state != STATE_CLOSED else None,
+                    "last_error": self._last_error,
+                    "n_probes": self._n_probes}
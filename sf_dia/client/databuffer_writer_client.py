@@ -1,39 +1,135 @@
+import random
 import requests
+import threading
+from functools import partial
 from logging import getLogger
-from time import sleep
+from requests.adapters import HTTPAdapter
+from time import sleep, time
 
 from detector_integration_api import config
 
+from sf_dia.circuit_breaker import CircuitBreaker, CircuitOpenError, StaleStatus
+from sf_dia.utils import get_current_deadline
+
 _logger = getLogger(__name__)
 
+# Connections kept open to the broker - one per concurrent request (status poller, metrics, commands).
+DEFAULT_POOL_SIZE = 4
+# The delay between retries doubles from the base up to the maximum, with random jitter.
+DEFAULT_RETRY_BASE_DELAY = 0.05
+DEFAULT_RETRY_MAX_DELAY = config.EXTERNAL_PROCESS_RETRY_DELAY
+# Time allowed for a request including its retries, as long as the fixed delay retries used to take at most.
+DEFAULT_REQUEST_DEADLINE = config.EXTERNAL_PROCESS_RETRY_N * (config.EXTERNAL_PROCESS_COMMUNICATION_TIMEOUT +
+                                                              config.EXTERNAL_PROCESS_RETRY_DELAY)
+
 
 class DataBufferWriterClient(object):
     PROCESS_NAME = "databuffer_writer"
 
-    def __init__(self, broker_url):
+    def __init__(self, broker_url, pool_size=None, request_deadline=None, failure_threshold=None, reset_timeout=None):
         self.broker_url = broker_url
+        # A deadline of 0 still makes a single attempt, without retries.
+        self.request_deadline = DEFAULT_REQUEST_DEADLINE if request_deadline is None else request_deadline
+
+        # Keep-alive connections, instead of a new one for every request.
+        pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+
+        # Reason of the last failed request of each thread, for the error messages.
+        self._thread_local = threading.local()
+
+        # While the broker is unavailable the requests fail fast and get_status returns the last known status.
+        self.circuit_breaker = CircuitBreaker("%s broker %s" % (self.PROCESS_NAME, broker_url),
+                                              probe=partial(self._get_status, check_circuit=False),
+                                              failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        # (status, timestamp)
+        self._last_known_status = None
+
+    @property
+    def last_error(self):
+        return getattr(self._thread_local, "last_error", None)
+
+    @last_error.setter
+    def last_error(self, last_error):
+        self._thread_local.last_error = last_error
+
+    def _send_request_to_process(self, method, url, request_json=None, return_response=False, check_circuit=True):
+        # Retry with backoff until EXTERNAL_PROCESS_RETRY_N attempts or the deadline while the broker cannot be
+        # reached, and return False if no attempt succeeded. A broker replying with an error is not retried,
+        # the error is raised as ValueError.
+        if check_circuit:
+            self.circuit_breaker.check()
+
+        deadline = time() + self.request_deadline
+
+        # The deadline of the command in progress can only shorten the request.
+        command_deadline = get_current_deadline()
+        cut_short = command_deadline is not None and command_deadline.expiry < deadline
+        if cut_short:
+            deadline = command_deadline.expiry
+
+            if deadline <= time():
+                self.last_error = "No time left for the request to %s." % url
+                return False
+
+        delay = DEFAULT_RETRY_BASE_DELAY
+        # Only the broker not being reached counts as a failure for the circuit breaker.
+        unreachable = False
+
+        for attempt in range(config.EXTERNAL_PROCESS_RETRY_N):
+
+            if attempt > 0:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
 
-    def _send_request_to_process(self, requests_method, url, request_json=None, return_response=False):
-        for _ in range(config.EXTERNAL_PROCESS_RETRY_N):
+                sleep(min(random.uniform(delay / 2, delay), remaining))
+                delay = min(delay * 2, DEFAULT_RETRY_MAX_DELAY)
+
+            timeout = min(config.EXTERNAL_PROCESS_COMMUNICATION_TIMEOUT, max(deadline - time(), 0.001))
 
             try:
-                response = requests_method(url=url, json=request_json,
-                                           timeout=config.EXTERNAL_PROCESS_COMMUNICATION_TIMEOUT).json()
+                response = self.session.request(method, url=url, json=request_json, timeout=timeout).json()
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+                unreachable = True
+                self.last_error = "Cannot connect to %s process at %s: %s" % (self.PROCESS_NAME, url, e)
+                _logger.debug("%s. Retrying.", self.last_error)
+                continue
+
+            except ValueError as e:
+                unreachable = False
+                self.last_error = "Invalid reply from %s process at %s: %s" % (self.PROCESS_NAME, url, e)
+                _logger.debug("%s. Retrying.", self.last_error)
+                continue
+
+            # The broker is up, even if it refuses the request.
+            self.circuit_breaker.record_success()
 
-                if response["state"] != "ok":
-                    _logger.debug("Error while trying to communicate with the %s process. Retrying." %
-                                  self.PROCESS_NAME, response)
+            # Any valid JSON but an object with an "ok" state is refused as an error reply.
+            if not isinstance(response, dict):
+                self.last_error = "%s process replied to %s with: %s" % (self.PROCESS_NAME, url, response)
+                raise ValueError(self.last_error)
 
-                    sleep(config.EXTERNAL_PROCESS_RETRY_DELAY)
-                    continue
+            if response.get("state") != "ok":
+                self.last_error = "%s process replied to %s with: %s" % (self.PROCESS_NAME, url,
+                                                                          response.get("status"))
+                raise ValueError(self.last_error)
 
-                if return_response:
-                    return response
-                else:
-                    return True
+            self.last_error = None
 
-            except:
-                sleep(config.EXTERNAL_PROCESS_RETRY_DELAY)
+            if return_response:
+                return response
+            else:
+                return True
+
+        _logger.warning("Request to %s failed after %d attempts: %s", url, attempt + 1, self.last_error)
+
+        # Running out of the command budget says nothing about the broker.
+        if unreachable and not (cut_short and deadline <= time()):
+            self.circuit_breaker.record_failure(self.last_error)
 
         return False
 
@@ -44,7 +140,7 @@ class DataBufferWriterClient(object):
     def _kill(self):
         _logger.warning("Terminating process %s. Data files might be corrupted." % self.PROCESS_NAME)
 
-        self._send_request_to_process(requests.get, self.broker_url + "/kill")
+        self._send_request_to_process("get", self.broker_url + "/kill")
 
         try:
             self.process.wait(timeout=config.EXTERNAL_PROCESS_TERMINATE_TIMEOUT)
@@ -55,17 +151,33 @@ class DataBufferWriterClient(object):
 
         _logger.debug("Sending stop command to the process %s." % self.PROCESS_NAME)
 
-        if not self._send_request_to_process(requests.get, self.broker_url + "/stop"):
-            raise ValueError("Process %s is running but cannot send stop command." % self.PROCESS_NAME)
+        # Stopping is always attempted, even while the broker is considered unavailable.
+        if not self._send_request_to_process("get", self.broker_url + "/stop", check_circuit=False):
+            raise ValueError("Process %s is running but cannot send stop command. %s" %
+                             (self.PROCESS_NAME, self.last_error))
 
     def get_status(self):
 
-        status = self._send_request_to_process(requests.get,
+        try:
+            return self._get_status()
+
+        except CircuitOpenError:
+            if self._last_known_status is None:
+                raise
+
+            return StaleStatus(*self._last_known_status)
+
+    def _get_status(self, check_circuit=True):
+
+        status = self._send_request_to_process("get",
                                                self.broker_url + "/status",
-                                               return_response=True)
+                                               return_response=True,
+                                               check_circuit=check_circuit)
 
         if status is False:
-            raise ValueError("Cannot get status of process %s ." % self.PROCESS_NAME)
+            raise ValueError("Cannot get status of process %s. %s" % (self.PROCESS_NAME, self.last_error))
+
+        self._last_known_status = (status["status"], time())
 
         return status["status"]
 
@@ -73,13 +185,14 @@ class DataBufferWriterClient(object):
 
         _logger.debug("Setting process %s parameters: %s", self.PROCESS_NAME, process_parameters)
 
-        if not self._send_request_to_process(requests.post, self.broker_url + "/parameters",
+        if not self._send_request_to_process("post", self.broker_url + "/parameters",
                                              request_json=process_parameters):
+            error = self.last_error
             _logger.warning("Terminating %s process because it did not respond in the specified time." %
                             self.PROCESS_NAME)
             self.stop()
 
-            raise RuntimeError("Could not set %s process parameters in time. Check logs." % self.PROCESS_NAME)
+            raise RuntimeError("Could not set %s process parameters in time. %s" % (self.PROCESS_NAME, error))
 
     def reset(self):
 
@@ -89,14 +202,19 @@ class DataBufferWriterClient(object):
 
     def get_statistics(self):
 
-        statistics = self._send_request_to_process(requests.get,
+        statistics = self._send_request_to_process("get",
                                                    self.broker_url + "/statistics",
                                                    return_response=True)
 
         if statistics is False:
-            raise ValueError("Process %s is running but cannot get statistics." % self.PROCESS_NAME)
+            raise ValueError("Process %s is running but cannot get statistics. %s" %
+                             (self.PROCESS_NAME, self.last_error))
 
         return statistics
 
     def kill(self):
-        self._send_request_to_process(requests.get, self.broker_url + "/kill")
+        # Never fails, there is nothing left to do if the broker cannot kill the writer.
+        try:
+            self._send_request_to_process("get", self.broker_url + "/kill", check_circuit=False)
+        except ValueError as e:
+            _logger.warning("Cannot kill %s process: %s", self.PROCESS_NAME, e)
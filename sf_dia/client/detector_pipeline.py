@@ -4,49 +4,115 @@ from detector_integration_api.client.backend_rest_client import BackendClient
 from detector_integration_api.client.cpp_writer_client   import CppWriterClient
 from detector_integration_api.client.detector_client import DetectorClient
 
-_logger = getLogger(__name__)
+from sf_dia.timing import CLIENT_METRIC
+from sf_dia.utils import check_dependency_graph, run_dependency_graph, call_with_deadline
 
-from time import time
+_logger = getLogger(__name__)
 
 class DetectorPipeline(object):
 
-    def __init__(self, detector_client, backend_client, writer_client ):
+    # Order of the clients in return_clients and get_config.
+    CLIENT_NAMES = ("detector", "backend", "writer")
+
+    # Client calls of each command, in order. The manager runs every phase on all pipelines before the next one.
+    START_PHASES = (("backend", "open"), ("writer", "start"), ("detector", "start"))
+    STOP_PHASES  = (("detector", "stop"), ("backend", "close"), ("writer", "stop"))
+
+    # Client calls of reset and kill as a dependency graph {step: (client, method, dependencies)}.
+    # Steps run as soon as their dependencies are done.
+    RESET_STEPS = {"detector_stop": ("detector", "stop",  []),
+                   "backend_reset": ("backend",  "reset", ["detector_stop"]),
+                   "writer_reset":  ("writer",   "reset", ["detector_stop"])}
+    KILL_STEPS  = {"detector_stop": ("detector", "stop",  []),
+                   "backend_reset": ("backend",  "reset", ["detector_stop"]),
+                   "writer_kill":   ("writer",   "kill",  [])}
+
+    def __init__(self, detector_client, backend_client, writer_client, reset_steps=None, kill_steps=None,
+                 name=None, timings=None, n_modules=None):
         self.detector_client = detector_client
         self.backend_client  = backend_client
         self.writer_client   = writer_client
 
+        # Number of modules of the detector, used to estimate the data rate (None if not known).
+        self.n_modules = n_modules
+
+        # With timings, every client call is measured under the detector name.
+        self.name    = name
+        self.timings = timings
+
+        self.reset_steps = reset_steps or self.RESET_STEPS
+        self.kill_steps  = kill_steps  or self.KILL_STEPS
+
+        check_dependency_graph({name: step[2] for name, step in self.reset_steps.items()})
+        check_dependency_graph({name: step[2] for name, step in self.kill_steps.items()})
+
         self.detector_config = {}
         self.backend_config  = {}
         self.writer_config   = {}
 
     def start(self):
 
-        self.backend_client.open()
-        self.writer_client.start()
-        self.detector_client.start()
+        for phase in self.START_PHASES:
+            self.run_phase(phase)
 
     def stop(self):
 
-        self.detector_client.stop()
-        self.backend_client.close()
-        self.writer_client.stop()
+        for phase in self.STOP_PHASES:
+            self.run_phase(phase)
 
     def reset(self):
 
-        time1 = time()
-        self.detector_client.stop()
-        time2 = time()
-        self.backend_client.reset()
-        time3 = time()
-        self.writer_client.reset()
-        time4 = time()
-        _logger.info("detector %f , backend %f , writer %f", time2-time1, time3-time2, time4-time3)
+        self._run_steps("reset", self.reset_steps)
 
     def kill(self):
 
-        self.detector_client.stop()
-        self.backend_client.reset()
-        self.writer_client.kill()
+        self._run_steps("kill", self.kill_steps)
+
+    def _run_steps(self, command, steps):
+
+        timings = run_dependency_graph({name: step[2] for name, step in steps.items()},
+                                       lambda name: self.run_phase(steps[name][:2]))
+
+        _logger.debug("(%s) %s steps %s", self.name, command,
+                      " , ".join("%s %f" % (name, timings[name]) for name in sorted(timings)))
+
+    def run_phase(self, phase):
+
+        client_name, method_name = phase
+        self._call(client_name, method_name)
+
+    def _call(self, client_name, method_name, *args):
+        # Within the deadline of the command, if any: no call is started after it passed.
+
+        method = getattr(self.get_client(client_name), method_name)
+
+        if self.timings is None:
+            return call_with_deadline(method, self.name, client_name, method_name, *args)
+
+        with self.timings.measure(CLIENT_METRIC, detector=self.name, client=client_name, operation=method_name):
+            return call_with_deadline(method, self.name, client_name, method_name, *args)
+
+    def get_client(self, client_name):
+
+        return getattr(self, client_name + "_client")
+
+    def apply_config(self, detector_config, backend_config, writer_config, clients=None, reset=False):
+        # Only the listed clients are configured. With reset, the backend and writer are reset first,
+        # as they cannot be reconfigured in place.
+        clients = clients or self.CLIENT_NAMES
+
+        if "backend" in clients:
+            if reset:
+                self._call("backend", "reset")
+            self._call("backend", "set_config", backend_config)
+
+        if "writer" in clients:
+            if reset:
+                self._call("writer", "reset")
+            self._call("writer", "set_parameters", writer_config)
+
+        if "detector" in clients:
+            self._call("detector", "set_config", detector_config)
 
     def return_clients(self):
   
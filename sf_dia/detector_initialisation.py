@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from threading import Lock
+from time import time
+
+_logger = getLogger(__name__)
+
+DEFAULT_INITIALISATION_WORKERS = 16
+
+STATE_PENDING = "pending"
+STATE_INITIALISING = "initialising"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class DetectorInitialisation(object):
+    # Initialises the detectors in the background and in parallel, keeping track of the progress of each one.
+
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or DEFAULT_INITIALISATION_WORKERS)
+
+        self._lock = Lock()
+        # {detector: initialisation function}, kept to retry the failed ones.
+        self._initialisations = {}
+        self._progress = {}
+
+    def submit(self, initialisations):
+        # initialisations is a dictionary {detector: function initialising the detector}.
+        with self._lock:
+            for detector, initialise in initialisations.items():
+                self._initialisations[detector] = initialise
+                self._progress[detector] = {"state": STATE_PENDING, "error": None,
+                                            "start_time": None, "duration": None}
+
+        for detector, initialise in initialisations.items():
+            self._executor.submit(self._initialise, detector, initialise)
+
+    def retry_failed(self):
+        with self._lock:
+            failed = {detector: self._initialisations[detector] for detector, progress in self._progress.items()
+                      if progress["state"] == STATE_FAILED}
+
+        _logger.info("Retrying the initialisation of detectors %s.", sorted(failed))
+        self.submit(failed)
+
+        return sorted(failed)
+
+    def remove(self, detector):
+        with self._lock:
+            self._initialisations.pop(detector, None)
+            self._progress.pop(detector, None)
+
+    def _initialise(self, detector, initialise):
+        with self._lock:
+            # Removed before the initialisation started.
+            if self._initialisations.get(detector) is not initialise:
+                return
+
+            self._progress[detector].update(state=STATE_INITIALISING, start_time=time())
+
+        _logger.info("Initialising detector %s.", detector)
+        start_time = time()
+
+        try:
+            initialise()
+            state, error = STATE_READY, None
+            _logger.info("Detector %s initialised in %.1f seconds.", detector, time() - start_time)
+
+        except Exception as e:
+            state, error = STATE_FAILED, str(e)
+            _logger.error("Initialisation of detector %s failed: %s", detector, e)
+
+        with self._lock:
+            if self._initialisations.get(detector) is initialise:
+                self._progress[detector].update(state=state, error=error, duration=time() - start_time)
+
+    def get_not_ready(self):
+        with self._lock:
+            return sorted(detector for detector, progress in self._progress.items()
+                          if progress["state"] != STATE_READY)
+
+    def get_failed(self):
+        # {detector: error} of the failed initialisations.
+        with self._lock:
+            return {detector: progress["error"] for detector, progress in self._progress.items()
+                    if progress["state"] == STATE_FAILED}
+
+    def is_ready(self, detector=None):
+        with self._lock:
+            if detector is not None:
+                return detector not in self._progress or self._progress[detector]["state"] == STATE_READY
+
+            return all(progress["state"] == STATE_READY for progress in self._progress.values())
+
+    def get_status(self):
+        with self._lock:
+            detectors = {detector: dict(progress) for detector, progress in self._progress.items()}
+
+        return {"ready": all(progress["state"] == STATE_READY for progress in detectors.values()),
+                "n_ready": sum(progress["state"] == STATE_READY for progress in detectors.values()),
+                "n_detectors": len(detectors),
+                "detectors": detectors}
@@ -0,0 +1,114 @@
+import json
+import os
+from logging import getLogger
+from threading import Thread, Event, Lock
+
+_logger = getLogger(__name__)
+_audit_logger = getLogger("audit_trail")
+
+AVAILABLE_DETECTORS_FILENAME = "available_detectors.json"
+
+
+class DetectorTopology(object):
+    # Keeps the detectors of the integration manager in sync with available_detectors.json.
+    # Only the added, removed and changed detectors are touched, the others stay up.
+
+    def __init__(self, integration_manager, config_directory, build_pipeline, available_detectors,
+                 watch_interval=None):
+        self.integration_manager = integration_manager
+        self.filename = os.path.join(config_directory, AVAILABLE_DETECTORS_FILENAME)
+        # build_pipeline(detector, settings) returns (pipeline, function initialising the detector or None).
+        self.build_pipeline = build_pipeline
+        # Settings of the detectors currently in the manager, as in available_detectors.json.
+        self.available_detectors = available_detectors
+        self.watch_interval = watch_interval
+
+        self._lock = Lock()
+        self._last_modification = self._get_modification_time()
+
+        self._watcher_stop = Event()
+        self._watcher = None
+
+        if self.watch_interval:
+            self.start_watcher()
+
+    def _get_modification_time(self):
+        try:
+            return os.stat(self.filename).st_mtime
+        except OSError:
+            return None
+
+    def start_watcher(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        _logger.info("Watching %s every %s seconds.", self.filename, self.watch_interval)
+
+        self._watcher_stop.clear()
+        self._watcher = Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._watcher_stop.set()
+
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self):
+        while not self._watcher_stop.wait(self.watch_interval):
+            if self._get_modification_time() == self._last_modification:
+                continue
+
+            # A failed reload (invalid file, acquisition in progress) is retried at the next interval.
+            try:
+                self.reload()
+            except Exception as e:
+                _logger.warning("Cannot reload %s: %s", self.filename, e)
+
+    def get_available_detectors(self):
+        with self._lock:
+            return json.loads(json.dumps(self.available_detectors))
+
+    def reload(self):
+        with self._lock:
+            modification_time = self._get_modification_time()
+
+            with open(self.filename) as input_file:
+                available_detectors = json.load(input_file)
+
+            removed = sorted(set(self.available_detectors) - set(available_detectors))
+            added = sorted(set(available_detectors) - set(self.available_detectors))
+            changed = sorted(detector for detector in set(available_detectors) & set(self.available_detectors)
+                             if available_detectors[detector] != self.available_detectors[detector])
+
+            _audit_logger.info("Reloading %s: added %s, removed %s, changed %s.",
+                               self.filename, added, removed, changed)
+
+            if not (added or removed or changed):
+                self._last_modification = modification_time
+                return {"added": added, "removed": removed, "changed": changed}
+
+            self.integration_manager.check_topology_change()
+
+            # Build the new pipelines first, an invalid entry must not leave the detectors half updated.
+            new_pipelines = {detector: self.build_pipeline(detector, available_detectors[detector])
+                             for detector in added + changed}
+
+            # The per detector config set over the REST API survives the rebuild.
+            for detector in changed:
+                config = self.integration_manager.get_client_configuration(detector)
+                new_pipelines[detector][0].set_config(config["detector"], config["backend"], config["writer"])
+
+            # In a single command, leaving the current detectors untouched if any of the new ones cannot be added.
+            self.integration_manager.change_detectors(removed + changed, new_pipelines)
+
+            for detector in removed:
+                del self.available_detectors[detector]
+
+            for detector in added + changed:
+                self.available_detectors[detector] = available_detectors[detector]
+
+            self._last_modification = modification_time
+
+        return {"added": added, "removed": removed, "changed": changed}
@@ -1,24 +1,113 @@
-from copy import copy
+import re
+from collections import namedtuple
+from copy import copy, deepcopy
 from logging import getLogger
 
-from detector_integration_api.utils import ClientDisableWrapper, check_for_target_status
+from detector_integration_api.utils import ClientDisableWrapper
 
-from sf_dia.validation import IntegrationStatus, validate_writer_config, validate_backend_config, \
-    validate_detector_config, validate_bsread_config, validate_configs_dependencies, interpret_status
+from sf_dia.validation import IntegrationStatus, validate_config, get_config_errors, interpret_status_breakdown, \
+    ConfigValidationError, get_capacity_report, DEFAULT_TIMING_RATE, DEFAULT_CAPACITY_CHECK, CHECK_OFF, \
+    CHECK_REJECT, MEGABYTE, GIGABYTE, get_corrections_files, get_corrections_problems, DEFAULT_CORRECTIONS_CHECK
 
+from sf_dia.acquisition_queue import AcquisitionQueue
+from sf_dia.circuit_breaker import StaleStatus
+from sf_dia.detector_initialisation import DetectorInitialisation
+from sf_dia.metrics_collector import MetricsCollector
 from sf_dia.client.detector_pipeline import DetectorPipeline
+from sf_dia.timing import Timings, timed_command, PHASE_METRIC, CLIENT_METRIC
+from sf_dia.timing_pv import TimingEventPV
+from sf_dia.utils import call_in_parallel, ParallelCallTimeout, ParallelExecutionError, ReadWriteLock, \
+    SingleFlight, DeadlineExceeded, deadline_scope, get_current_deadline, call_with_deadline, prefetch_file
 
-import epics
-
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from threading import Thread, Event, Lock, Condition
+from time import time
 
 _logger = getLogger(__name__)
 _audit_logger = getLogger("audit_trail")
 
 DEFAULT_CAPUT_TIMEOUT = 3
+DEFAULT_STATUS_WORKERS = 16
+DEFAULT_STATUS_TIMEOUT = 5
+DEFAULT_COMMAND_WORKERS = 16
+# Workers of the metrics collector, separate from the status pool so slow statistics never delay the status.
+DEFAULT_METRICS_WORKERS = 4
+
+# Reported in the status details for clients that could not deliver their status.
+STATUS_TIMEOUT = "timeout"
+STATUS_UNREACHABLE = "unreachable"
+# Reported for the detector clients still being initialised, and with the error for the ones that failed.
+STATUS_INITIALISING = "initialising"
+STATUS_INITIALISATION_FAILED = "initialisation failed: %s"
+
+# Time allowed, in seconds, to reach the target status at the end of a command.
+DEFAULT_TRANSITION_TIMEOUT = 10
+# Polling interval while waiting for the target status, doubled after every poll up to the maximum.
+STATUS_WAIT_MIN_INTERVAL = 0.02
+STATUS_WAIT_MAX_INTERVAL = 0.5
+
+# Appended to the output files of re-armed runs.
+RUN_SUFFIX_FORMAT = "_run%04d"
+RUN_SUFFIX_PATTERN = re.compile(r"^(.*)_run(\d{4})$")
+
+# Maximum age, in seconds, of the status served to readers when the background poller is running.
+DEFAULT_STATUS_MAX_AGE = 1
+
+StatusSnapshot = namedtuple("StatusSnapshot", ["version", "timestamp", "details", "status", "breakdown"])
+
+# Validated config with the derived per-detector configs {detector: (detector, backend, writer)} and bsread config.
+PreparedConfig = namedtuple("PreparedConfig", ["writer", "backend", "detector", "bsread",
+                                               "detector_configs", "bsread_config"])
+
+
+def exclusive_command(command):
+    # Decorator for the IntegrationManager methods changing the state: only one runs at a time.
+    # The others wait up to command_queue_timeout seconds (forever if None) before being rejected,
+    # and never past the deadline of the command.
+    def decorator(method):
+        @wraps(method)
+        def exclusive_method(self, *args, **kwargs):
+            timeout = self.command_queue_timeout
+            deadline = get_current_deadline()
+            if deadline is not None:
+                timeout = max(deadline.remaining() if timeout is None else min(timeout, deadline.remaining()), 0)
+
+            if not self._command_lock.acquire_write(timeout=timeout):
+                # Other commands waiting for the lock hold it up as well, without being in progress.
+                command_in_progress = self._command_in_progress
+
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(deadline.timeout, operation="waiting for %s to complete" %
+                                           (command_in_progress or "the command lock"))
+
+                if command_in_progress is None:
+                    raise ValueError("Cannot %s, timed out waiting for the command lock after %s seconds. "
+                                     "Try again later." % (command, timeout))
+
+                raise ValueError("Cannot %s, %s is in progress. Try again later." % (command, command_in_progress))
+
+            outer_command = self._command_in_progress
+            if outer_command is None:
+                self._command_in_progress = command
+
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._command_in_progress = outer_command
+                self._command_lock.release_write()
+
+        return exclusive_method
+
+    return decorator
+
 
 class IntegrationManager(object):
-    def __init__(self, enabled_detectors, bsread_client, timing_pv, timing_start_code, timing_stop_code, caput_timeout=None):
+    def __init__(self, enabled_detectors, bsread_client, timing_pv, timing_start_code, timing_stop_code, caput_timeout=None,
+                 status_workers=None, status_timeout=None, status_poll_interval=None, status_max_age=None,
+                 command_workers=None, transition_timeout=None, metrics_interval=None, metrics_history=None,
+                 async_timing_trigger=False, command_queue_timeout=None, timing_rate=None, writer_bandwidth=None,
+                 disk_bandwidth=None, capacity_check=None, corrections_check=None, prefetch_corrections=False):
 
         self.timing_pv         = timing_pv
         self.timing_start_code = timing_start_code
@@ -27,15 +116,56 @@ class IntegrationManager(object):
             self.caput_timeout = DEFAULT_CAPUT_TIMEOUT
         else:
             self.caput_timeout = caput_timeout
+        # Without waiting for the event puts, the stop event is sent while the clients are reset,
+        # and the start event completion refreshes the status the command is waiting for.
+        self.async_timing_trigger = async_timing_trigger
+
+        if status_timeout is None:
+            self.status_timeout = DEFAULT_STATUS_TIMEOUT
+        else:
+            self.status_timeout = status_timeout
+
+        if transition_timeout is None:
+            self.transition_timeout = DEFAULT_TRANSITION_TIMEOUT
+        else:
+            self.transition_timeout = transition_timeout
+
+        # Expected data rate and file size of a config, checked against the bandwidths (bytes/s) and free space.
+        self.timing_rate = timing_rate or DEFAULT_TIMING_RATE
+        self.writer_bandwidth = writer_bandwidth
+        self.disk_bandwidth = disk_bandwidth
+        self.capacity_check = capacity_check or DEFAULT_CAPACITY_CHECK
+        self._last_capacity_report = None
+
+        # Pedestal and gain files are checked before configuring the backends, and optionally read ahead.
+        self.corrections_check = corrections_check or DEFAULT_CORRECTIONS_CHECK
+        self.prefetch_corrections = prefetch_corrections
+
+        # Bounded pool used to query the clients in parallel.
+        self._executor = ThreadPoolExecutor(max_workers=status_workers or DEFAULT_STATUS_WORKERS)
+        # Separate pool for the commands, so they never wait behind status requests.
+        self._command_executor = ThreadPoolExecutor(max_workers=command_workers or DEFAULT_COMMAND_WORKERS)
+        # Status calls that timed out and are still running, not submitted again until they finish.
+        self._status_calls_in_flight = {}
+
+        # Commands hold the write lock. Status and metrics readers only probe it, without blocking: they get the
+        # cached values while a command is in progress, and never hold it while querying the clients.
+        self._command_lock = ReadWriteLock()
+        self._command_in_progress = None
+        self.command_queue_timeout = command_queue_timeout
+        self._last_metrics = None
+
+        # Concurrent status and metrics readers share the same request to the clients.
+        self._single_flight = SingleFlight()
+
+        # Duration histograms of the commands, their phases and every client call.
+        self.timings = Timings()
+
+        self.timing_event_pv = TimingEventPV(timing_pv, self.caput_timeout, put_callback=self._timing_event_completed)
 
         self.enabled_detectors = {}
         for detector in enabled_detectors.keys():
-             backend_client  = enabled_detectors[detector].backend_client
-             writer_client   = enabled_detectors[detector].writer_client
-             detector_client = enabled_detectors[detector].detector_client
-             self.enabled_detectors[detector] = DetectorPipeline(ClientDisableWrapper(detector_client, True, "detector"), 
-                                                                 ClientDisableWrapper(backend_client,  True, "backend"),
-                                                                 ClientDisableWrapper(writer_client,   True, "writer"))
+            self.enabled_detectors[detector] = self._wrap_pipeline(detector, enabled_detectors[detector])
         self.bsread_client = ClientDisableWrapper(bsread_client, True, "bsread writer")
 
         self._last_set_backend_config = {}
@@ -45,33 +175,361 @@ class IntegrationManager(object):
 
         self.last_config_successful = False
 
+        # Configs as last sent to the clients, used to skip the unchanged ones when reconfiguring.
+        self._applied_configs = {}
+        self._applied_bsread_config = None
+
+        self._run_number = 0
+        self._run_output_files = (None, None)
+
+        self.acquisition_queue = AcquisitionQueue(self)
+
+        # Commands configuring or starting the detectors are accepted only once they are all initialised.
+        self.detector_initialisation = DetectorInitialisation()
+
+        if status_max_age is None:
+            self.status_max_age = DEFAULT_STATUS_MAX_AGE
+        else:
+            self.status_max_age = status_max_age
+
+        self._status_lock = Lock()
+        # Notified every time a new status snapshot is stored.
+        self._status_condition = Condition(self._status_lock)
+        self._status_snapshot = None
+        self._status_version = 0
+
+        self.status_poll_interval = status_poll_interval
+        self._status_poller_stop = Event()
+        self._status_poller = None
+
+        if self.status_poll_interval:
+            self.start_status_poller()
+
+        # Time series of the writer, backend and bsread statistics, sampled in the background.
+        self.metrics_collector = MetricsCollector(self, ThreadPoolExecutor(max_workers=DEFAULT_METRICS_WORKERS),
+                                                  metrics_interval, metrics_history)
+
+        if metrics_interval:
+            self.metrics_collector.start()
+
+    def start_status_poller(self):
+        if self._status_poller is not None and self._status_poller.is_alive():
+            return
+
+        _logger.info("Starting status poller with interval %s seconds.", self.status_poll_interval)
+
+        self._status_poller_stop.clear()
+        self._status_poller = Thread(target=self._poll_status, daemon=True)
+        self._status_poller.start()
+
+    def stop_status_poller(self):
+        self._status_poller_stop.set()
+
+        if self._status_poller is not None:
+            self._status_poller.join()
+            self._status_poller = None
+
+    def _poll_status(self):
+        while True:
+            try:
+                self.refresh_status()
+            except Exception as e:
+                _logger.warning("Status poller could not refresh the status: %s", e)
+
+            if self._status_poller_stop.wait(self.status_poll_interval):
+                return
+
+    def refresh_status(self):
+        # The version and timestamp are taken when the refresh starts, so a slow refresh never replaces the
+        # snapshot of a refresh started after it.
+        with self._status_lock:
+            self._status_version += 1
+            version = self._status_version
+            start_time = time()
+
+        with self.timings.measure(PHASE_METRIC, phase="status_refresh"):
+            details = self._collect_status_details()
+        # The last known status of a client behind an open circuit breaker is only reported: the client cannot be
+        # reached, the status is interpreted as such.
+        status, breakdown = interpret_status_breakdown(self._without_stale_statuses(details))
+
+        # There is no way of knowing if the detector is configured as the user desired.
+        # We have a flag to check if the user config was passed on to the detector.
+        if status == IntegrationStatus.CONFIGURED and self.last_config_successful is False:
+            status = IntegrationStatus.ERROR
+            breakdown["status"] = str(status)
+            breakdown["last_config_successful"] = False
+
+        # Clients behind an open circuit breaker report their last known status. The details list them as well,
+        # the stale marker of their statuses does not survive serialization.
+        stale_statuses = self._get_stale_statuses(details)
+        if stale_statuses:
+            breakdown["stale"] = stale_statuses
+            details["stale_statuses"] = stale_statuses
+
+        with self._status_lock:
+            if self._status_snapshot is not None and self._status_snapshot.version > version:
+                return self._status_snapshot
+
+            self._status_snapshot = StatusSnapshot(version, start_time, details, status, breakdown)
+            self._status_condition.notify_all()
+
+            return self._status_snapshot
+
+    @staticmethod
+    def _without_stale_statuses(details):
+        return {name: STATUS_UNREACHABLE if isinstance(value, StaleStatus) else
+                {client_name: STATUS_UNREACHABLE if isinstance(client_status, StaleStatus) else client_status
+                 for client_name, client_status in value.items()} if isinstance(value, dict) else value
+                for name, value in details.items()}
+
+    @staticmethod
+    def _get_stale_statuses(details):
+        # {"bsread" or "<detector> <client>": timestamp of the last known status}
+        stale_statuses = {}
+
+        for name, value in details.items():
+            if isinstance(value, StaleStatus):
+                stale_statuses[name] = value.timestamp
+
+            elif isinstance(value, dict):
+                for client_name, client_status in value.items():
+                    if isinstance(client_status, StaleStatus):
+                        stale_statuses["%s %s" % (name, client_name)] = client_status.timestamp
+
+        return stale_statuses
+
+    def get_status_snapshot(self, max_age=None):
+        if max_age is None:
+            max_age = self.status_max_age
+
+        # Without the poller every read goes to the clients, as before.
+        snapshot = self._status_snapshot
+        if self._status_poller is not None and snapshot is not None and time() - snapshot.timestamp <= max_age:
+            return snapshot
+
+        # The command in progress refreshes the snapshot itself while waiting for its target status.
+        if snapshot is not None and self._is_command_in_progress():
+            return snapshot
+
+        # Commands do not go through here: they must see the status after their own actions, not the result of
+        # a refresh started before. The refresh holds no lock, a command starting meanwhile does not wait for it.
+        return self._single_flight.call("status", self.refresh_status)
+
+    def _is_command_in_progress(self):
+        # Only probes the command lock, readers never hold it while querying the clients.
+        if not self._command_lock.acquire_read(blocking=False):
+            return True
+
+        self._command_lock.release_read()
+        return False
+
+    def wait_for_status(self, desired_status, timeout=None):
+        with self.timings.measure(PHASE_METRIC, phase="wait_for_status"):
+            return self._wait_for_status(desired_status, timeout)
+
+    def wait_for_acquisition_end(self, timeout=None):
+        # Wait for FINISHED while the acquisition is in progress (forever without timeout), and fail as soon as
+        # it ends in any other status.
+        with self.timings.measure(PHASE_METRIC, phase="wait_for_acquisition_end"):
+            return self._wait_for_status(IntegrationStatus.FINISHED, float("inf") if timeout is None else timeout,
+                                         while_status=(IntegrationStatus.RUNNING,
+                                                       IntegrationStatus.DETECTOR_STOPPED,
+                                                       IntegrationStatus.BSREAD_STILL_RUNNING))
+
+    def _wait_for_status(self, desired_status, timeout, while_status=None):
+        # With while_status, the wait fails as soon as the status is neither desired nor one of them.
+        if not isinstance(desired_status, (tuple, list)):
+            desired_status = (desired_status,)
+
+        deadline = time() + (self.transition_timeout if timeout is None else timeout)
+        interval = STATUS_WAIT_MIN_INTERVAL
+
+        command_deadline = get_current_deadline()
+        if command_deadline is not None:
+            deadline = min(deadline, command_deadline.expiry)
+
+        snapshot = self.refresh_status()
+
+        while snapshot.status not in desired_status:
+            remaining = deadline - time()
+
+            if while_status is not None and snapshot.status not in while_status:
+                raise ValueError("Cannot reach desired status '%s', the status changed to '%s'." %
+                                 (desired_status, snapshot.status))
+
+            if remaining <= 0:
+                if command_deadline is not None and command_deadline.expired():
+                    raise DeadlineExceeded(command_deadline.timeout,
+                                           operation="waiting for status %s, current status %s" %
+                                                     ("/".join(str(x) for x in desired_status), snapshot.status))
+
+                _logger.error("Trying to reach one of the status '%s', but got '%s'.", desired_status, snapshot.status)
+
+                # A late timing event is the likely cause, but it does not fail the command by itself.
+                timing_error = self.timing_event_pv.get_put_error()
+                raise ValueError("Cannot reach desired status '%s'. Current status '%s'. "
+                                 "Try to reset or get_status_details for more info.%s" %
+                                 (desired_status, snapshot.status, " " + timing_error if timing_error else ""))
+
+            # Any refresh landing in the meantime (poller, other readers) wakes us up before the interval expires.
+            with self._status_condition:
+                self._status_condition.wait_for(lambda: self._status_snapshot.version != snapshot.version,
+                                                timeout=min(interval, remaining))
+                newer_snapshot = self._status_snapshot
+
+            if newer_snapshot.version != snapshot.version:
+                snapshot = newer_snapshot
+            else:
+                # Poll fast right after the command, then back off.
+                snapshot = self.refresh_status()
+                interval = min(interval * 2, STATUS_WAIT_MAX_INTERVAL)
+
+        return snapshot.status
+
+    def _wrap_pipeline(self, detector, pipeline):
+        return DetectorPipeline(ClientDisableWrapper(pipeline.detector_client, True, "detector"),
+                                ClientDisableWrapper(pipeline.backend_client,  True, "backend"),
+                                ClientDisableWrapper(pipeline.writer_client,   True, "writer"),
+                                reset_steps=pipeline.reset_steps,
+                                kill_steps=pipeline.kill_steps,
+                                name=detector, timings=self.timings, n_modules=pipeline.n_modules)
+
+    def check_topology_change(self):
+        status = self.get_acquisition_status()
+
+        if status not in (IntegrationStatus.INITIALIZED, IntegrationStatus.ERROR):
+            raise ValueError("Cannot change detectors in %s state. Please reset first." % status)
+
+    @exclusive_command("change detectors")
+    def change_detectors(self, removed, added):
+        # removed is a list of detectors, added a dictionary {detector: (pipeline, function initialising it or None)}.
+        # A detector in both is replaced. All or nothing: the new pipelines are built before any detector is removed,
+        # a detector that cannot be added leaves the current ones untouched. Returns the removed pipelines.
+        self.check_topology_change()
+
+        unknown = sorted(set(removed) - set(self.enabled_detectors))
+        if unknown:
+            raise ValueError("Cannot remove detectors %s, they are not enabled." % unknown)
+
+        wrapped_pipelines = {detector: self._build_pipeline(detector, pipeline)
+                             for detector, (pipeline, _) in added.items()}
+
+        removed_pipelines = {detector: self._remove_detector(detector) for detector in removed}
+
+        for detector in sorted(added):
+            self._add_detector(detector, wrapped_pipelines[detector], added[detector][1])
+
+        return removed_pipelines
+
+    @exclusive_command("add detector")
+    def add_detector(self, detector, pipeline, initialise=None):
+        self.check_topology_change()
+        self._add_detector(detector, self._build_pipeline(detector, pipeline), initialise)
+
+    def _build_pipeline(self, detector, pipeline):
+        # The pipeline clients get the enabled state of the other detectors.
+        wrapped_pipeline = self._wrap_pipeline(detector, pipeline)
+        wrapped_pipeline.set_config(*pipeline.get_config())
+
+        if self.enabled_detectors:
+            enabled = self.get_clients_enabled()[sorted(self.enabled_detectors)[0]]
+            for client_name in DetectorPipeline.CLIENT_NAMES:
+                wrapped_pipeline.get_client(client_name).set_client_enabled(enabled[client_name])
+
+        return wrapped_pipeline
+
+    def _add_detector(self, detector, wrapped_pipeline, initialise=None):
+        _audit_logger.info("Adding detector %s.", detector)
+
+        # Replace the dictionary instead of modifying it, the status poller may be iterating over it.
+        enabled_detectors = dict(self.enabled_detectors)
+        enabled_detectors[detector] = wrapped_pipeline
+        self.enabled_detectors = enabled_detectors
+
+        # The config of the other detectors stays valid, but must now be set for all of them.
+        self._applied_configs = {}
+
+        if initialise is not None:
+            self.initialise_detectors({detector: initialise})
+
+    @exclusive_command("remove detector")
+    def remove_detector(self, detector):
+        self.check_topology_change()
+        return self._remove_detector(detector)
+
+    def _remove_detector(self, detector):
+        _audit_logger.info("Removing detector %s.", detector)
+
+        enabled_detectors = dict(self.enabled_detectors)
+        pipeline = enabled_detectors.pop(detector)
+        self.enabled_detectors = enabled_detectors
+
+        self.detector_initialisation.remove(detector)
+        self._applied_configs = {}
+
+        # Kills the writer process and brings the backend back to INITIALIZED.
+        try:
+            pipeline.kill()
+        except Exception as e:
+            _logger.warning("Kill of removed detector %s failed: %s", detector, e)
+
+        return pipeline
+
+    def initialise_detectors(self, initialisations):
+        # initialisations is a dictionary {detector: function initialising the detector}, run in the background.
+        _audit_logger.info("Initialising detectors %s.", sorted(initialisations))
+        self.detector_initialisation.submit(initialisations)
+
+    def retry_detectors_initialisation(self):
+        return self.detector_initialisation.retry_failed()
+
+    def get_readiness(self):
+        return self.detector_initialisation.get_status()
+
+    def _check_detectors_ready(self, command):
+        failed = self.detector_initialisation.get_failed()
+
+        if failed:
+            raise ValueError("Cannot %s, the initialisation of detectors %s failed. Retry the initialisation or "
+                             "check the readiness for more info." % (command, sorted(failed)))
+
+        not_ready = self.detector_initialisation.get_not_ready()
+
+        if not_ready:
+            raise ValueError("Cannot %s, detectors %s are not initialised. Check the readiness for more info." %
+                             (command, not_ready))
+
+    @exclusive_command("start")
+    @timed_command("start")
     def start_acquisition(self, parameters):
         _audit_logger.info("Starting acquisition.")
+        self._check_detectors_ready("start acquisition")
 
         status = self.get_acquisition_status()
         if status != IntegrationStatus.CONFIGURED:
             raise ValueError("Cannot start acquisition in %s state. Please configure first." % status)
 
-        _audit_logger.info("bsread_client.start()")
-        self.bsread_client.start()
-
-        _audit_logger.info("detector_pipeline.start()")
-        for detector in  self.enabled_detectors.keys():
-            self.enabled_detectors[detector].start()
+        _audit_logger.info("bsread_client.start() and detector_pipeline.start()")
+        self._run_phases(DetectorPipeline.START_PHASES, first_phase_calls={"bsread": self._timed_bsread("start")})
 
         if parameters is None or parameters.get("trigger_start", True):
             _logger.debug("Executing start command: caput %s %d", self.timing_pv, self.timing_start_code)
-            epics.caput(self.timing_pv, self.timing_start_code, wait=True, timeout=self.caput_timeout)
+            self._put_timing_event(self.timing_start_code)
         else:
             _logger.debug("DIA prepared fully to collect data from detector, "
                           "but trigger to start detector will come from outside")
 
-        return check_for_target_status(self.get_acquisition_status,
-                                       (IntegrationStatus.RUNNING,
-                                        IntegrationStatus.DETECTOR_STOPPED,
-                                        IntegrationStatus.BSREAD_STILL_RUNNING,
-                                        IntegrationStatus.FINISHED))
+        status = self.wait_for_status((IntegrationStatus.RUNNING,
+                                       IntegrationStatus.DETECTOR_STOPPED,
+                                       IntegrationStatus.BSREAD_STILL_RUNNING,
+                                       IntegrationStatus.FINISHED))
+        self._wait_for_timing_event()
+
+        return status
 
+    @exclusive_command("stop")
+    @timed_command("stop")
     def stop_acquisition(self):
         _audit_logger.info("Stopping acquisition.")
 
@@ -80,53 +538,78 @@ class IntegrationManager(object):
             raise ValueError("Cannot stop acquisition in %s state. Please wait for backend to finish." % status)
 
         _logger.debug("Executing stop command: caput %s %d", self.timing_pv, self.timing_stop_code)
-        epics.caput(self.timing_pv, self.timing_stop_code, wait=True, timeout=self.caput_timeout)
+        self._put_timing_event(self.timing_stop_code)
  
-        _audit_logger.info("detector_pipeline .stop()")
-        for detector in self.enabled_detectors.keys():
-            self.enabled_detectors[detector].stop()
-
-        _audit_logger.info("bsread_client.stop()")
-        self.bsread_client.stop()
+        _audit_logger.info("detector_pipeline.stop() and bsread_client.stop()")
+        self._run_phases(DetectorPipeline.STOP_PHASES, last_phase_calls={"bsread": self._timed_bsread("stop")})
+        self._wait_for_timing_event()
 
         return self.reset()
 
     def get_acquisition_status(self):
-        status = interpret_status(self.get_status_details())
+        # Used by the state changing commands - always read the current status.
+        status = self.refresh_status().status
         _audit_logger.info("Got_acquisition_status : %s", status)
-        # There is no way of knowing if the detector is configured as the user desired.
-        # We have a flag to check if the user config was passed on to the detector.
-        if status == IntegrationStatus.CONFIGURED and self.last_config_successful is False:
-            return IntegrationStatus.ERROR
 
         return status
 
     def get_acquisition_status_string(self):
-        return str(self.get_acquisition_status())
+        return str(self.get_status_snapshot().status)
 
     def get_status_details(self):
+        # Always return a copy - we do not want the snapshot to be updated.
+        return deepcopy(self.get_status_snapshot().details)
+
+    def get_status_breakdown(self):
+        # Always return a copy - we do not want the snapshot to be updated.
+        return deepcopy(self.get_status_snapshot().breakdown)
+
+    def _collect_status_details(self):
         #_audit_logger.info("Getting status details.")
 
         status = {} 
+        calls = {}
+        failed_initialisations = self.detector_initialisation.get_failed()
 
         for detector in self.enabled_detectors.keys():
             detector_client, backend_client, writer_client = self.enabled_detectors[detector].return_clients()
-   
-            writer_status = writer_client.get_status() \
-                if writer_client.is_client_enabled() else ClientDisableWrapper.STATUS_DISABLED
-
-            backend_status = backend_client.get_status() \
-                if backend_client.is_client_enabled() else ClientDisableWrapper.STATUS_DISABLED
+            status[detector] = {}
+
+            for client_name, client in (("detector", detector_client),
+                                        ("backend", backend_client),
+                                        ("writer", writer_client)):
+                if client_name == "detector" and detector in failed_initialisations:
+                    status[detector][client_name] = STATUS_INITIALISATION_FAILED % failed_initialisations[detector]
+                elif client_name == "detector" and not self.detector_initialisation.is_ready(detector):
+                    status[detector][client_name] = STATUS_INITIALISING
+                elif client.is_client_enabled():
+                    calls[(detector, client_name)] = self.timings.wrap(client.get_status, CLIENT_METRIC,
+                                                                       detector=detector, client=client_name,
+                                                                       operation="get_status")
+                else:
+                    status[detector][client_name] = ClientDisableWrapper.STATUS_DISABLED
+
+        if self.bsread_client.is_client_enabled():
+            calls[("bsread", None)] = self._timed_bsread("get_status")
+        else:
+            status["bsread"] = ClientDisableWrapper.STATUS_DISABLED
 
-            detector_status = detector_client.get_status() \
-                if detector_client.is_client_enabled() else ClientDisableWrapper.STATUS_DISABLED
+        # Bounded by the status timeout only, the status of a command over budget is still needed to report it.
+        with deadline_scope(None):
+            results, errors = call_in_parallel(self._executor, calls, timeout=self.status_timeout,
+                                               in_flight=self._status_calls_in_flight)
 
-            status[detector] = {"detector": detector_status, "backend": backend_status, "writer": writer_status}
+        for (detector, client_name), error in errors.items():
+            _logger.warning("Cannot get %s status for %s: %s", client_name or "bsread", detector, error)
 
-        bsread_status = self.bsread_client.get_status() \
-            if self.bsread_client.is_client_enabled() else ClientDisableWrapper.STATUS_DISABLED
+            results[(detector, client_name)] = STATUS_TIMEOUT if isinstance(error, ParallelCallTimeout) \
+                else STATUS_UNREACHABLE
 
-        status["bsread"] = bsread_status
+        for (detector, client_name), client_status in results.items():
+            if detector == "bsread":
+                status["bsread"] = client_status
+            else:
+                status[detector][client_name] = client_status
 
         return status
 
@@ -137,109 +620,353 @@ class IntegrationManager(object):
                 "detector": copy(self._last_set_detector_config),
                 "bsread": copy(self._last_set_bsread_config)}
 
+    @exclusive_command("configure")
     def set_acquisition_config(self, new_config):
-        if {"writer", "backend", "detector", "bsread"} != set(new_config):
-            raise ValueError("Specify config JSON with 4 root elements: 'writer', 'backend', 'detector', 'bsread'.")
+        with self.timings.measure(PHASE_METRIC, phase="prepare_config"):
+            prepared_config = self.prepare_acquisition_config(new_config)
+
+        return self.set_prepared_acquisition_config(prepared_config)
+
+    def _get_validated_sections(self):
+        # Config sections of the enabled clients, with the per detector overrides {detector: {section: parameters}}.
+        sections = set()
+        detector_overrides = {}
+
+        for detector, pipeline in self.enabled_detectors.items():
+            for client_name in DetectorPipeline.CLIENT_NAMES:
+                if pipeline.get_client(client_name).client_enabled:
+                    sections.add(client_name)
+
+            detector_overrides[detector] = dict(zip(DetectorPipeline.CLIENT_NAMES, pipeline.get_config()))
+
+        if self.bsread_client.client_enabled:
+            sections.add("bsread")
+
+        return sections, detector_overrides
+
+    def validate_acquisition_config(self, new_config):
+        # Dry run of the validation, without touching the clients: {"valid", "errors", "warnings", "capacity"}.
+        errors = get_config_errors(new_config, *self._get_validated_sections())
+        warnings = []
+        capacity_report = None
+
+        if not errors:
+            detector_configs = self._get_all_detector_configs(new_config)
+
+            if self.capacity_check != CHECK_OFF:
+                capacity_report = self._get_capacity_report(detector_configs)
+                (errors if self.capacity_check == CHECK_REJECT else warnings).extend(capacity_report["problems"])
+
+            if self.corrections_check != CHECK_OFF:
+                (errors if self.corrections_check == CHECK_REJECT else warnings).extend(
+                    self._get_corrections_problems(detector_configs))
+
+        return {"valid": not errors,
+                "errors": errors,
+                "warnings": warnings,
+                "capacity": capacity_report}
+
+    def prepare_acquisition_config(self, new_config, preflight=True):
+        # Validate the config and derive the per-detector configs, without touching the clients.
+        # Without preflight, the capacity and corrections checks and the prefetch are skipped.
+        # Before setting the new config, validate the provided values. All must be valid.
+        validate_config(new_config, *self._get_validated_sections())
 
         writer_config = new_config["writer"]
         backend_config = new_config["backend"]
         detector_config = new_config["detector"]
         bsread_config = new_config["bsread"]
 
-        status = self.get_acquisition_status()
+        detector_configs = self._get_all_detector_configs(new_config)
 
-        self.last_config_successful = False
+        # Better to know before the run than from the frames dropped halfway through it.
+        if preflight and self.capacity_check != CHECK_OFF:
+            self._check_capacity(detector_configs)
+
+        # A missing or cold corrections file would only show up as a slow or failing backend configure.
+        if preflight and self.corrections_check != CHECK_OFF:
+            self._check_corrections(detector_configs)
+
+        if preflight and self.prefetch_corrections:
+            self._prefetch_corrections(detector_configs)
+
+        return PreparedConfig(writer_config, backend_config, detector_config, bsread_config,
+                              detector_configs, self._get_bsread_config(bsread_config))
+
+    @exclusive_command("configure")
+    @timed_command("configure")
+    def set_prepared_acquisition_config(self, prepared_config):
+        self._check_detectors_ready("set config")
+
+        status = self.get_acquisition_status()
 
         if status not in (IntegrationStatus.INITIALIZED, IntegrationStatus.CONFIGURED):
             raise ValueError("Cannot set config in %s state. Please reset first." % status)
 
+        # When the applied configs are known, only the clients with a changed config are reset and reconfigured.
+        reconfigure = status == IntegrationStatus.CONFIGURED and bool(self._applied_configs)
+
         # The backend is configurable only in the INITIALIZED state.
-        if status == IntegrationStatus.CONFIGURED:
+        if status == IntegrationStatus.CONFIGURED and not reconfigure:
             _logger.debug("Integration status is %s. Resetting before applying config.", status)
             self.reset()
 
+        self._apply_configs(prepared_config, reconfigure)
+        self._set_run_output_files(prepared_config)
+
+        return self.wait_for_status(IntegrationStatus.CONFIGURED)
+
+    def _set_run_output_files(self, prepared_config):
+        # Re-armed runs get a numbered suffix on top of the output files of the config. A config read back from a
+        # re-armed run already has one: it is replaced, and the numbering continues after it.
+        output_files = (prepared_config.writer["output_file"], prepared_config.bsread["output_file"])
+        run_numbers = [0]
+
+        self._run_output_files = []
+        for output_file in output_files:
+            match = RUN_SUFFIX_PATTERN.match(output_file)
+            if match:
+                output_file = match.group(1)
+                run_numbers.append(int(match.group(2)))
+
+            self._run_output_files.append(output_file)
+
+        self._run_output_files = tuple(self._run_output_files)
+        self._run_number = max(run_numbers)
+
+    def _apply_configs(self, prepared_config, reconfigure=False, reapply=()):
+        # With reconfigure, only the clients with a changed config and the ones in reapply are applied.
+        if set(prepared_config.detector_configs) != set(self.enabled_detectors):
+            raise ValueError("Config prepared for detectors %s, but enabled detectors are %s. Please set config again."
+                             % (sorted(prepared_config.detector_configs), sorted(self.enabled_detectors)))
+
         _audit_logger.info("Set acquisition configuration:\n"
                            "Writer config: %s\n"
                            "Backend config: %s\n"
                            "Detector config: %s\n"
                            "Bsread config: %s\n",
-                           writer_config, backend_config, detector_config, bsread_config)
+                           prepared_config.writer, prepared_config.backend, prepared_config.detector,
+                           prepared_config.bsread)
 
-        # Before setting the new config, validate the provided values. All must be valid.
-        for detector in self.enabled_detectors.keys():
-            _audit_logger.info("Detector : %s", detector)
-            detector_client, backend_client, writer_client = self.enabled_detectors[detector].return_clients()
+        calls = {}
 
-            if writer_client.client_enabled:
-                validate_writer_config(writer_config)
+        for detector, configs in prepared_config.detector_configs.items():
+            changed_clients = DetectorPipeline.CLIENT_NAMES
+            if reconfigure:
+                last_configs = self._applied_configs.get(detector, (None, None, None))
+                changed_clients = [client_name for client_name, config, last_config
+                                   in zip(DetectorPipeline.CLIENT_NAMES, configs, last_configs)
+                                   if config != last_config or client_name in reapply]
 
-            if backend_client.client_enabled:
-                validate_backend_config(backend_config)
+                _audit_logger.info("Detector %s changed clients: %s", detector, changed_clients)
 
-            if detector_client.client_enabled:
-                validate_detector_config(detector_config)
+            if changed_clients:
+                calls[detector] = partial(self.enabled_detectors[detector].apply_config, *configs,
+                                          clients=changed_clients, reset=reconfigure)
 
-        if self.bsread_client.client_enabled:
-            validate_bsread_config(bsread_config)
+        if not reconfigure or "bsread" in reapply or prepared_config.bsread_config != self._applied_bsread_config:
+            _audit_logger.info("bsread_client.set_parameters(bsread_config)")
+            calls["bsread"] = partial(self._apply_bsread_config, prepared_config.bsread_config, reset=reconfigure)
 
-        validate_configs_dependencies(writer_config, backend_config, detector_config, bsread_config)
+        self.last_config_successful = False
 
-        for detector in self.enabled_detectors.keys():
-            _audit_logger.info("Detector : %s", detector)
-            detector_client, backend_client, writer_client = self.enabled_detectors[detector].return_clients()
+        _audit_logger.info("detector_pipeline.apply_config() on %d detectors.", len(calls) - ("bsread" in calls))
+        with self.timings.measure(PHASE_METRIC, phase="apply_config"):
+            _, errors = call_in_parallel(self._command_executor, calls)
+
+        if errors:
+            # Do not leave part of the detectors configured.
+            _logger.warning("Configuration failed for %s. Resetting all clients.", sorted(errors))
+
+            # Even past the deadline of the command.
+            with deadline_scope(None):
+                self._reset_clients()
+
+            raise ParallelExecutionError("Cannot set acquisition config.", errors)
+
+        self._last_set_backend_config = prepared_config.backend
+        self._last_set_writer_config = prepared_config.writer
+        self._last_set_detector_config = prepared_config.detector
+        self._last_set_bsread_config = prepared_config.bsread
+
+        self._applied_configs = copy(prepared_config.detector_configs)
+        self._applied_bsread_config = prepared_config.bsread_config
+
+        self.last_config_successful = True
+
+    @exclusive_command("rearm")
+    @timed_command("rearm")
+    def rearm_acquisition(self, prepared_config=None):
+        # Without a prepared config, the last config is used again with a new run suffix on the output files.
+        _audit_logger.info("Re-arming acquisition.")
+        self._check_detectors_ready("re-arm acquisition")
+
+        status = self.get_acquisition_status()
+        if status != IntegrationStatus.FINISHED:
+            raise ValueError("Cannot re-arm acquisition in %s state. Please wait for the acquisition to finish." % status)
+
+        if not self._applied_configs:
+            raise ValueError("Cannot re-arm acquisition, the applied config is not known. Please set config.")
+
+        # With a new prepared config, the run numbering starts again from its output files.
+        run_number = None
+        if prepared_config is None:
+            writer_config = copy(self._last_set_writer_config)
+            bsread_config = copy(self._last_set_bsread_config)
+
+            run_number = self._run_number + 1
+            for config, output_file in zip((writer_config, bsread_config), self._run_output_files):
+                if output_file != "/dev/null":
+                    config["output_file"] = output_file + RUN_SUFFIX_FORMAT % run_number
+
+            _audit_logger.info("Run %d output file %s", run_number, writer_config["output_file"])
+
+            # Only the output files differ from the checked config, the preflight checks still hold.
+            prepared_config = self.prepare_acquisition_config({"writer": writer_config,
+                                                               "backend": self._last_set_backend_config,
+                                                               "detector": self._last_set_detector_config,
+                                                               "bsread": bsread_config}, preflight=False)
+
+        _logger.debug("Executing stop command: caput %s %d", self.timing_pv, self.timing_stop_code)
+        self._put_timing_event(self.timing_stop_code)
+
+        # Closing the backend brings it back to CONFIGURED, with its config untouched.
+        _audit_logger.info("detector_pipeline.stop() and bsread_client.stop()")
+        self._run_phases(DetectorPipeline.STOP_PHASES, last_phase_calls={"bsread": self._timed_bsread("stop")})
+        self._wait_for_timing_event()
+
+        # The writers and bsread were stopped and are always configured again, even with the same config.
+        # Of the other clients, only the ones with a changed config are restarted.
+        self._apply_configs(prepared_config, reconfigure=True, reapply=("writer", "bsread"))
+
+        if run_number is None:
+            self._set_run_output_files(prepared_config)
+        else:
+            self._run_number = run_number
+
+        return self.wait_for_status(IntegrationStatus.CONFIGURED)
+
+    def submit_acquisition_queue(self, configs, parameters=None):
+        self._check_detectors_ready("submit acquisition queue")
+
+        return self.acquisition_queue.submit(configs, parameters)
+
+    def cancel_acquisition_queue(self):
+        return self.acquisition_queue.cancel()
+
+    def get_acquisition_queue_status(self):
+        return self.acquisition_queue.get_status()
+
+    def _get_all_detector_configs(self, new_config):
+        return {detector: self._get_detector_configs(detector, new_config["writer"], new_config["backend"],
+                                                     new_config["detector"])
+                for detector in self.enabled_detectors.keys()}
+
+    def _get_capacity_report(self, detector_configs):
+        n_modules = {detector: pipeline.n_modules for detector, pipeline in self.enabled_detectors.items()}
+
+        return get_capacity_report(detector_configs, n_modules, self.timing_rate,
+                                   self.writer_bandwidth, self.disk_bandwidth)
+
+    def _check_capacity(self, detector_configs):
+        capacity_report = self._get_capacity_report(detector_configs)
+        self._last_capacity_report = capacity_report
+
+        _audit_logger.info("Expected data rate %.1f MB/s and file size %.1f GB.",
+                           capacity_report["data_rate"] / MEGABYTE, capacity_report["file_size"] / GIGABYTE)
+
+        if not capacity_report["problems"]:
+            return
+
+        if self.capacity_check == CHECK_REJECT:
+            raise ConfigValidationError(capacity_report["problems"])
+
+        for problem in capacity_report["problems"]:
+            _logger.warning("Capacity check: %s", problem)
+
+    def _get_corrections_problems(self, detector_configs):
+        # Only the detectors with the backend enabled load the corrections files.
+        n_modules = {detector: pipeline.n_modules for detector, pipeline in self.enabled_detectors.items()}
+
+        return get_corrections_problems({detector: configs for detector, configs in detector_configs.items()
+                                         if self.enabled_detectors[detector].backend_client.client_enabled},
+                                        n_modules)
 
-            # add specific for the detector configuration, different from common
-
-            detector_config_add, backend_config_add, writer_config_add = self.enabled_detectors[detector].get_config()
-
-            _audit_logger.info("backend_client.set_config(backend_config)")
-            modified_backend_config = copy(backend_config)
-            if backend_config_add:
-                _audit_logger.info("backend configuration for %s will be enchanced with %s", detector, backend_config_add)
-                modified_backend_config.update(backend_config_add)
-            if "pede_corrections_filename" in backend_config.keys() and backend_config["pede_corrections_filename"]:
-                modified_backend_config["pede_corrections_filename"] = backend_config["pede_corrections_filename"] + "." + detector + ".res.h5"
-                _audit_logger.info("Pedestal file for detector %s will be %s", detector, modified_backend_config["pede_corrections_filename"])
-            if "gain_corrections_filename" in backend_config.keys() and backend_config["gain_corrections_filename"]:
-                modified_backend_config["gain_corrections_filename"] = backend_config["gain_corrections_filename"] + "/" + detector + "/gains.h5"
-                _audit_logger.info("Gain file for detector %s will be %s", detector, modified_backend_config["gain_corrections_filename"])
-            backend_client.set_config(modified_backend_config)
-            self._last_set_backend_config = backend_config
-
-            _audit_logger.info("writer_client.set_parameters(writer_config)")
-            output_file = writer_config["output_file"]
-            modified_writer_config = copy(writer_config)
-            if writer_config_add:
-                _audit_logger.info("writer configuration for %s will be enchanced with %s", detector, writer_config_add)
-                writer_backend_config.update(writer_config_add)
-            if output_file != "/dev/null":
-                modified_writer_config["output_file"] = output_file + "." + detector + ".h5"
-                _audit_logger.info("Output file for detector %s will be %s", detector, modified_writer_config["output_file"]) 
-            writer_client.set_parameters(modified_writer_config)
-            self._last_set_writer_config = writer_config
-
-            _audit_logger.info("detector_client.set_config(detector_config)")
-            modified_detector_config = copy(detector_config)
-            if detector_config_add:
-                _audit_logger.info("detector configuration for %s will be enchanced with %s", detector, detector_config_add)
-                modified_detector_config.update(detector_config_add)
-            detector_client.set_config(modified_detector_config)
-            self._last_set_detector_config = detector_config
-
-        _audit_logger.info("bsread_client.set_parameters(bsread_config)")
+    def _check_corrections(self, detector_configs):
+        problems = self._get_corrections_problems(detector_configs)
+
+        if not problems:
+            return
+
+        if self.corrections_check == CHECK_REJECT:
+            raise ConfigValidationError(problems)
+
+        for problem in problems:
+            _logger.warning("Corrections check: %s", problem)
+
+    def _prefetch_corrections(self, detector_configs):
+        # All the files in parallel, they can be on different filesystems.
+        calls = {(detector, filename): partial(prefetch_file, filename)
+                 for detector, (_, backend_config, _) in detector_configs.items()
+                 if self.enabled_detectors[detector].backend_client.client_enabled
+                 for _, filename in get_corrections_files(backend_config)}
+
+        if not calls:
+            return
+
+        with self.timings.measure(PHASE_METRIC, phase="prefetch_corrections"):
+            _, errors = call_in_parallel(self._command_executor, calls, timeout=self.status_timeout)
+
+        for (detector, filename), error in errors.items():
+            _logger.debug("Cannot prefetch %s for %s: %s", filename, detector, error)
+
+    def _get_detector_configs(self, detector, writer_config, backend_config, detector_config):
+        # add specific for the detector configuration, different from common
+        detector_config_add, backend_config_add, writer_config_add = self.enabled_detectors[detector].get_config()
+
+        modified_backend_config = copy(backend_config)
+        if backend_config_add:
+            _audit_logger.info("backend configuration for %s will be enchanced with %s", detector, backend_config_add)
+            modified_backend_config.update(backend_config_add)
+        if "pede_corrections_filename" in backend_config.keys() and backend_config["pede_corrections_filename"]:
+            modified_backend_config["pede_corrections_filename"] = backend_config["pede_corrections_filename"] + "." + detector + ".res.h5"
+            _audit_logger.info("Pedestal file for detector %s will be %s", detector, modified_backend_config["pede_corrections_filename"])
+        if "gain_corrections_filename" in backend_config.keys() and backend_config["gain_corrections_filename"]:
+            modified_backend_config["gain_corrections_filename"] = backend_config["gain_corrections_filename"] + "/" + detector + "/gains.h5"
+            _audit_logger.info("Gain file for detector %s will be %s", detector, modified_backend_config["gain_corrections_filename"])
+
+        output_file = writer_config["output_file"]
+        modified_writer_config = copy(writer_config)
+        if writer_config_add:
+            _audit_logger.info("writer configuration for %s will be enchanced with %s", detector, writer_config_add)
+            modified_writer_config.update(writer_config_add)
+        if output_file != "/dev/null":
+            modified_writer_config["output_file"] = output_file + "." + detector + ".h5"
+            _audit_logger.info("Output file for detector %s will be %s", detector, modified_writer_config["output_file"]) 
+
+        modified_detector_config = copy(detector_config)
+        if detector_config_add:
+            _audit_logger.info("detector configuration for %s will be enchanced with %s", detector, detector_config_add)
+            modified_detector_config.update(detector_config_add)
+
+        return modified_detector_config, modified_backend_config, modified_writer_config
+
+    def _get_bsread_config(self, bsread_config):
         output_file = bsread_config["output_file"]
         modified_bsread_config = copy(bsread_config)
         if output_file != "/dev/null":
             modified_bsread_config["output_file"] = output_file + ".BSREAD.h5"
             _audit_logger.info("Output file for bsread will be %s", modified_bsread_config["output_file"])
 
-        self.bsread_client.set_parameters(modified_bsread_config)
-        self._last_set_bsread_config = bsread_config
+        return modified_bsread_config
 
-        self.last_config_successful = True
+    def _apply_bsread_config(self, bsread_config, reset=False):
+        if reset:
+            self._timed_bsread("reset")()
 
-        return check_for_target_status(self.get_acquisition_status, IntegrationStatus.CONFIGURED)
+        self._timed_bsread("set_parameters")(bsread_config)
 
+    @exclusive_command("update config")
     def update_acquisition_config(self, config_updates):
         current_config = self.get_acquisition_config()
 
@@ -256,10 +983,14 @@ class IntegrationManager(object):
 
         self.set_acquisition_config(current_config)
 
-        return check_for_target_status(self.get_acquisition_status, IntegrationStatus.CONFIGURED)
+        return self.wait_for_status(IntegrationStatus.CONFIGURED)
 
+    @exclusive_command("set clients enabled")
     def set_clients_enabled(self, client_status):
 
+        # Disabled clients ignore the config, it must be sent again once they are enabled.
+        self._applied_configs = {}
+        self._applied_bsread_config = None
 
         for detector in self.enabled_detectors.keys():
             _audit_logger.info("Detector : %s", detector)
@@ -290,6 +1021,7 @@ class IntegrationManager(object):
                                 "detector": self.enabled_detectors[detector].detector_client.is_client_enabled()}
         return status
 
+    @exclusive_command("set client configuration")
     def set_client_configuration(self, configuration):
         
         for client in configuration:
@@ -301,6 +1033,7 @@ class IntegrationManager(object):
 
             self.enabled_detectors[client].set_config(detector_config, backend_config, writer_config)
 
+    @exclusive_command("clear client configuration")
     def clear_client_configuration(self, client):
 
         if client in self.enabled_detectors:
@@ -317,75 +1050,195 @@ class IntegrationManager(object):
             _logger.info("request to get client onformation for not existing client %s, enabled one are %s", client, self.enabled_detectors.keys()) 
         return config
 
+    @exclusive_command("reset")
+    @timed_command("reset")
     def reset(self):
-
-        from time import sleep,time
-        
-        time0 = time()
-
         _audit_logger.info("Resetting integration api.")
 
-        threads = []
-
         status = self.get_acquisition_status()
-        time1 = time()
         if status == IntegrationStatus.RUNNING or status == IntegrationStatus.DETECTOR_STOPPED:
             raise ValueError("Cannot reset acquisition in %s state. Please wait for backend to finish." % status)
 
         self.last_config_successful = False
 
         _logger.debug("Executing stop command: caput %s %d", self.timing_pv, self.timing_stop_code)
-        epics.caput(self.timing_pv, self.timing_stop_code, wait=True, timeout=self.caput_timeout)
+        self._put_timing_event(self.timing_stop_code)
 
-        time2 = time()
-        for detector in self.enabled_detectors.keys():
-            thread = Thread(target=self.enabled_detectors[detector].reset)
-            thread.start()
-            threads.append(thread)
-        time3 = time()
-
-  
-        thread = Thread(target=self.bsread_client.reset)
-        thread.start()
-        threads.append(thread)
- 
-        time4 = time()
+        self._reset_clients()
+        self._wait_for_timing_event()
 
-        for thread in threads:
-            thread.join()
+        return self.wait_for_status(IntegrationStatus.INITIALIZED)
 
-        time5 = time()
+    def _reset_clients(self):
+        self._applied_configs = {}
+        self._applied_bsread_config = None
 
-        _logger.debug("----------------total reset timing %f, %f, %f, %f, %f, %f", time5-time0, time1-time0, time2-time1, time3-time2, time4-time3, time5-time4)
-        return check_for_target_status(self.get_acquisition_status, IntegrationStatus.INITIALIZED)
+        calls = {detector: self.enabled_detectors[detector].reset for detector in self.enabled_detectors.keys()}
+        calls["bsread"] = self._timed_bsread("reset")
 
+        with self.timings.measure(PHASE_METRIC, phase="reset_clients"):
+            _, errors = call_in_parallel(self._command_executor, calls)
+
+        for detector, error in errors.items():
+            _logger.warning("Reset of %s failed: %s", detector, error)
+
+        # Waiting for the status is pointless once over budget.
+        if any(isinstance(error, DeadlineExceeded) for error in errors.values()):
+            raise ParallelExecutionError("Cannot reset clients.", errors)
+
+    @exclusive_command("kill")
+    @timed_command("kill")
     def kill(self):
         _audit_logger.info("Killing acquisition.")
 
-        for detector in self.enabled_detectors.keys():
-            self.enabled_detectors[detector].kill()
+        # Kill has no ordering between detectors - every pipeline runs its own kill steps.
+        calls = {detector: self.enabled_detectors[detector].kill for detector in self.enabled_detectors.keys()}
+        calls["bsread"] = self._timed_bsread("kill")
 
-        _audit_logger.info("bsread_client.kill()")
-        self.bsread_client.kill()
+        _audit_logger.info("detector_pipeline.kill() and bsread_client.kill()")
+        _, errors = call_in_parallel(self._command_executor, calls)
+
+        for detector, error in errors.items():
+            _logger.warning("Kill of %s failed: %s", detector, error)
 
         return self.reset()
 
+    def _run_phases(self, phases, first_phase_calls=None, last_phase_calls=None):
+        # Each phase runs in parallel on all pipelines and must complete everywhere before the next one starts.
+        for index, phase in enumerate(phases):
+            calls = {detector: partial(self.enabled_detectors[detector].run_phase, phase)
+                     for detector in self.enabled_detectors.keys()}
+
+            if index == 0 and first_phase_calls:
+                calls.update(first_phase_calls)
+            if index == len(phases) - 1 and last_phase_calls:
+                calls.update(last_phase_calls)
+
+            _audit_logger.info("%s_client.%s() on %d detectors", phase[0], phase[1], len(self.enabled_detectors))
+            with self.timings.measure(PHASE_METRIC, phase="%s_%s" % phase):
+                _, errors = call_in_parallel(self._command_executor, calls)
+
+            if errors:
+                # Name the failing client, unless the call was not a pipeline one (bsread).
+                raise ParallelExecutionError("Cannot %s %s." % (phase[1], phase[0]),
+                                             {key if key not in self.enabled_detectors else "%s %s" % (key, phase[0]):
+                                              error for key, error in errors.items()})
+
+    def _put_timing_event(self, event_code):
+        # With the asynchronous trigger the put is only sent, _wait_for_timing_event completes it.
+        if self.async_timing_trigger:
+            call_with_deadline(self.timing_event_pv.put_async, None, "timing", "put", event_code)
+            return
+
+        with self.timings.measure(PHASE_METRIC, phase="timing_caput"):
+            call_with_deadline(self.timing_event_pv.put, None, "timing", "put", event_code)
+
+    def _wait_for_timing_event(self):
+        if self.async_timing_trigger:
+            self.timing_event_pv.wait_for_put()
+
+    def _timing_event_completed(self, event_code, duration):
+        self.timings.observe(PHASE_METRIC, duration, phase="timing_caput", result="ok")
+
+        # Called from the CA thread, which must not be blocked - refresh elsewhere to wake up the status waiters.
+        Thread(target=self._refresh_status_after_event, args=(event_code,), daemon=True).start()
+
+    def _refresh_status_after_event(self, event_code):
+        try:
+            self.refresh_status()
+        except Exception as e:
+            _logger.warning("Cannot refresh status after timing event %s: %s", event_code, e)
+
+    def _timed_bsread(self, method_name):
+        return self.timings.wrap(partial(call_with_deadline, getattr(self.bsread_client, method_name),
+                                         None, "bsread", method_name),
+                                 CLIENT_METRIC, detector="", client="bsread", operation=method_name)
+
+    def get_metrics_history(self, window=None, source=None):
+        return self.metrics_collector.get_history(window, source)
+
+    def get_metrics_rates(self, window=None, source=None):
+        return self.metrics_collector.get_rates(window, source)
+
+    def get_timings(self):
+        return self.timings.get_timings()
+
+    def get_timings_prometheus(self):
+        return self.timings.get_prometheus_text()
+
+    def clear_timings(self):
+        self.timings.clear()
+
     def get_server_info(self):
         clients = {}
         for detector in self.enabled_detectors.keys():
             detector_client, backend_client, writer_client = self.enabled_detectors[detector].return_clients()
             clients[detector] = {"backend_url": backend_client.backend_url,
                                  "writer_url":  writer_client.url,
-                                 "bsread_url":  bsread_client._api_address.format(url="")}  
+                                 "bsread_url":  self.bsread_client.broker_url}
+
+        snapshot = self._status_snapshot
 
         return {
             "clients": copy(clients),
             "clients_enabled": self.get_clients_enabled(),
             "validator": "NOT IMPLEMENTED",
-            "last_config_successful": copy(self.last_config_successful)
+            "last_config_successful": copy(self.last_config_successful),
+            "status_poller": {"enabled": self._status_poller is not None,
+                              "poll_interval": self.status_poll_interval,
+                              "max_age": self.status_max_age,
+                              "snapshot_version": snapshot.version if snapshot else None,
+                              "snapshot_timestamp": snapshot.timestamp if snapshot else None},
+            "metrics_collector": {"enabled": self.metrics_collector.is_running(),
+                                  "interval": self.metrics_collector.interval,
+                                  "history_size": self.metrics_collector.history_size},
+            "readiness": self.get_readiness(),
+            "command_in_progress": self._command_in_progress,
+            "single_flight": self._single_flight.get_statistics(),
+            "bsread_circuit_breaker": self.bsread_client.client.circuit_breaker.get_status()
+            if hasattr(self.bsread_client.client, "circuit_breaker") else None,
+            "capacity": {"check": self.capacity_check,
+                         "timing_rate": self.timing_rate,
+                         "writer_bandwidth": self.writer_bandwidth,
+                         "disk_bandwidth": self.disk_bandwidth,
+                         "last_report": self._last_capacity_report},
+            "corrections": {"check": self.corrections_check,
+                            "prefetch": self.prefetch_corrections},
+            "timing_pv": dict(self.timing_event_pv.get_status(), async_trigger=self.async_timing_trigger)
         }
 
     def get_metrics(self):
+        # With the collector running, serve its last samples instead of querying every client again.
+        # The collector only samples the enabled clients, the disabled ones have no statistics.
+        if self.metrics_collector.is_running():
+            samples = self.metrics_collector.get_latest(max_age=2 * self.metrics_collector.interval)
+
+            sampled_sources = {detector for detector, pipeline in self.enabled_detectors.items()
+                               if pipeline.writer_client.is_client_enabled()
+                               or pipeline.backend_client.is_client_enabled()}
+            if self.bsread_client.is_client_enabled():
+                sampled_sources.add("bsread")
+
+            if sampled_sources.issubset(samples):
+                status = {detector: {"writer":   samples.get(detector, {}).get("writer"),
+                                     "backend":  samples.get(detector, {}).get("backend"),
+                                     "detector": {}} for detector in self.enabled_detectors.keys()}
+                status["bsread"] = {"bsread": samples["bsread"].get("bsread") if "bsread" in sampled_sources
+                                    else None}
+
+                return status
+
+        # Do not query the clients in the middle of a command, nor wait for it: the last metrics will do,
+        # none if there were no metrics collected before.
+        if self._is_command_in_progress():
+            return copy(self._last_metrics) if self._last_metrics is not None else {}
+
+        status = self._single_flight.call("metrics", self._collect_metrics)
+
+        # Always return a copy - we do not want this to be updated.
+        return copy(status)
+
+    def _collect_metrics(self):
         status = {}
         for detector in self.enabled_detectors.keys():
             detector_client, backend_client, writer_client = self.enabled_detectors[detector].return_clients()
@@ -394,8 +1247,9 @@ class IntegrationManager(object):
                                 "detector": {}}
         status["bsread"] = {"bsread": self.bsread_client.get_statistics()}
 
-        # Always return a copy - we do not want this to be updated.
-        return copy(status)
+        self._last_metrics = status
+
+        return status
 
     def backend_client_get_status(self):
         status = {}
@@ -404,6 +1258,7 @@ class IntegrationManager(object):
         _logger.info("backend_client_get_status, status : %s", status)
         return copy(status)
 
+    @exclusive_command("run backend action")
     def backend_client_action(self, action):
         status = {}
         for detector in self.enabled_detectors.keys():
@@ -418,10 +1273,12 @@ class IntegrationManager(object):
         _logger.info("backend_client_get_config: %s", status)
         return copy(status)
 
+    @exclusive_command("set backend config")
     def backend_client_set_config(self, new_config):
         for detector in self.enabled_detectors.keys():
             self.enabled_detectors[detector].backend_client.set_config(new_config)
 
+    @exclusive_command("set detector value")
     def detector_client_set_value(self, parameter_name, parameter_value, no_verification=True):
         status = {}
         for detector in self.enabled_detectors.keys():
@@ -0,0 +1,207 @@
+from collections import deque
+from copy import deepcopy
+from logging import getLogger
+from threading import Thread, Event, Lock
+from time import time
+
+from sf_dia.timing import CLIENT_METRIC
+from sf_dia.utils import call_in_parallel
+
+_logger = getLogger(__name__)
+
+# Number of samples kept per detector (and for bsread).
+DEFAULT_METRICS_HISTORY = 600
+
+# Flattened statistics counters used to derive the frame rates and the backlog of the writer, as reported by
+# the writer statistics. The backend metrics have no frame counters.
+RECEIVED_FRAMES_COUNTER = ("writer", "n_received_frames")
+WRITTEN_FRAMES_COUNTER = ("writer", "n_written_frames")
+FRAMES_COUNTERS = (RECEIVED_FRAMES_COUNTER, WRITTEN_FRAMES_COUNTER)
+
+
+class MetricsCollector(object):
+    # Samples the writer statistics, backend metrics and bsread statistics at a fixed interval.
+    # Every detector (and bsread) has a bounded history of samples {"timestamp", "writer", "backend", "errors"}.
+
+    def __init__(self, integration_manager, executor, interval=None, history_size=None):
+        self.integration_manager = integration_manager
+        self.executor = executor
+        self.interval = interval
+        self.history_size = history_size or DEFAULT_METRICS_HISTORY
+
+        self._lock = Lock()
+        self._history = {}
+        # Statistics calls that timed out and are still running, not submitted again until they finish.
+        self._calls_in_flight = {}
+
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self.is_running():
+            return
+
+        _logger.info("Starting metrics collector with interval %s seconds.", self.interval)
+
+        self._stop.clear()
+        self._thread = Thread(target=self._collect_periodically, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _collect_periodically(self):
+        while True:
+            try:
+                self.collect()
+            except Exception as e:
+                _logger.warning("Metrics collector could not collect the metrics: %s", e)
+
+            if self._stop.wait(self.interval):
+                return
+
+    def collect(self):
+        manager = self.integration_manager
+        calls = {}
+
+        def timed(client, method_name, detector, client_name):
+            return manager.timings.wrap(getattr(client, method_name), CLIENT_METRIC,
+                                        detector=detector, client=client_name, operation=method_name)
+
+        for detector, pipeline in manager.enabled_detectors.items():
+            _, backend_client, writer_client = pipeline.return_clients()
+
+            if writer_client.is_client_enabled():
+                calls[(detector, "writer")] = timed(writer_client, "get_statistics", detector, "writer")
+            if backend_client.is_client_enabled():
+                calls[(detector, "backend")] = timed(backend_client, "get_metrics", detector, "backend")
+
+        if manager.bsread_client.is_client_enabled():
+            calls[("bsread", "bsread")] = timed(manager.bsread_client, "get_statistics", "", "bsread")
+
+        timestamp = time()
+        results, errors = call_in_parallel(self.executor, calls, timeout=manager.status_timeout,
+                                           in_flight=self._calls_in_flight)
+
+        samples = {}
+        for (source, client_name), result in results.items():
+            samples.setdefault(source, {"timestamp": timestamp})[client_name] = result
+
+        for (source, client_name), error in errors.items():
+            _logger.debug("Cannot get %s metrics for %s: %s", client_name, source, error)
+            samples.setdefault(source, {"timestamp": timestamp}).setdefault("errors", {})[client_name] = str(error)
+
+        with self._lock:
+            for source, sample in samples.items():
+                if source not in self._history:
+                    self._history[source] = deque(maxlen=self.history_size)
+
+                self._history[source].append(sample)
+
+        return samples
+
+    def clear(self):
+        with self._lock:
+            self._history = {}
+
+    def get_latest(self, max_age=None):
+        # {source: last sample}, without the sources with no sample younger than max_age.
+        now = time()
+
+        with self._lock:
+            return {source: deepcopy(samples[-1]) for source, samples in self._history.items()
+                    if samples and (max_age is None or now - samples[-1]["timestamp"] <= max_age)}
+
+    def get_history(self, window=None, source=None):
+        # {source: [samples of the last window seconds, oldest first]}.
+        start_time = time() - window if window is not None else None
+
+        with self._lock:
+            history = {name: [sample for sample in samples if start_time is None or sample["timestamp"] >= start_time]
+                       for name, samples in self._history.items() if source is None or name == source}
+
+        return deepcopy(history)
+
+    def get_rates(self, window=None, source=None):
+        # Per second increase of every numeric counter over the window, with the frame rates and the
+        # backlog of frames received by the writer but not yet written. Frame counters missing from the
+        # statistics of a client are listed in missing_counters, instead of reported as no rate.
+        rates = {}
+
+        for name, samples in self.get_history(window, source).items():
+            flat_samples = [(sample["timestamp"],
+                             {client_name: _flatten(sample[client_name]) for client_name in ("writer", "backend", "bsread")
+                              if isinstance(sample.get(client_name), dict)})
+                            for sample in samples]
+
+            counter_rates = {}
+            for _, statistics in flat_samples:
+                for client_name, values in statistics.items():
+                    for path in values:
+                        counter_rates.setdefault(client_name, {})[path] = None
+
+            for client_name, paths in counter_rates.items():
+                for path in paths:
+                    paths[path] = _get_counter_rate(flat_samples, client_name, path)
+
+            missing_counters = ["%s/%s" % counter for counter in FRAMES_COUNTERS
+                                if counter[0] in counter_rates and counter[1] not in counter_rates[counter[0]]]
+            if missing_counters:
+                _logger.warning("Statistics of %s have no %s counters.", name, ", ".join(missing_counters))
+
+            rates[name] = {"n_samples": len(samples),
+                           "counter_rates": counter_rates,
+                           "received_frames_rate": counter_rates.get(RECEIVED_FRAMES_COUNTER[0], {})
+                                                                .get(RECEIVED_FRAMES_COUNTER[1]),
+                           "written_frames_rate": counter_rates.get(WRITTEN_FRAMES_COUNTER[0], {})
+                                                               .get(WRITTEN_FRAMES_COUNTER[1]),
+                           "backlog": _get_backlog(flat_samples),
+                           "missing_counters": missing_counters}
+
+        return rates
+
+
+def _flatten(statistics, prefix=""):
+    # Numeric values of nested dictionaries, as {"parent/child": value}.
+    values = {}
+
+    for key, value in statistics.items():
+        path = prefix + str(key)
+
+        if isinstance(value, dict):
+            values.update(_flatten(value, path + "/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+
+    return values
+
+
+def _get_counter_rate(flat_samples, client_name, path):
+    # Counters restart with every run, so only the increases between consecutive samples are summed.
+    points = [(timestamp, statistics[client_name][path]) for timestamp, statistics in flat_samples
+              if path in statistics.get(client_name, {})]
+
+    if len(points) < 2 or points[-1][0] <= points[0][0]:
+        return None
+
+    increase = sum(max(0, value - last_value) for (_, last_value), (_, value) in zip(points, points[1:]))
+
+    return increase / (points[-1][0] - points[0][0])
+
+
+def _get_backlog(flat_samples):
+    for _, statistics in reversed(flat_samples):
+        received_frames = statistics.get(RECEIVED_FRAMES_COUNTER[0], {}).get(RECEIVED_FRAMES_COUNTER[1])
+        written_frames = statistics.get(WRITTEN_FRAMES_COUNTER[0], {}).get(WRITTEN_FRAMES_COUNTER[1])
+
+        if received_frames is not None and written_frames is not None:
+            return received_frames - written_frames
+
+    return None
@@ -0,0 +1,202 @@
+from functools import wraps
+from logging import getLogger
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+import bottle
+
+from sf_dia.utils import Deadline, deadline_scope, get_deadline_errors
+
+_logger = getLogger(__name__)
+
+API_ROOT = "/api/v1"
+
+# Time budget of a request in seconds, as query parameter or header.
+DEADLINE_QUERY_PARAMETER = "deadline"
+DEADLINE_HEADER = "X-Deadline"
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ThreadedWSGIRefServer(bottle.ServerAdapter):
+    # Like the default bottle server, but every request is handled in its own thread:
+    # status and metrics requests are answered while a command is in progress.
+
+    def run(self, app):
+        handler_class = QuietWSGIRequestHandler if self.quiet else WSGIRequestHandler
+
+        server = make_server(self.host, self.port, app, ThreadingWSGIServer, handler_class)
+        server.serve_forever()
+
+
+class DeadlinePlugin(object):
+    # Runs every request within its deadline, passed on to the manager and the client calls.
+    # A request going over budget gets a 504 naming the clients and detectors that were still busy.
+    name = "deadline"
+    api = 2
+
+    def __init__(self, default_deadline=None):
+        self.default_deadline = default_deadline
+
+    def apply(self, callback, route):
+        @wraps(callback)
+        def wrapper(*args, **kwargs):
+            timeout = _get_deadline() or self.default_deadline
+            if not timeout:
+                return callback(*args, **kwargs)
+
+            try:
+                with deadline_scope(Deadline(timeout)):
+                    return callback(*args, **kwargs)
+
+            except Exception as e:
+                deadline_errors = get_deadline_errors(e)
+                if not deadline_errors:
+                    raise
+
+                _logger.warning("Request %s %s over budget: %s", bottle.request.method, bottle.request.path, e)
+                bottle.response.status = 504
+
+                return {"state": "error",
+                        "status": str(e),
+                        "deadline_exceeded": [error.to_dict() for error in deadline_errors]}
+
+        return wrapper
+
+
+def register_sf_rest_interface(app, integration_manager, detector_topology=None, default_deadline=None):
+    # SwissFEL specific endpoints, next to the ones registered by detector_integration_api.
+    # The deadline plugin applies to all the endpoints of the app.
+    app.install(DeadlinePlugin(default_deadline))
+
+    def get_detector_topology():
+        if detector_topology is None:
+            raise ValueError("Detectors reload not available, the server was started without available_detectors.json.")
+
+        return detector_topology
+
+    @app.get(API_ROOT + "/live")
+    def get_liveness():
+        return {"state": "ok",
+                "status": "alive"}
+
+    @app.get(API_ROOT + "/ready")
+    def get_readiness():
+        # 503 until every detector is initialised, for load balancers and supervisors.
+        readiness = integration_manager.get_readiness()
+
+        if not readiness["ready"]:
+            bottle.response.status = 503
+
+        return {"state": "ok" if readiness["ready"] else "error",
+                "status": readiness}
+
+    @app.post(API_ROOT + "/initialise")
+    def retry_initialisation():
+        # Initialise again the detectors that failed.
+        return {"state": "ok",
+                "status": integration_manager.retry_detectors_initialisation()}
+
+    @app.get(API_ROOT + "/detectors")
+    def get_available_detectors():
+        return {"state": "ok",
+                "status": get_detector_topology().get_available_detectors()}
+
+    @app.post(API_ROOT + "/detectors/reload")
+    def reload_detectors():
+        # Apply the changes of available_detectors.json: {"added": [...], "removed": [...], "changed": [...]}.
+        return {"state": "ok",
+                "status": get_detector_topology().reload()}
+
+    @app.get(API_ROOT + "/status_breakdown")
+    def get_status_breakdown():
+        return {"state": "ok",
+                "status": integration_manager.get_status_breakdown()}
+
+    @app.post(API_ROOT + "/validate")
+    def validate_config():
+        # Dry run: every problem of the config in the body and its expected data rate, nothing is sent to the clients.
+        return {"state": "ok",
+                "status": integration_manager.validate_acquisition_config(bottle.request.json or {})}
+
+    @app.post(API_ROOT + "/rearm")
+    def rearm():
+        return {"state": "ok",
+                "status": str(integration_manager.rearm_acquisition())}
+
+    @app.post(API_ROOT + "/queue")
+    def submit_queue():
+        # Body: {"configs": [config, ...], "parameters": start parameters (optional)}.
+        queue_request = bottle.request.json or {}
+
+        return {"state": "ok",
+                "status": integration_manager.submit_acquisition_queue(queue_request.get("configs"),
+                                                                       queue_request.get("parameters"))}
+
+    @app.get(API_ROOT + "/queue")
+    def get_queue():
+        return {"state": "ok",
+                "status": integration_manager.get_acquisition_queue_status()}
+
+    @app.delete(API_ROOT + "/queue")
+    def cancel_queue():
+        return {"state": "ok",
+                "status": integration_manager.cancel_acquisition_queue()}
+
+    @app.get(API_ROOT + "/metrics/history")
+    def get_metrics_history():
+        # Query: window (seconds, default all the history), source (detector name or "bsread", default all).
+        return {"state": "ok",
+                "status": integration_manager.get_metrics_history(_get_window(), bottle.request.query.source or None)}
+
+    @app.get(API_ROOT + "/metrics/rates")
+    def get_metrics_rates():
+        return {"state": "ok",
+                "status": integration_manager.get_metrics_rates(_get_window(), bottle.request.query.source or None)}
+
+    @app.get(API_ROOT + "/timings")
+    def get_timings():
+        return {"state": "ok",
+                "status": integration_manager.get_timings()}
+
+    @app.get(API_ROOT + "/timings/prometheus")
+    def get_timings_prometheus():
+        bottle.response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+        return integration_manager.get_timings_prometheus()
+
+    @app.delete(API_ROOT + "/timings")
+    def clear_timings():
+        integration_manager.clear_timings()
+
+        return {"state": "ok",
+                "status": integration_manager.get_timings()}
+
+
+def _get_deadline():
+    deadline = bottle.request.query.get(DEADLINE_QUERY_PARAMETER) or bottle.request.get_header(DEADLINE_HEADER)
+
+    if not deadline:
+        return None
+
+    try:
+        deadline = float(deadline)
+    except ValueError:
+        raise ValueError("Invalid deadline '%s', expected a number of seconds." % deadline)
+
+    if deadline <= 0:
+        raise ValueError("Invalid deadline '%s', expected a positive number of seconds." % deadline)
+
+    return deadline
+
+
+def _get_window():
+    window = bottle.request.query.window
+
+    return float(window) if window else None
@@ -2,6 +2,7 @@ import argparse
 import logging
 import os.path
 import json
+from functools import partial
 
 import bottle
 from detector_integration_api import config
@@ -11,7 +12,10 @@ from detector_integration_api.client.backend_rest_client import BackendClient
 from sf_dia.client.sf_cpp_writer_client import SfCppWriterClient
 from detector_integration_api.rest_api.rest_server import register_rest_interface
 
-from sf_dia import manager
+from sf_dia import manager, validation
+from sf_dia.rest_api import register_sf_rest_interface, ThreadedWSGIRefServer
+from sf_dia.metrics_collector import DEFAULT_METRICS_HISTORY
+from sf_dia.detector_topology import DetectorTopology
 from sf_dia.client.databuffer_writer_client import DataBufferWriterClient
 from detector_integration_api.client.detector_client import DetectorClient
 
@@ -19,11 +23,62 @@ from sf_dia.client.detector_pipeline import DetectorPipeline
 
 _logger = logging.getLogger(__name__)
 
+def get_detector_pipeline(detector, detector_settings, config_directory, broker_url,
+                          writer_executable, writer_log_folder, disable_detector=False):
+    # Returns the pipeline of a detector in available_detectors.json and the function initialising it (or None).
+    backend_api_url    = detector_settings['backend_api_url']
+    backend_stream_url = detector_settings['backend_stream_url']
+    writer_port        = detector_settings['writer_port']
+    detector_id        = detector_settings['detector_id']
+    n_modules          = detector_settings['n_modules']
+    n_bad_modules      = detector_settings['n_bad_modules']
+
+    _logger.info("Detector __ %s ___:\nDetector ID: %s \nBackend url: %s\nBackend stream: "
+                 "%s\nWriter port: %s\nBroker url: %s\nn_modules: %s\nn_bad_modules: %s\n",
+                 detector, str(detector_id), backend_api_url, backend_stream_url, str(writer_port),
+                 broker_url, str(n_modules), str(n_bad_modules))
+
+    backend_client = BackendClient(backend_api_url)
+    writer_client = SfCppWriterClient(stream_url=backend_stream_url,
+                                      writer_executable=writer_executable,
+                                      writer_port=writer_port,
+                                      log_folder=writer_log_folder + "/" + detector,
+                                      broker_url=broker_url,
+                                      n_modules=n_modules,
+                                      n_bad_modules=n_bad_modules,
+                                      detector_name=detector)
+
+    detector_client = DetectorClient(id=detector_id)
+
+    # Without detector hardware (e.g. with the simulators) the detector cannot be initialised.
+    initialise = None
+    if not disable_detector:
+        initialise = partial(detector_client.initialise,
+                             config_file=config_directory+"/"+detector+"/detector.config",
+                             n_modules=n_modules)
+
+    # Optional override of the reset/kill dependency graphs, {step: [client, method, [dependencies]]}.
+    pipeline = DetectorPipeline(detector_client, backend_client, writer_client,
+                                reset_steps=detector_settings.get("reset_steps"),
+                                kill_steps=detector_settings.get("kill_steps"),
+                                n_modules=n_modules)
+
+    return pipeline, initialise
+
+
 def start_integration_server(host, port, config_directory,
                              backend_api_url, backend_stream_url, writer_port,
                              broker_url, disable_bsread,
                              timing_pv, timing_start_code, timing_stop_code,
-                             writer_executable, writer_log_folder):
+                             writer_executable, writer_log_folder,
+                             status_workers=None, status_timeout=None,
+                             status_poll_interval=None, status_max_age=None, transition_timeout=None,
+                             disable_detector=False, metrics_interval=None, metrics_history=None,
+                             async_timing_trigger=False, watch_detectors_interval=None,
+                             threaded_server=False, command_queue_timeout=None, broker_pool_size=None,
+                             broker_failure_threshold=None, broker_reset_timeout=None, default_deadline=None,
+                             timing_rate=None, writer_bandwidth=None, disk_bandwidth=None, capacity_check=None,
+                             corrections_check=None, prefetch_corrections=False):
     _logger.info("Starting integration REST API with:"
                  "\nbroker_url: %s\n",
                  broker_url)
@@ -32,6 +87,7 @@ def start_integration_server(host, port, config_directory,
 
 
     enabled_detectors = {}
+    initialisations = {}
 
     available_detectors = {}
     available_detectors['JF'] =    {'detector_id': 0, 'backend_api_url': backend_api_url, 'backend_stream_url': backend_stream_url, 'writer_port': writer_port, 'n_modules': 1, 'n_bad_modules' : 0}
@@ -41,57 +97,65 @@ def start_integration_server(host, port, config_directory,
             with open(available_detectors_file) as json_detector_file:
                 available_detectors = json.load(json_detector_file)
 
+    build_pipeline = partial(get_detector_pipeline, config_directory=config_directory, broker_url=broker_url,
+                             writer_executable=writer_executable, writer_log_folder=writer_log_folder,
+                             disable_detector=disable_detector)
+
     for detector in available_detectors.keys():
-        backend_api_url    = available_detectors[detector]['backend_api_url']
-        backend_stream_url = available_detectors[detector]['backend_stream_url']
-        writer_port        = available_detectors[detector]['writer_port']
-        detector_id        = available_detectors[detector]['detector_id']
-        n_modules          = available_detectors[detector]['n_modules']
-        n_bad_modules      = available_detectors[detector]['n_bad_modules']
-        if "disabled_modules" in available_detectors[detector]:
-            disabled_modules = available_detectors[detector]["disabled_modules"]
-        else:
-            disabled_modules = []
-
-        _logger.info("Detector __ %s ___:\nDetector ID: %s \nBackend url: %s\nBackend stream: "
-                     "%s\nWriter port: %s\nBroker url: %s\nn_modules: %s\nn_bad_modules: %s\n",
-                     detector, str(detector_id), backend_api_url, backend_stream_url, str(writer_port),
-                     broker_url, str(n_modules), str(n_bad_modules))
-
-        backend_client = BackendClient(backend_api_url)
-        writer_client = SfCppWriterClient(stream_url=backend_stream_url,
-                                          writer_executable=writer_executable,
-                                          writer_port=writer_port,
-                                          log_folder=writer_log_folder + "/" + detector,
-                                          broker_url=broker_url,
-                                          n_modules=n_modules,
-                                          n_bad_modules=n_bad_modules,
-                                          detector_name=detector)
-
-        detector_client = DetectorClient(id=detector_id)
-#
-        detector_client.initialise(config_file=config_directory+"/"+detector+"/detector.config", n_modules=n_modules)
-#
-        enabled_detectors[detector] = DetectorPipeline(detector_client, backend_client, writer_client)
-
-    bsread_client = DataBufferWriterClient(broker_url=broker_url)
+        enabled_detectors[detector], initialise = build_pipeline(detector, available_detectors[detector])
+        # Detectors are initialised in the background once the server is up.
+        if initialise is not None:
+            initialisations[detector] = initialise
+
+    bsread_client = DataBufferWriterClient(broker_url=broker_url, pool_size=broker_pool_size,
+                                           failure_threshold=broker_failure_threshold,
+                                           reset_timeout=broker_reset_timeout)
 
     integration_manager = manager.IntegrationManager(enabled_detectors=enabled_detectors,
-                                                     bsread_client=bsread_client, timing_pv=timing_pv, timing_start_code=timing_start_code, timing_stop_code=timing_stop_code)
+                                                     bsread_client=bsread_client, timing_pv=timing_pv, timing_start_code=timing_start_code, timing_stop_code=timing_stop_code,
+                                                     status_workers=status_workers, status_timeout=status_timeout,
+                                                     status_poll_interval=status_poll_interval,
+                                                     status_max_age=status_max_age,
+                                                     transition_timeout=transition_timeout,
+                                                     metrics_interval=metrics_interval,
+                                                     metrics_history=metrics_history,
+                                                     async_timing_trigger=async_timing_trigger,
+                                                     command_queue_timeout=command_queue_timeout,
+                                                     timing_rate=timing_rate,
+                                                     writer_bandwidth=writer_bandwidth,
+                                                     disk_bandwidth=disk_bandwidth,
+                                                     capacity_check=capacity_check,
+                                                     corrections_check=corrections_check,
+                                                     prefetch_corrections=prefetch_corrections)
 
     _logger.info("Bsread writer disabled at startup: %s", disable_bsread)
     if disable_bsread:
         integration_manager.set_clients_enabled({"bsread": False})
 
+    _logger.info("Detector clients disabled at startup: %s", disable_detector)
+    if disable_detector:
+        integration_manager.set_clients_enabled({"detector": False})
+
+    integration_manager.initialise_detectors(initialisations)
+
+    # Without available_detectors.json there is nothing to reload.
+    detector_topology = None
+    if config_directory is not None and os.path.isfile(config_directory+"/available_detectors.json"):
+        detector_topology = DetectorTopology(integration_manager, config_directory, build_pipeline,
+                                             available_detectors, watch_interval=watch_detectors_interval)
+
     app = bottle.Bottle()
     register_rest_interface(app=app, integration_manager=integration_manager)
+    register_sf_rest_interface(app=app, integration_manager=integration_manager, detector_topology=detector_topology,
+                               default_deadline=default_deadline)
 
     try:
         _logger.info("---------------------------------------")
         _logger.info("   DETECTOR INTEGRATION API IS STARTED ")
         _logger.info("---------------------------------------")
 
-        bottle.run(app=app, host=host, port=port, quiet=True)
+        server = ThreadedWSGIRefServer if threaded_server else "wsgiref"
+        bottle.run(app=app, host=host, port=port, quiet=True, server=server)
     finally:
         pass
 
@@ -119,8 +183,16 @@ def main():
 
     parser.add_argument("--broker_url", default="http://localhost:10002",
                         help="Address of the bsread broker REST api.")
+    parser.add_argument("--broker_pool_size", type=int, default=None,
+                        help="Number of keep-alive connections to the bsread broker.")
+    parser.add_argument("--broker_failure_threshold", type=int, default=None,
+                        help="Consecutive failed broker requests before failing fast and reporting the last known status.")
+    parser.add_argument("--broker_reset_timeout", type=float, default=None,
+                        help="Seconds before probing again an unavailable broker, doubled after every failed probe.")
     parser.add_argument("--disable_bsread", action='store_true',
                         help="Disable the bsread writer at startup.")
+    parser.add_argument("--disable_detector", action='store_true',
+                        help="Do not initialise the detectors and disable the detector clients at startup.")
 
     parser.add_argument("--timing_pv", default="SAR-CVME-TIFALL4-EVG0:SoftEvt-EvtCode-SP",
                         help="PV for triggering soft events on the timing.")
@@ -128,6 +200,49 @@ def main():
                         help="Timing event code to start the detector.")
     parser.add_argument("--timing_stop_code", type=int, default=255,
                         help="Timing event code to stop the detector.")
+    parser.add_argument("--timing_rate", type=float, default=validation.DEFAULT_TIMING_RATE,
+                        help="Frame rate in Hz given by the timing system, used to estimate the data rates.")
+    parser.add_argument("--writer_bandwidth", type=float, default=None,
+                        help="Data rate in MB/s a detector writer can sustain. Not checked by default.")
+    parser.add_argument("--disk_bandwidth", type=float, default=None,
+                        help="Data rate in MB/s the node can write for all the detectors. Not checked by default.")
+    parser.add_argument("--capacity_check", choices=validation.CHECK_MODES,
+                        default=validation.DEFAULT_CAPACITY_CHECK,
+                        help="Action when a config exceeds the bandwidths or the free space of the output filesystems.")
+    parser.add_argument("--corrections_check", choices=validation.CHECK_MODES,
+                        default=validation.DEFAULT_CORRECTIONS_CHECK,
+                        help="Action when the pedestal or gain files of a config are missing, unreadable or of the "
+                             "wrong shape.")
+    parser.add_argument("--prefetch_corrections", action='store_true',
+                        help="Read the pedestal and gain files into the page cache before configuring the backends.")
+    parser.add_argument("--async_timing_trigger", action='store_true',
+                        help="Do not block on the timing event puts: the stop event is sent while resetting the clients.")
+    parser.add_argument("--status_workers", type=int, default=manager.DEFAULT_STATUS_WORKERS,
+                        help="Number of threads used to collect the clients status in parallel.")
+    parser.add_argument("--status_timeout", type=float, default=manager.DEFAULT_STATUS_TIMEOUT,
+                        help="Time in seconds to wait for the status of each client.")
+    parser.add_argument("--status_poll_interval", type=float, default=None,
+                        help="Refresh the status in the background every given seconds. Disabled by default.")
+    parser.add_argument("--status_max_age", type=float, default=manager.DEFAULT_STATUS_MAX_AGE,
+                        help="Maximum age in seconds of the status served to readers when the poller is enabled.")
+    parser.add_argument("--transition_timeout", type=float, default=manager.DEFAULT_TRANSITION_TIMEOUT,
+                        help="Time in seconds for a command to reach its target status.")
+    parser.add_argument("--metrics_interval", type=float, default=None,
+                        help="Sample the writer, backend and bsread statistics every given seconds. Disabled by default.")
+    parser.add_argument("--metrics_history", type=int, default=DEFAULT_METRICS_HISTORY,
+                        help="Number of statistics samples kept per detector.")
+    parser.add_argument("--threaded_server", action='store_true',
+                        help="Handle every REST request in its own thread, so status requests are answered during commands.")
+    parser.add_argument("--command_queue_timeout", type=float, default=None,
+                        help="Time in seconds a command waits for the one in progress before being rejected. "
+                             "0 rejects it right away, by default it waits until the other command is done.")
+    parser.add_argument("--default_deadline", type=float, default=None,
+                        help="Time budget in seconds of the requests not specifying a deadline. Unlimited by default.")
+    parser.add_argument("--watch_detectors_interval", type=float, default=None,
+                        help="Check every given seconds if available_detectors.json changed and apply the changes. "
+                             "Disabled by default, use the detectors reload endpoint instead.")
+    parser.add_argument("--status_rules_file", default=None,
+                        help="JSON file with additional status interpretation rules, checked before the default ones.")
     parser.add_argument("--config_directory",default=None,
                         help="Specify config directory. Content of dirrectory will be searched for available_detectors.py config file and corresponding subdirectories (see documentation)")
 
@@ -138,6 +253,9 @@ def main():
 
     turn_off_requests_logging()
 
+    if arguments.status_rules_file:
+        validation.load_status_rules(arguments.status_rules_file)
+
     start_integration_server(host=arguments.interface,
                              port=arguments.port,
                              config_directory=arguments.config_directory,
@@ -150,7 +268,31 @@ def main():
                              timing_start_code=arguments.timing_start_code,
                              timing_stop_code=arguments.timing_stop_code,
                              writer_executable=arguments.writer_executable,
-                             writer_log_folder=arguments.writer_log_folder)
+                             writer_log_folder=arguments.writer_log_folder,
+                             status_workers=arguments.status_workers,
+                             status_timeout=arguments.status_timeout,
+                             status_poll_interval=arguments.status_poll_interval,
+                             status_max_age=arguments.status_max_age,
+                             transition_timeout=arguments.transition_timeout,
+                             disable_detector=arguments.disable_detector,
+                             metrics_interval=arguments.metrics_interval,
+                             metrics_history=arguments.metrics_history,
+                             async_timing_trigger=arguments.async_timing_trigger,
+                             watch_detectors_interval=arguments.watch_detectors_interval,
+                             threaded_server=arguments.threaded_server,
+                             command_queue_timeout=arguments.command_queue_timeout,
+                             broker_pool_size=arguments.broker_pool_size,
+                             broker_failure_threshold=arguments.broker_failure_threshold,
+                             broker_reset_timeout=arguments.broker_reset_timeout,
+                             default_deadline=arguments.default_deadline,
+                             timing_rate=arguments.timing_rate,
+                             writer_bandwidth=arguments.writer_bandwidth * validation.MEGABYTE
+                             if arguments.writer_bandwidth else None,
+                             disk_bandwidth=arguments.disk_bandwidth * validation.MEGABYTE
+                             if arguments.disk_bandwidth else None,
+                             capacity_check=arguments.capacity_check,
+                             corrections_check=arguments.corrections_check,
+                             prefetch_corrections=arguments.prefetch_corrections)
 
 
 if __name__ == "__main__":
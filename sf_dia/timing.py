@@ -0,0 +1,144 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import time
+
+# Duration of the manager commands, labels: command, result.
+COMMAND_METRIC = "dia_command_duration_seconds"
+# Duration of the steps inside the commands (timing caput, client phases, status wait...), labels: phase, result.
+PHASE_METRIC = "dia_phase_duration_seconds"
+# Duration of every call to a client, labels: detector, client, operation, result. bsread has an empty detector.
+CLIENT_METRIC = "dia_client_call_duration_seconds"
+
+METRIC_HELP = {COMMAND_METRIC: "Duration of the integration manager commands.",
+               PHASE_METRIC: "Duration of the phases of the integration manager commands.",
+               CLIENT_METRIC: "Duration of the calls to the detector, backend, writer and bsread clients."}
+
+# Upper bounds of the histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One counter per bucket plus the +Inf one, not cumulative.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def get_cumulative_counts(self):
+        # [(upper bound, number of observations <= upper bound)], the last bound is "+Inf".
+        cumulative_counts = []
+        total = 0
+
+        for upper_bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            cumulative_counts.append((upper_bound, total))
+
+        return cumulative_counts
+
+
+class Timings(object):
+    # Thread safe collection of duration histograms, one for every metric and set of label values.
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+
+        self._lock = Lock()
+        self._histograms = {}
+
+    def observe(self, metric, duration, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self.buckets)
+
+            self._histograms[key].observe(duration)
+
+    @contextmanager
+    def measure(self, metric, **labels):
+        # Failed calls are recorded as well, with result="error".
+        start_time = time()
+
+        try:
+            yield
+        except Exception:
+            self.observe(metric, time() - start_time, result="error", **labels)
+            raise
+
+        self.observe(metric, time() - start_time, result="ok", **labels)
+
+    def wrap(self, function, metric, **labels):
+        # Return a function measuring each call of the given one.
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            with self.measure(metric, **labels):
+                return function(*args, **kwargs)
+
+        return timed_function
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {}
+
+    def get_timings(self):
+        # {metric: [{"labels": {...}, "count", "sum", "max", "buckets": [[upper bound, cumulative count], ...]}]}
+        timings = {}
+
+        with self._lock:
+            for (metric, labels), histogram in sorted(self._histograms.items(), key=lambda x: x[0]):
+                timings.setdefault(metric, []).append(
+                    {"labels": dict(labels),
+                     "count": histogram.count,
+                     "sum": histogram.sum,
+                     "max": histogram.max,
+                     "buckets": [list(x) for x in histogram.get_cumulative_counts()]})
+
+        return timings
+
+    def get_prometheus_text(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+
+        for metric, histograms in sorted(self.get_timings().items()):
+            lines.append("# HELP %s %s" % (metric, METRIC_HELP.get(metric, metric)))
+            lines.append("# TYPE %s histogram" % metric)
+
+            for histogram in histograms:
+                labels = ",".join('%s="%s"' % (name, _escape_label_value(value))
+                                  for name, value in sorted(histogram["labels"].items()))
+                separator = "," if labels else ""
+
+                for upper_bound, count in histogram["buckets"]:
+                    lines.append('%s_bucket{%s%sle="%s"} %d' % (metric, labels, separator, upper_bound, count))
+
+                lines.append("%s_sum{%s} %f" % (metric, labels, histogram["sum"]))
+                lines.append("%s_count{%s} %d" % (metric, labels, histogram["count"]))
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def timed_command(command):
+    # Decorator for the IntegrationManager methods, recorded in its timings under COMMAND_METRIC.
+    def decorator(method):
+        @wraps(method)
+        def timed_method(self, *args, **kwargs):
+            with self.timings.measure(COMMAND_METRIC, command=command):
+                return method(self, *args, **kwargs)
+
+        return timed_method
+
+    return decorator
@@ -0,0 +1,151 @@
+from functools import partial
+from logging import getLogger
+from threading import Lock, Condition
+from time import time
+
+import epics
+
+_logger = getLogger(__name__)
+
+
+class TimingEventPV(object):
+    # Handle on the timing PV used to send the start and stop event codes. The channel is connected once
+    # and kept, instead of being looked up on every caput.
+
+    def __init__(self, pv_name, put_timeout, put_callback=None):
+        self.pv_name = pv_name
+        self.put_timeout = put_timeout
+        # Called as put_callback(value, duration) when an asynchronous put completes, from the CA thread.
+        self.put_callback = put_callback
+
+        self.n_disconnections = 0
+
+        self._lock = Lock()
+        self._put_done = Condition(self._lock)
+        # (value, start time) of the asynchronous put in progress.
+        self._pending_put = None
+        self._last_put = None
+        # {"message", "timestamp"} of the last failed put.
+        self._last_error = None
+
+        self.pv = epics.PV(pv_name, connection_callback=self._connection_changed)
+
+    def _connection_changed(self, pvname=None, conn=None, **kwargs):
+        if conn:
+            _logger.info("Timing PV %s connected.", pvname)
+        else:
+            self.n_disconnections += 1
+            _logger.warning("Timing PV %s disconnected.", pvname)
+
+    def is_connected(self):
+        return bool(self.pv.connected)
+
+    def _check_connected(self, value):
+        if self.pv.wait_for_connection(timeout=self.put_timeout):
+            return True
+
+        self._put_failed("Cannot put %s, timing PV %s is not connected." % (value, self.pv_name))
+        return False
+
+    def _put_failed(self, message):
+        # Failed puts are not fatal, as with caput: the commands go on, the error is reported in the status.
+        _logger.warning(message)
+        self._last_error = {"message": message, "timestamp": time()}
+
+    def put(self, value):
+        # Returns False if the put did not complete.
+        if not self._check_connected(value):
+            return False
+
+        start_time = time()
+        try:
+            status = self.pv.put(value, wait=True, timeout=self.put_timeout)
+        except Exception as e:
+            self._put_failed("Put of %s to timing PV %s failed: %s" % (value, self.pv_name, e))
+            return False
+
+        if status is None or status < 0:
+            self._put_failed("Put of %s to timing PV %s did not complete in %s seconds." %
+                             (value, self.pv_name, self.put_timeout))
+            return False
+
+        self._last_put = {"value": value, "timestamp": start_time, "duration": time() - start_time}
+        return True
+
+    def put_async(self, value):
+        # Return as soon as the put is sent, wait_for_put waits for its completion. Returns False if not sent.
+        if not self._check_connected(value):
+            return False
+
+        with self._lock:
+            if self._pending_put is not None:
+                if time() - self._pending_put[1] > self.put_timeout:
+                    self._put_failed("Giving up the put of %s to timing PV %s, not completed in %s seconds." %
+                                     (self._pending_put[0], self.pv_name, self.put_timeout))
+                else:
+                    self._put_failed("Giving up the put of %s to timing PV %s, not completed before the put of %s."
+                                     % (self._pending_put[0], self.pv_name, value))
+
+            pending_put = self._pending_put = (value, time())
+
+        try:
+            self.pv.put(value, wait=False, use_complete=True, callback=partial(self._put_completed, pending_put))
+        except Exception as e:
+            with self._lock:
+                if self._pending_put is pending_put:
+                    self._pending_put = None
+            self._put_failed("Put of %s to timing PV %s failed: %s" % (value, self.pv_name, e))
+            return False
+
+        return True
+
+    def _put_completed(self, pending_put, pvname=None, **kwargs):
+        with self._lock:
+            # The put was given up, by wait_for_put or for a newer put.
+            if self._pending_put is not pending_put:
+                return
+
+            value, start_time = self._pending_put
+            self._pending_put = None
+            self._last_put = {"value": value, "timestamp": start_time, "duration": time() - start_time}
+
+            self._put_done.notify_all()
+
+        if self.put_callback is not None:
+            self.put_callback(value, time() - start_time)
+
+    def get_put_error(self):
+        # Error message if the asynchronous put is late, None otherwise.
+        with self._lock:
+            if self._pending_put is not None and time() - self._pending_put[1] > self.put_timeout:
+                return "Put of %s to timing PV %s did not complete in %s seconds." % \
+                       (self._pending_put[0], self.pv_name, self.put_timeout)
+
+        return None
+
+    def wait_for_put(self):
+        # Returns False if the put did not complete in time.
+        with self._put_done:
+            if self._pending_put is None:
+                return True
+
+            value, start_time = self._pending_put
+            remaining = start_time + self.put_timeout - time()
+
+            if self._put_done.wait_for(lambda: self._pending_put is None, timeout=max(remaining, 0)):
+                return True
+
+            self._pending_put = None
+
+        self._put_failed("Put of %s to timing PV %s did not complete in %s seconds." %
+                         (value, self.pv_name, self.put_timeout))
+        return False
+
+    def get_status(self):
+        with self._lock:
+            return {"pv_name": self.pv_name,
+                    "connected": self.is_connected(),
+                    "n_disconnections": self.n_disconnections,
+                    "put_pending": self._pending_put is not None,
+                    "last_put": self._last_put,
+                    "last_error": self._last_error}
@@ -0,0 +1,407 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from functools import partial
+from logging import getLogger
+from itertools import count
+from threading import Condition, Lock, get_ident, local
+from time import time
+
+_logger = getLogger(__name__)
+
+
+class ParallelCallTimeout(Exception):
+    pass
+
+
+class ParallelExecutionError(RuntimeError):
+    def __init__(self, message, errors):
+        # errors is a dictionary {key: exception}.
+        self.errors = errors
+
+        details = "".join("\n\t%s: %s" % (key, errors[key]) for key in sorted(errors, key=str))
+        super(ParallelExecutionError, self).__init__(message + details)
+
+
+class DeadlineExceeded(ParallelCallTimeout):
+    def __init__(self, timeout, detector=None, client=None, operation=None):
+        # The client call (or operation) that was in progress when the deadline passed.
+        self.timeout = timeout
+        self.detector = detector
+        self.client = client
+        self.operation = operation
+
+        message = "Deadline of %s seconds exceeded" % timeout
+        if client is not None:
+            message += " in %s %s" % (client, operation) if operation else " in %s" % client
+        elif operation is not None:
+            message += " while %s" % operation
+        if detector is not None:
+            message += " of detector %s" % detector
+
+        super(DeadlineExceeded, self).__init__(message + ".")
+
+    def to_dict(self):
+        return {"timeout": self.timeout,
+                "detector": self.detector,
+                "client": self.client,
+                "operation": self.operation}
+
+
+def get_deadline_errors(error):
+    # DeadlineExceeded errors contained in the error, looking into the (nested) ParallelExecutionError.
+    if isinstance(error, DeadlineExceeded):
+        return [error]
+
+    if isinstance(error, ParallelExecutionError):
+        return [deadline_error for key in sorted(error.errors, key=str)
+                for deadline_error in get_deadline_errors(error.errors[key])]
+
+    return []
+
+
+class Deadline(object):
+    # Time budget of a command. Client calls made through call check it before starting, and keep track of
+    # the calls in progress to name the one that went over budget.
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expiry = time() + timeout
+
+        self._lock = Lock()
+        self._call_ids = count()
+        # {call id: (start time, detector, client, operation)}
+        self._calls = {}
+
+    def remaining(self):
+        return self.expiry - time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def call(self, function, detector, client, operation, *args, **kwargs):
+        if self.expired():
+            raise DeadlineExceeded(self.timeout, detector, client, operation)
+
+        call_id = next(self._call_ids)
+        with self._lock:
+            self._calls[call_id] = (time(), detector, client, operation)
+
+        try:
+            return function(*args, **kwargs)
+
+        except DeadlineExceeded:
+            raise
+
+        except Exception as e:
+            # Most likely the failure comes from the budget cut short, report the deadline instead.
+            if self.expired():
+                raise DeadlineExceeded(self.timeout, detector, client, operation) from e
+            raise
+
+        finally:
+            with self._lock:
+                del self._calls[call_id]
+
+    def get_exceeded_error(self, key):
+        # Error for the parallel call with the given key (detector, client or (detector, client)), naming its
+        # oldest client call still in progress.
+        with self._lock:
+            calls = sorted(call for call in self._calls.values()
+                           if key in (call[1], call[2], (call[1], call[2])))
+
+        if calls:
+            return DeadlineExceeded(self.timeout, *calls[0][1:])
+
+        if isinstance(key, tuple):
+            return DeadlineExceeded(self.timeout, *key)
+
+        return DeadlineExceeded(self.timeout, detector=key)
+
+
+# Deadline of the command executed by the current thread, passed on to the threads of the parallel calls.
+_deadline_local = local()
+
+
+def get_current_deadline():
+    return getattr(_deadline_local, "deadline", None)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    # Run the block with the given deadline (None to run it without one).
+    previous_deadline = get_current_deadline()
+    _deadline_local.deadline = deadline
+
+    try:
+        yield deadline
+    finally:
+        _deadline_local.deadline = previous_deadline
+
+
+def call_with_deadline(function, detector, client, operation, *args, **kwargs):
+    deadline = get_current_deadline()
+
+    if deadline is None:
+        return function(*args, **kwargs)
+
+    return deadline.call(function, detector, client, operation, *args, **kwargs)
+
+
+def _call_in_deadline_scope(deadline, function):
+    with deadline_scope(deadline):
+        return function()
+
+
+def call_in_parallel(executor, calls, timeout=None, in_flight=None):
+    # calls is a dictionary {key: callable}. Returns (results, errors), each key ends up in exactly one of them.
+    # The timeout is overall: all the calls are waited for together, not each one for the full timeout.
+    # The calls inherit the deadline of the caller, and are not waited for after it.
+    # Calls that time out keep running in the executor. Callers repeating the same calls pass an in_flight
+    # dictionary {key: future}, so a key whose previous call is still running is reported instead of occupying
+    # another worker.
+    deadline = get_current_deadline()
+    wait_timeout = timeout
+
+    if deadline is not None:
+        calls = {key: partial(_call_in_deadline_scope, deadline, function) for key, function in calls.items()}
+        wait_timeout = max(deadline.remaining(), 0) if timeout is None else max(min(timeout, deadline.remaining()), 0)
+
+    results = {}
+    errors = {}
+
+    if in_flight is not None:
+        for key, future in list(in_flight.items()):
+            if future.done():
+                in_flight.pop(key, None)
+
+        for key in [key for key in calls if key in in_flight]:
+            calls = {other_key: function for other_key, function in calls.items() if other_key != key}
+            errors[key] = ParallelCallTimeout("Previous call is still running.")
+
+    futures = {key: executor.submit(function) for key, function in calls.items()}
+
+    wait(futures.values(), timeout=wait_timeout)
+
+    for key, future in futures.items():
+
+        if not future.done():
+            # Calls still waiting in the queue can be dropped, running ones are left to finish on their own.
+            if not future.cancel() and in_flight is not None:
+                in_flight[key] = future
+
+            if deadline is not None and deadline.expired():
+                errors[key] = deadline.get_exceeded_error(key)
+            else:
+                errors[key] = ParallelCallTimeout("Calls did not complete in %s seconds." % timeout)
+            continue
+
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            errors[key] = e
+
+    return results, errors
+
+
+def prefetch_file(filename):
+    # Ask the kernel to read the file into the page cache in the background. Returns False where not supported.
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+    return True
+
+
+def check_dependency_graph(steps):
+    # steps is a dictionary {name: dependencies}.
+    for name, dependencies in steps.items():
+        unknown_dependencies = [x for x in dependencies if x not in steps]
+        if unknown_dependencies:
+            raise ValueError("Step '%s' depends on unknown steps %s." % (name, unknown_dependencies))
+
+    resolved = set()
+    while len(resolved) < len(steps):
+        ready = [name for name, dependencies in steps.items()
+                 if name not in resolved and all(x in resolved for x in dependencies)]
+
+        if not ready:
+            raise ValueError("Circular dependency between steps %s." % sorted(set(steps) - resolved))
+
+        resolved.update(ready)
+
+
+def run_dependency_graph(steps, run_step):
+    # Run every step as soon as all its dependencies succeeded. Steps depending on a failed step are skipped.
+    # steps is a dictionary {name: dependencies}, run_step(name) executes a step. Returns {name: duration}.
+    check_dependency_graph(steps)
+
+    timings = {}
+    errors = {}
+    futures = {}
+
+    deadline = get_current_deadline()
+
+    def timed_step(name):
+        start_time = time()
+        with deadline_scope(deadline):
+            run_step(name)
+        timings[name] = time() - start_time
+
+    with ThreadPoolExecutor(max_workers=max(len(steps), 1)) as executor:
+
+        def submit_ready_steps():
+            for name, dependencies in steps.items():
+                if name in futures or name in errors:
+                    continue
+
+                failed_dependencies = [x for x in dependencies if x in errors]
+                if failed_dependencies:
+                    errors[name] = RuntimeError("Skipped because %s failed." % failed_dependencies)
+                    return True
+
+                if all(x in timings for x in dependencies):
+                    futures[name] = executor.submit(timed_step, name)
+
+            return False
+
+        while submit_ready_steps():
+            pass
+
+        running = set(futures.values())
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+
+            for name, future in futures.items():
+                if future in finished and future.exception() is not None:
+                    errors[name] = future.exception()
+
+            while submit_ready_steps():
+                pass
+
+            running = set(future for future in futures.values() if not future.done())
+
+    if errors:
+        raise ParallelExecutionError("Steps did not complete.", errors)
+
+    return timings
+
+
+class ReadWriteLock(object):
+    # Many readers or a single writer. Waiting writers have precedence over new readers.
+    # Both are reentrant, and the writer can also read - a read lock cannot be upgraded to a write lock.
+
+    def __init__(self):
+        self._condition = Condition()
+        # {thread id: number of read acquisitions}
+        self._readers = {}
+        self._writer = None
+        self._n_writes = 0
+        self._n_waiting_writers = 0
+
+    def acquire_read(self, blocking=True, timeout=None):
+        thread_id = get_ident()
+
+        with self._condition:
+            if self._writer == thread_id or thread_id in self._readers:
+                self._readers[thread_id] = self._readers.get(thread_id, 0) + 1
+                return True
+
+            if not self._condition.wait_for(lambda: self._writer is None and not self._n_waiting_writers,
+                                            timeout=timeout if blocking else 0):
+                return False
+
+            self._readers[thread_id] = 1
+            return True
+
+    def release_read(self):
+        thread_id = get_ident()
+
+        with self._condition:
+            self._readers[thread_id] -= 1
+            if not self._readers[thread_id]:
+                del self._readers[thread_id]
+
+            self._condition.notify_all()
+
+    def acquire_write(self, blocking=True, timeout=None):
+        thread_id = get_ident()
+
+        with self._condition:
+            if self._writer == thread_id:
+                self._n_writes += 1
+                return True
+
+            if thread_id in self._readers:
+                raise RuntimeError("Cannot acquire the write lock while holding the read lock.")
+
+            self._n_waiting_writers += 1
+            try:
+                acquired = self._condition.wait_for(lambda: self._writer is None and not self._readers,
+                                                    timeout=timeout if blocking else 0)
+            finally:
+                self._n_waiting_writers -= 1
+
+            if not acquired:
+                # Readers may have been waiting for this writer.
+                self._condition.notify_all()
+                return False
+
+            self._writer = thread_id
+            self._n_writes = 1
+            return True
+
+    def release_write(self):
+        with self._condition:
+            self._n_writes -= 1
+            if not self._n_writes:
+                self._writer = None
+
+            self._condition.notify_all()
+
+
+class SingleFlight(object):
+    # Concurrent calls with the same key share a single execution: the first caller runs the function,
+    # the ones arriving while it runs wait for it and get the same result (or exception).
+
+    def __init__(self):
+        self._lock = Lock()
+        # {key: Future of the call in flight}
+        self._calls = {}
+
+        self.n_calls = 0
+        self.n_shared_calls = 0
+
+    def call(self, key, function, *args, **kwargs):
+        with self._lock:
+            self.n_calls += 1
+
+            future = self._calls.get(key)
+            is_leader = future is None
+
+            if is_leader:
+                future = self._calls[key] = Future()
+            else:
+                self.n_shared_calls += 1
+
+        if is_leader:
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+        return future.result()
+
+    def get_statistics(self):
+        with self._lock:
+            return {"n_calls": self.n_calls,
+                    "n_shared_calls": self.n_shared_calls,
+                    "in_flight": sorted(self._calls, key=str)}
@@ -1,8 +1,18 @@
+import json
+import os
+import shutil
 from enum import Enum
+from itertools import product
 from logging import getLogger
 
 from detector_integration_api.utils import ClientDisableWrapper
 
+# Optional, without it the shape of the pedestal and gain files is not checked.
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
 _logger = getLogger(__name__)
 
 
@@ -33,163 +43,447 @@ FILE_FORMAT_INPUT_PARAMETERS = {
 }
 
 
-def validate_writer_config(configuration):
-    if not configuration:
-        raise ValueError("Writer configuration cannot be empty.")
+# Root sections of the acquisition config.
+CONFIG_SECTIONS = ("writer", "backend", "detector", "bsread")
+
+# Declarative config schemas, compiled once by compile_config_schema. "mandatory" parameters must be present,
+# "types" are mandatory parameters of the given type and "ranges" the [min, max] of numeric parameters.
+# Without "allow_unexpected", any other parameter is rejected.
+CONFIG_SCHEMAS = {
+    "writer": {"title": "Writer",
+               "mandatory": MANDATORY_WRITER_CONFIG_PARAMETERS,
+               "types": FILE_FORMAT_INPUT_PARAMETERS,
+               "ranges": {"user_id": E_ACCOUNT_USER_ID_RANGE},
+               "allow_unexpected": False},
+    "backend": {"title": "Backend",
+                "mandatory": MANDATORY_BACKEND_CONFIG_PARAMETERS,
+                "allow_unexpected": True},
+    "detector": {"title": "Detector",
+                 "mandatory": MANDATORY_DETECTOR_CONFIG_PARAMETERS,
+                 "allow_unexpected": True},
+    "bsread": {"title": "Bsread",
+               "mandatory": MANDATORY_BSREAD_CONFIG_PARAMETERS,
+               "types": FILE_FORMAT_INPUT_PARAMETERS,
+               "ranges": {"user_id": E_ACCOUNT_USER_ID_RANGE},
+               "allow_unexpected": True},
+}
 
-    writer_cfg_params = MANDATORY_WRITER_CONFIG_PARAMETERS + list(FILE_FORMAT_INPUT_PARAMETERS.keys())
+# Parameters of different sections that must be equal, ((section, parameter), (section, parameter)).
+CONFIG_DEPENDENCIES = [(("backend", "bit_depth"), ("detector", "dr")),
+                       (("backend", "n_frames"), ("detector", "cycles")),
+                       (("backend", "n_frames"), ("writer", "n_frames"))]
 
-    # Check if all mandatory parameters are present.
-    if not all(x in configuration for x in writer_cfg_params):
-        missing_parameters = [x for x in writer_cfg_params if x not in configuration]
-        raise ValueError("Writer configuration missing mandatory parameters: %s" % missing_parameters)
 
-    unexpected_parameters = [x for x in configuration.keys() if x not in writer_cfg_params]
-    if unexpected_parameters:
-        raise ValueError("Received unexpected parameters for writer: %s" % unexpected_parameters)
+class ConfigValidationError(ValueError):
+    def __init__(self, errors):
+        # errors is the list of problems found in the config.
+        self.errors = errors
 
-    # Check if all format parameters are of correct type.
-    wrong_parameter_types = ""
-    for parameter_name, parameter_type in FILE_FORMAT_INPUT_PARAMETERS.items():
-        if not isinstance(configuration[parameter_name], parameter_type):
-            wrong_parameter_types += "\tWriter parameter '%s' expected of type '%s', but received of type '%s'.\n" % \
-                                     (parameter_name, parameter_type, type(configuration[parameter_name]))
+        if len(errors) == 1:
+            message = errors[0]
+        else:
+            message = "Invalid config, %d problems:%s" % (len(errors), "".join("\n\t" + x for x in errors))
 
-    if wrong_parameter_types:
-        raise ValueError("Received parameters of invalid type:\n%s", wrong_parameter_types)
+        super(ConfigValidationError, self).__init__(message)
 
-    user_id = configuration["user_id"]
-    if user_id < E_ACCOUNT_USER_ID_RANGE[0] or user_id > E_ACCOUNT_USER_ID_RANGE[1]:
-        raise ValueError("Provided user_id %d outside of specified range [%d-%d]." % (user_id,
-                                                                                      E_ACCOUNT_USER_ID_RANGE[0],
-                                                                                      E_ACCOUNT_USER_ID_RANGE[1]))
 
+def compile_config_schema(section, schema):
+    # Returns a function checking a config section against the schema, returning the list of all its problems.
+    title = schema["title"]
+    types = tuple(sorted(schema.get("types", {}).items()))
+    ranges = tuple(sorted(schema.get("ranges", {}).items()))
+    mandatory = tuple(schema["mandatory"]) + tuple(name for name, _ in types if name not in schema["mandatory"])
+    allowed = None if schema.get("allow_unexpected") else frozenset(mandatory)
 
-def validate_backend_config(configuration):
-    if not configuration:
-        raise ValueError("Backend configuration cannot be empty.")
+    def check_config(configuration):
+        if not configuration:
+            return ["%s configuration cannot be empty." % title]
 
-    if not all(x in configuration for x in MANDATORY_BACKEND_CONFIG_PARAMETERS):
-        missing_parameters = [x for x in MANDATORY_BACKEND_CONFIG_PARAMETERS if x not in configuration]
-        raise ValueError("Backend configuration missing mandatory parameters: %s" % missing_parameters)
+        if not isinstance(configuration, dict):
+            return ["%s configuration must be a dictionary, but received '%s'." % (title, configuration)]
 
+        errors = []
 
-def validate_detector_config(configuration):
-    if not configuration:
-        raise ValueError("Detector configuration cannot be empty.")
+        missing_parameters = [x for x in mandatory if x not in configuration]
+        if missing_parameters:
+            errors.append("%s configuration missing mandatory parameters: %s" % (title, missing_parameters))
 
-    if not all(x in configuration for x in MANDATORY_DETECTOR_CONFIG_PARAMETERS):
-        missing_parameters = [x for x in MANDATORY_DETECTOR_CONFIG_PARAMETERS if x not in configuration]
-        raise ValueError("Detector configuration missing mandatory parameters: %s" % missing_parameters)
+        if allowed is not None:
+            unexpected_parameters = [x for x in configuration if x not in allowed]
+            if unexpected_parameters:
+                errors.append("Received unexpected parameters for %s: %s" % (section, unexpected_parameters))
 
+        for parameter_name, parameter_type in types:
+            if parameter_name in configuration and not isinstance(configuration[parameter_name], parameter_type):
+                errors.append("%s parameter '%s' expected of type '%s', but received of type '%s'." %
+                              (title, parameter_name, parameter_type, type(configuration[parameter_name])))
 
-def validate_bsread_config(configuration):
-    if not configuration:
-        raise ValueError("Writer configuration cannot be empty.")
+        for parameter_name, (min_value, max_value) in ranges:
+            if parameter_name not in configuration:
+                continue
+
+            value = configuration[parameter_name]
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                errors.append("%s parameter '%s' expected a number, but received '%s'." %
+                              (title, parameter_name, value))
+            elif not min_value <= value <= max_value:
+                errors.append("Provided %s %d outside of specified range [%d-%d]." %
+                              (parameter_name, value, min_value, max_value))
+
+        return errors
+
+    return check_config
+
+
+_config_checks = {section: compile_config_schema(section, schema) for section, schema in CONFIG_SCHEMAS.items()}
+
+
+def check_config_dependencies(config):
+    # config is a dictionary {section: configuration}. Missing sections and parameters are left to the schemas.
+    errors = []
+
+    for (section, parameter_name), (other_section, other_parameter_name) in CONFIG_DEPENDENCIES:
+        configuration = config.get(section)
+        other_configuration = config.get(other_section)
+
+        if not isinstance(configuration, dict) or not isinstance(other_configuration, dict) or \
+                parameter_name not in configuration or other_parameter_name not in other_configuration:
+            continue
+
+        if configuration[parameter_name] != other_configuration[other_parameter_name]:
+            errors.append("Invalid config. %s '%s' set to '%s', but %s '%s' set to '%s'. They must be equal." %
+                          (section.capitalize(), parameter_name, configuration[parameter_name],
+                           other_section, other_parameter_name, other_configuration[other_parameter_name]))
+
+    return errors
+
+
+def get_config_errors(config, sections=CONFIG_SECTIONS, detector_overrides=None):
+    # All the problems of the acquisition config, in one pass. Only the given sections are checked (the ones of the
+    # enabled clients). detector_overrides is a dictionary {detector: {section: parameters}} of the per detector
+    # parameters added to the config, the sections with overrides are checked again for those detectors.
+    if set(config) != set(CONFIG_SECTIONS):
+        return ["Specify config JSON with 4 root elements: 'writer', 'backend', 'detector', 'bsread'."]
+
+    errors = [error for section in CONFIG_SECTIONS if section in sections
+              for error in _config_checks[section](config[section])]
+    errors += check_config_dependencies(config)
+
+    for detector, overrides in sorted((detector_overrides or {}).items()):
+        overrides = {section: parameters for section, parameters in overrides.items()
+                     if parameters and isinstance(config.get(section), dict)}
+        if not overrides:
+            continue
+
+        detector_config = {section: dict(config[section], **overrides[section]) if section in overrides
+                           else config[section] for section in CONFIG_SECTIONS}
+
+        detector_errors = [error for section in CONFIG_SECTIONS if section in sections and section in overrides
+                           for error in _config_checks[section](detector_config[section])]
+        detector_errors += check_config_dependencies(detector_config)
 
-    bsread_cfg_params = MANDATORY_BSREAD_CONFIG_PARAMETERS + list(FILE_FORMAT_INPUT_PARAMETERS.keys())
+        # Only the problems coming from the overrides.
+        errors += ["(%s) %s" % (detector, error) for error in detector_errors if error not in errors]
 
-    # Check if all mandatory parameters are present.
-    if not all(x in configuration for x in bsread_cfg_params):
-        missing_parameters = [x for x in bsread_cfg_params if x not in configuration]
-        raise ValueError("Bsread configuration missing mandatory parameters: %s" % missing_parameters)
+    return errors
 
-#    unexpected_parameters = [x for x in configuration.keys() if x not in bsread_cfg_params]
-#    if unexpected_parameters:
-#        raise ValueError("Received unexpected parameters for bsread: %s" % unexpected_parameters)
 
-    # Check if all format parameters are of correct type.
-    wrong_parameter_types = ""
-    for parameter_name, parameter_type in FILE_FORMAT_INPUT_PARAMETERS.items():
-        if not isinstance(configuration[parameter_name], parameter_type):
-            wrong_parameter_types += "\tBsread parameter '%s' expected of type '%s', but received of type '%s'.\n" % \
-                                     (parameter_name, parameter_type, type(configuration[parameter_name]))
+def validate_config(config, sections=CONFIG_SECTIONS, detector_overrides=None):
+    errors = get_config_errors(config, sections, detector_overrides)
 
-    if wrong_parameter_types:
-        raise ValueError("Received parameters of invalid type:\n%s", wrong_parameter_types)
+    if errors:
+        raise ConfigValidationError(errors)
 
-    user_id = configuration["user_id"]
-    if user_id < E_ACCOUNT_USER_ID_RANGE[0] or user_id > E_ACCOUNT_USER_ID_RANGE[1]:
-        raise ValueError("Provided user_id %d outside of specified range [%d-%d]." % (user_id,
-                                                                                      E_ACCOUNT_USER_ID_RANGE[0],
-                                                                                      E_ACCOUNT_USER_ID_RANGE[1]))
+
+def _validate_section(section, configuration):
+    errors = _config_checks[section](configuration)
+
+    if errors:
+        raise ConfigValidationError(errors)
+
+
+def validate_writer_config(configuration):
+    _validate_section("writer", configuration)
+
+
+def validate_backend_config(configuration):
+    _validate_section("backend", configuration)
+
+
+def validate_detector_config(configuration):
+    _validate_section("detector", configuration)
+
+
+def validate_bsread_config(configuration):
+    _validate_section("bsread", configuration)
 
 
 def validate_configs_dependencies(writer_config, backend_config, detector_config, bsread_config):
-    if backend_config["bit_depth"] != detector_config["dr"]:
-        raise ValueError("Invalid config. Backend 'bit_depth' set to '%s', but detector 'dr' set to '%s'."
-                         " They must be equal."
-                         % (backend_config["bit_depth"], detector_config["dr"]))
+    errors = check_config_dependencies({"writer": writer_config, "backend": backend_config,
+                                        "detector": detector_config, "bsread": bsread_config})
 
-    if backend_config["n_frames"] != detector_config["cycles"]:
-        raise ValueError("Invalid config. Backend 'n_frames' set to '%s', but detector 'cycles' set to '%s'. "
-                         "They must be equal." % (backend_config["n_frames"], detector_config["cycles"]))
+    if errors:
+        raise ConfigValidationError(errors)
 
-    if writer_config["n_frames"] != backend_config["n_frames"]:
-        raise ValueError("Invalid config. Backend 'n_frames' set to '%s', but writer 'n_frames' set to '%s'. "
-                         "They must be equal." % (backend_config["n_frames"], writer_config["n_frames"]))
 
+# Jungfrau module size, each pixel takes dr / 8 bytes.
+MODULE_SHAPE = (512, 1024)
+MODULE_N_PIXELS = MODULE_SHAPE[0] * MODULE_SHAPE[1]
 
-def interpret_status(statuses):
+# Frame rate of the detectors, given by the timing system.
+DEFAULT_TIMING_RATE = 100
 
-    #_logger.debug("Interpreting statuses: %s", statuses)
+# What to do with the problems found by the capacity and corrections files checks: nothing, log a warning or
+# reject the config.
+CHECK_OFF = "off"
+CHECK_WARN = "warn"
+CHECK_REJECT = "reject"
+CHECK_MODES = (CHECK_OFF, CHECK_WARN, CHECK_REJECT)
+DEFAULT_CAPACITY_CHECK = CHECK_WARN
+DEFAULT_CORRECTIONS_CHECK = CHECK_WARN
 
-    bsread = statuses["bsread"]
-    
-    def cmp(status, expected_value):
+# Backend parameters of the corrections files, with the datasets covering all the modules in their last 2 dimensions.
+CORRECTIONS_FILES = (("pede_corrections_filename", "Pedestal", ("gains", "pixel_mask")),
+                     ("gain_corrections_filename", "Gain", ("gains",)))
 
-        #_logger.debug("Comparing status '%s' with expected status '%s'.", status, expected_value)
+MEGABYTE = 1000 ** 2
+GIGABYTE = 1000 ** 3
 
-        if status == ClientDisableWrapper.STATUS_DISABLED:
-            return True
 
-        if isinstance(expected_value, (tuple, list)):
-            return status in expected_value
-        else:
-            return status == expected_value
+def get_capacity_report(detector_configs, n_modules, timing_rate, writer_bandwidth=None, disk_bandwidth=None):
+    # Expected data rate and file size of every detector and in total, compared with the bandwidth of a writer,
+    # the disk bandwidth of the node (bytes/s, None to skip) and the free space on the output filesystems.
+    # detector_configs is a dictionary {detector: (detector config, backend config, writer config)} as sent to the
+    # clients, n_modules a dictionary {detector: number of modules}. Detectors without n_modules are left out.
+    detectors = {}
+    problems = []
 
-    detector_status = set()
+    for detector, (detector_config, _, writer_config) in sorted(detector_configs.items()):
+        if n_modules.get(detector) is None:
+            continue
 
-    for key in statuses.keys():
-        if key == "bsread":
+        try:
+            frame_size = n_modules[detector] * MODULE_N_PIXELS * int(detector_config["dr"]) // 8
+            n_frames = int(detector_config["cycles"])
+            exptime = float(detector_config["exptime"])
+        except (KeyError, TypeError, ValueError) as e:
+            problems.append("(%s) Cannot compute the data rate: invalid detector config %s." % (detector, e))
             continue
-        writer = statuses[key]["writer"]
-        backend = statuses[key]["backend"]
-        detector = statuses[key]["detector"]
 
-        # If no other conditions match.
-        interpreted_status = IntegrationStatus.ERROR
+        data_rate = frame_size * timing_rate
+
+        detectors[detector] = {"n_modules": n_modules[detector],
+                               "frame_size": frame_size,
+                               "data_rate": data_rate,
+                               "file_size": frame_size * n_frames,
+                               "output_file": writer_config.get("output_file")}
+
+        if exptime > 1 / timing_rate:
+            problems.append("(%s) Detector 'exptime' %s s longer than the timing period of %s s." %
+                            (detector, exptime, 1 / timing_rate))
+
+        if writer_bandwidth and data_rate > writer_bandwidth:
+            problems.append("(%s) Data rate of %.1f MB/s over the writer bandwidth of %.1f MB/s." %
+                            (detector, data_rate / MEGABYTE, writer_bandwidth / MEGABYTE))
+
+    data_rate = sum(x["data_rate"] for x in detectors.values())
+
+    if disk_bandwidth and data_rate > disk_bandwidth:
+        problems.append("Total data rate of %.1f MB/s over the disk bandwidth of %.1f MB/s." %
+                        (data_rate / MEGABYTE, disk_bandwidth / MEGABYTE))
+
+    filesystems = _get_filesystems_usage(detectors, problems)
+
+    for filesystem in filesystems:
+        if filesystem["required"] > filesystem["free"]:
+            problems.append("Files of detectors %s need %.1f GB on %s, but only %.1f GB are free." %
+                            (filesystem["detectors"], filesystem["required"] / GIGABYTE, filesystem["path"],
+                             filesystem["free"] / GIGABYTE))
 
-        if cmp(writer, "stopped") and cmp(detector, "idle") and cmp(backend, "INITIALIZED") and cmp(bsread, "stopped"):
-            interpreted_status = IntegrationStatus.INITIALIZED
+    return {"timing_rate": timing_rate,
+            "detectors": detectors,
+            "data_rate": data_rate,
+            "file_size": sum(x["file_size"] for x in detectors.values()),
+            "filesystems": filesystems,
+            "problems": problems}
 
-        elif cmp(writer, "stopped") and cmp(detector, "idle") and cmp(backend, "CONFIGURED") and cmp(bsread, "configured"):
-            interpreted_status = IntegrationStatus.CONFIGURED
 
-        elif cmp(writer, ("receiving", "writing")) and cmp(detector, ("running", "waiting")) and \
-                cmp(backend, "OPEN") and cmp(bsread, ("receiving", "configured", "stopped")):
-            interpreted_status = IntegrationStatus.RUNNING
+def _get_filesystems_usage(detectors, problems):
+    # Space required by the output files on each filesystem, with the free space. Output files whose filesystem cannot
+    # be inspected are reported in problems and left out.
+    filesystems = {}
 
-        elif cmp(writer, ("receiving", "writing")) and cmp(detector, "idle") and \
-                cmp(backend, "OPEN") and cmp(bsread, ("receiving", "configured", "stopped")):
-            interpreted_status = IntegrationStatus.DETECTOR_STOPPED
+    for detector, report in sorted(detectors.items()):
+        output_file = report["output_file"]
+        if not output_file or output_file == "/dev/null":
+            continue
+
+        # The output directory is created by the writer, look at the closest existing one.
+        path = os.path.dirname(os.path.abspath(output_file))
+        while not os.path.isdir(path):
+            path = os.path.dirname(path)
+
+        try:
+            device = os.stat(path).st_dev
+            if device not in filesystems:
+                filesystems[device] = {"path": path, "required": 0, "free": shutil.disk_usage(path).free,
+                                       "detectors": []}
+
+        except OSError as e:
+            problems.append("(%s) Cannot check the free space for %s: %s" % (detector, output_file, e))
+            continue
+
+        filesystems[device]["required"] += report["file_size"]
+        filesystems[device]["detectors"].append(detector)
+
+    return sorted(filesystems.values(), key=lambda x: x["path"])
+
+
+def get_corrections_files(backend_config):
+    # Pedestal and gain files of a per detector backend config, [(parameter name, filename)].
+    return [(parameter_name, backend_config[parameter_name]) for parameter_name, _, _ in CORRECTIONS_FILES
+            if backend_config.get(parameter_name)]
+
+
+def get_corrections_problems(detector_configs, n_modules):
+    # Check that the pedestal and gain files exist, are readable and cover the modules of the detector (with h5py).
+    # detector_configs is a dictionary {detector: (detector config, backend config, writer config)} as sent to the
+    # clients, n_modules a dictionary {detector: number of modules}.
+    problems = []
+
+    for detector, (_, backend_config, _) in sorted(detector_configs.items()):
+        for parameter_name, title, datasets in CORRECTIONS_FILES:
+            filename = backend_config.get(parameter_name)
+            if not filename:
+                continue
+
+            problem = _check_corrections_file(filename, datasets, n_modules.get(detector))
+            if problem:
+                problems.append("(%s) %s file %s %s" % (detector, title, filename, problem))
+
+    return problems
+
+
+def _check_corrections_file(filename, datasets, n_modules):
+    if not os.path.isfile(filename):
+        return "does not exist."
+
+    if not os.access(filename, os.R_OK):
+        return "is not readable."
+
+    if h5py is None or n_modules is None:
+        return None
+
+    expected_shape = (MODULE_SHAPE[0] * n_modules, MODULE_SHAPE[1])
+
+    try:
+        with h5py.File(filename, "r") as input_file:
+            for dataset in datasets:
+                if dataset not in input_file:
+                    return "has no dataset '%s'." % dataset
+
+                shape = input_file[dataset].shape
+                if tuple(shape[-2:]) != expected_shape:
+                    return "has dataset '%s' of shape %s, expected %s for %d modules." % \
+                           (dataset, shape, expected_shape, n_modules)
+
+    except OSError as e:
+        return "cannot be read: %s" % e
+
+    return None
+
+
+# Rules to interpret the client statuses of one detector, checked in order. A rule lists the accepted statuses of each
+# client. Disabled clients match any rule, unless the client is listed in the rule "required" clients.
+STATUS_RULES = [
+    {"status": "INITIALIZED", "writer": ["stopped"], "detector": ["idle"], "backend": ["INITIALIZED"],
+     "bsread": ["stopped"]},
+    {"status": "CONFIGURED", "writer": ["stopped"], "detector": ["idle"], "backend": ["CONFIGURED"],
+     "bsread": ["configured"]},
+    {"status": "RUNNING", "writer": ["receiving", "writing"], "detector": ["running", "waiting"], "backend": ["OPEN"],
+     "bsread": ["receiving", "configured", "stopped"]},
+    {"status": "DETECTOR_STOPPED", "writer": ["receiving", "writing"], "detector": ["idle"], "backend": ["OPEN"],
+     "bsread": ["receiving", "configured", "stopped"]},
+    {"status": "BSREAD_STILL_RUNNING", "writer": ["finished", "stopped"], "detector": ["idle"], "backend": ["OPEN"],
+     "bsread": ["receiving"], "required": ["bsread"]},
+    {"status": "FINISHED", "writer": ["finished", "stopped"], "detector": ["idle"], "backend": ["OPEN"],
+     "bsread": ["stopped"]},
+]
+
+STATUS_RULE_CLIENTS = ("writer", "detector", "backend", "bsread")
+
+_status_table = {}
+
+
+def compile_status_rules(rules):
+    # Expand the rules into a table {(writer, detector, backend, bsread): IntegrationStatus}. The first matching rule wins.
+    table = {}
+
+    for rule in rules:
+        status = IntegrationStatus[rule["status"]]
+
+        accepted_statuses = []
+        for client in STATUS_RULE_CLIENTS:
+            client_statuses = list(rule[client])
+            if client not in rule.get("required", []):
+                client_statuses.append(ClientDisableWrapper.STATUS_DISABLED)
+            accepted_statuses.append(client_statuses)
+
+        for key in product(*accepted_statuses):
+            table.setdefault(key, status)
+
+    return table
+
+
+def load_status_rules(filename):
+    # Rules from the file (same format as STATUS_RULES) are checked before the default ones.
+    with open(filename) as input_file:
+        rules = json.load(input_file)
+
+    set_status_rules(rules + STATUS_RULES)
+
+
+def set_status_rules(rules):
+    global _status_table
+
+    _status_table = compile_status_rules(rules)
+    _logger.info("Status interpretation table compiled from %d rules into %d entries.", len(rules), len(_status_table))
+
+
+set_status_rules(STATUS_RULES)
+
+
+def interpret_status(statuses):
+    return interpret_status_breakdown(statuses)[0]
+
+
+def interpret_status_breakdown(statuses):
+    # Returns the overall status and a breakdown: the status of each detector and the client statuses of the ones in error.
+    bsread = statuses["bsread"]
+
+    detector_status = {}
+    errors = {}
+
+    for key, clients in statuses.items():
+        if key == "bsread":
+            continue
 
-        elif cmp(writer, ("finished", "stopped")) and cmp(detector, "idle") and \
-                cmp(backend, "OPEN") and \
-                cmp(bsread, "receiving") and bsread != ClientDisableWrapper.STATUS_DISABLED:
-            interpreted_status = IntegrationStatus.BSREAD_STILL_RUNNING
+        interpreted_status = _status_table.get((clients["writer"], clients["detector"], clients["backend"], bsread),
+                                               IntegrationStatus.ERROR)
+        detector_status[key] = interpreted_status
 
-        elif cmp(writer, ("finished", "stopped")) and cmp(detector, "idle") and cmp(backend, "OPEN") \
-                and cmp(bsread, "stopped"):
-            interpreted_status = IntegrationStatus.FINISHED
+        if interpreted_status == IntegrationStatus.ERROR:
+            errors[key] = {"writer": clients["writer"], "detector": clients["detector"], "backend": clients["backend"],
+                           "bsread": bsread}
 
-        #_logger.debug("Statuses interpreted as '%s' for detector %s .", interpreted_status, key)
+    distinct_statuses = set(detector_status.values())
+    resulting_status = distinct_statuses.pop() if len(distinct_statuses) == 1 else IntegrationStatus.INCONSISTENT
 
-        detector_status.add(interpreted_status)
+    breakdown = {"status": str(resulting_status),
+                 "detectors": {key: str(value) for key, value in detector_status.items()},
+                 "errors": errors}
 
-    resulting_status = list(detector_status)[0] if len(detector_status) == 1 else IntegrationStatus.INCONSISTENT
-    
     if resulting_status == IntegrationStatus.INCONSISTENT or resulting_status == IntegrationStatus.ERROR:
-        _logger.debug("Bad overall status : %s . Full status : '%s' (interpreted from %s)", resulting_status, detector_status, statuses)         
+        _logger.debug("Bad overall status : %s . Breakdown : %s", resulting_status, breakdown)
 
-    return resulting_status
+    return resulting_status, breakdown
@@ -0,0 +1,68 @@
+import logging
+
+import bottle
+
+from common import get_argument_parser, simulate_response_time, run_server
+
+_logger = logging.getLogger(__name__)
+
+# Allowed transitions of the backend state machine {command: (allowed states, new state)}.
+TRANSITIONS = {"configure": (("INITIALIZED",), "CONFIGURED"),
+               "open": (("CONFIGURED",), "OPEN"),
+               "close": (("OPEN",), "CONFIGURED"),
+               "reset": (("INITIALIZED", "CONFIGURED", "OPEN"), "INITIALIZED")}
+
+
+def create_app(arguments):
+    app = bottle.Bottle()
+    state = {"global_state": "INITIALIZED", "config": {}, "n_opened": 0}
+
+    @app.get("/v1/state")
+    @app.get("/v1/state/")
+    def get_state():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": "ok", "global_state": state["global_state"]}
+
+    @app.post("/v1/state/<command>")
+    def command(command):
+        simulate_response_time(arguments)
+
+        if command not in TRANSITIONS:
+            return {"state": "error", "status": "Unknown command '%s'." % command}
+
+        allowed_states, new_state = TRANSITIONS[command]
+        if state["global_state"] not in allowed_states:
+            return {"state": "error", "status": "Cannot %s in state %s." % (command, state["global_state"])}
+
+        if command == "configure":
+            state["config"] = (bottle.request.json or {}).get("settings", {})
+        if command == "open":
+            state["n_opened"] += 1
+
+        _logger.info("Backend %s: %s -> %s", command, state["global_state"], new_state)
+        state["global_state"] = new_state
+
+        return {"state": "ok", "status": "ok", "global_state": new_state}
+
+    @app.get("/v1/configuration")
+    def get_configuration():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": "ok", "configuration": state["config"]}
+
+    @app.get("/v1/metrics")
+    def get_metrics():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": "ok", "metrics": {"n_opened": state["n_opened"]}}
+
+    return app
+
+
+def main():
+    parser = get_argument_parser("Simulated detector backend REST API.", 8080)
+    arguments = parser.parse_args()
+
+    run_server(create_app(arguments), arguments)
+
+
+if __name__ == "__main__":
+    main()
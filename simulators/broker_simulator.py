@@ -0,0 +1,70 @@
+import logging
+from time import time
+
+import bottle
+
+from common import get_argument_parser, simulate_response_time, run_server
+
+_logger = logging.getLogger(__name__)
+
+
+def create_app(arguments):
+    # Once configured, the broker starts receiving after start_delay and stops by itself after run_time.
+    app = bottle.Bottle()
+    state = {"configured_time": None, "parameters": {}, "n_runs": 0}
+
+    def get_status():
+        if state["configured_time"] is None:
+            return "stopped"
+
+        elapsed_time = time() - state["configured_time"]
+        if elapsed_time < arguments.start_delay:
+            return "configured"
+        if elapsed_time < arguments.start_delay + arguments.run_time:
+            return "receiving"
+
+        return "stopped"
+
+    @app.get("/status")
+    def status():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": get_status()}
+
+    @app.post("/parameters")
+    def parameters():
+        simulate_response_time(arguments)
+
+        state["parameters"] = bottle.request.json or {}
+        state["configured_time"] = time()
+        state["n_runs"] += 1
+
+        _logger.info("Broker configured with %s", state["parameters"])
+        return {"state": "ok", "status": get_status()}
+
+    @app.get("/stop")
+    @app.get("/kill")
+    def stop():
+        simulate_response_time(arguments)
+        state["configured_time"] = None
+        return {"state": "ok", "status": "stopped"}
+
+    @app.get("/statistics")
+    def statistics():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": get_status(), "n_runs": state["n_runs"]}
+
+    return app
+
+
+def main():
+    parser = get_argument_parser("Simulated bsread/databuffer broker REST API.", 10002)
+    parser.add_argument("--start_delay", type=float, default=1.0,
+                        help="Seconds after the parameters are set before the broker is receiving.")
+    parser.add_argument("--run_time", type=float, default=1.0, help="Seconds the broker is receiving.")
+    arguments = parser.parse_args()
+
+    run_server(create_app(arguments), arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+import logging
+import random
+from time import sleep
+
+import bottle
+
+
+def get_argument_parser(description, default_port):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-i", "--interface", default="127.0.0.1", help="Hostname interface to bind to.")
+    parser.add_argument("-p", "--port", type=int, default=default_port, help="Server port.")
+    parser.add_argument("--response_time", type=float, default=0.01, help="Mean response time in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the response time.")
+    parser.add_argument("--log_level", default="WARNING",
+                        choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help="Log level to use.")
+
+    return parser
+
+
+def simulate_response_time(arguments):
+    sleep(max(0, random.gauss(arguments.response_time, arguments.jitter)))
+
+
+def run_server(app, arguments):
+    logging.basicConfig(level=arguments.log_level, format='[%(levelname)s] %(message)s')
+
+    bottle.run(app=app, host=arguments.interface, port=arguments.port, quiet=True)
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import sleep
+
+SIMULATORS_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(SIMULATORS_DIRECTORY)
+
+
+def write_config_directory(config_directory, n_detectors, backend_base_port, writer_base_port):
+    available_detectors = {}
+
+    for index in range(n_detectors):
+        detector = "JF%02d" % index
+        available_detectors[detector] = {"detector_id": index,
+                                         "backend_api_url": "http://127.0.0.1:%d" % (backend_base_port + index),
+                                         "backend_stream_url": "tcp://127.0.0.1:%d" % (40000 + index),
+                                         "writer_port": writer_base_port + index,
+                                         "n_modules": 1,
+                                         "n_bad_modules": 0}
+
+        os.makedirs(os.path.join(config_directory, detector), exist_ok=True)
+        open(os.path.join(config_directory, detector, "detector.config"), "w").close()
+
+    with open(os.path.join(config_directory, "available_detectors.json"), "w") as output_file:
+        json.dump(available_detectors, output_file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the DIA against N simulated detectors on this machine.")
+    parser.add_argument("-n", "--n_detectors", type=int, default=4, help="Number of simulated detectors.")
+    parser.add_argument("-p", "--port", type=int, default=10000, help="DIA REST API port.")
+    parser.add_argument("--backend_base_port", type=int, default=18080, help="Port of the first backend.")
+    parser.add_argument("--writer_base_port", type=int, default=11001, help="Port of the first writer.")
+    parser.add_argument("--broker_port", type=int, default=10002, help="Port of the broker.")
+    parser.add_argument("--response_time", type=float, default=0.01, help="Mean response time of the services.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the response time.")
+    parser.add_argument("--frame_rate", type=float, default=100, help="Frames per second written by the writers.")
+    parser.add_argument("--broker_start_delay", type=float, default=1.0,
+                        help="Seconds after configuration before the broker is receiving.")
+    parser.add_argument("--broker_run_time", type=float, default=1.0, help="Seconds the broker is receiving.")
+    parser.add_argument("--timing_pv", default="SIM-TIMING:SoftEvt-EvtCode-SP", help="Simulated timing PV.")
+    parser.add_argument("--no_timing_ioc", action="store_true",
+                        help="Do not start the timing soft IOC (needs pcaspy).")
+    parser.add_argument("--log_level", default="INFO",
+                        choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help="Log level of the DIA.")
+    arguments = parser.parse_args()
+
+    work_directory = tempfile.mkdtemp(prefix="sf_dia_simulation_")
+    config_directory = os.path.join(work_directory, "config")
+    writer_log_folder = os.path.join(work_directory, "writer_logs")
+
+    write_config_directory(config_directory, arguments.n_detectors,
+                           arguments.backend_base_port, arguments.writer_base_port)
+
+    timing_options = ["--response_time", str(arguments.response_time), "--jitter", str(arguments.jitter)]
+
+    def simulator(name, *options):
+        return subprocess.Popen([sys.executable, os.path.join(SIMULATORS_DIRECTORY, name)] + list(options))
+
+    processes = []
+    try:
+        for index in range(arguments.n_detectors):
+            processes.append(simulator("backend_simulator.py", "-p", str(arguments.backend_base_port + index),
+                                       *timing_options))
+
+        processes.append(simulator("broker_simulator.py", "-p", str(arguments.broker_port),
+                                   "--start_delay", str(arguments.broker_start_delay),
+                                   "--run_time", str(arguments.broker_run_time), *timing_options))
+
+        if not arguments.no_timing_ioc:
+            processes.append(simulator("timing_ioc.py", "--timing_pv", arguments.timing_pv,
+                                       "--response_time", str(arguments.response_time)))
+
+        # Let the simulators bind their ports.
+        sleep(1)
+
+        environment = dict(os.environ)
+        environment["WRITER_SIMULATOR_OPTIONS"] = " ".join(["--frame_rate", str(arguments.frame_rate)] +
+                                                           timing_options)
+        environment["PYTHONPATH"] = os.pathsep.join(filter(None, [REPOSITORY_DIRECTORY,
+                                                                  environment.get("PYTHONPATH")]))
+
+        print("Simulation directory: %s" % work_directory)
+        print("DIA REST API: http://127.0.0.1:%d" % arguments.port)
+
+        dia = subprocess.Popen([sys.executable, "-m", "sf_dia.start_server",
+                                "-i", "127.0.0.1", "-p", str(arguments.port),
+                                "--log_level", arguments.log_level,
+                                "--config_directory", config_directory,
+                                "--writer_executable", os.path.join(SIMULATORS_DIRECTORY, "start_writer.sh"),
+                                "--writer_log_folder", writer_log_folder,
+                                "--broker_url", "http://127.0.0.1:%d" % arguments.broker_port,
+                                "--timing_pv", arguments.timing_pv,
+                                "--disable_detector"],
+                               env=environment)
+        processes.append(dia)
+
+        dia.wait()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
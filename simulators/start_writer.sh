@@ -0,0 +1,4 @@
+#!/bin/bash
+# Writer executable for the simulation - started by the DIA as: sh start_writer.sh <writer arguments>.
+# Extra simulator options (for example "--frame_rate 50") can be given in WRITER_SIMULATOR_OPTIONS.
+exec python "$(dirname "$0")/writer_simulator.py" "$@" ${WRITER_SIMULATOR_OPTIONS}
@@ -0,0 +1,47 @@
+import argparse
+import logging
+import threading
+from time import sleep
+
+_logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soft IOC serving the timing event PV used by the DIA.")
+    parser.add_argument("--timing_pv", default="SIM-TIMING:SoftEvt-EvtCode-SP", help="Name of the timing PV.")
+    parser.add_argument("--response_time", type=float, default=0.01,
+                        help="Seconds before a put to the PV is completed.")
+    parser.add_argument("--log_level", default="WARNING",
+                        choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG'], help="Log level to use.")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=arguments.log_level, format='[%(levelname)s] %(message)s')
+
+    # pcaspy is only needed for the simulation, it is not a DIA dependency.
+    from pcaspy import SimpleServer, Driver
+
+    class TimingDriver(Driver):
+        def write(self, reason, value):
+            # Complete the put asynchronously, like a real IOC processing the event.
+            def complete():
+                sleep(arguments.response_time)
+                self.setParam(reason, value)
+                self.updatePVs()
+                self.callbackPV(reason)
+                _logger.info("Timing event code %s.", value)
+
+            threading.Thread(target=complete, daemon=True).start()
+            return True
+
+    prefix, name = arguments.timing_pv.split(":", 1)
+
+    server = SimpleServer()
+    server.createPV(prefix + ":", {name: {"type": "int", "asyn": True}})
+    TimingDriver()
+
+    while True:
+        server.process(0.1)
+
+
+if __name__ == "__main__":
+    main()
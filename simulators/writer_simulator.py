@@ -0,0 +1,81 @@
+import logging
+import os
+import signal
+import threading
+from time import time
+
+import bottle
+
+from common import get_argument_parser, simulate_response_time, run_server
+
+_logger = logging.getLogger(__name__)
+
+
+def create_app(arguments):
+    # The writer "receives" n_frames at frame_rate once started, then reports finished.
+    app = bottle.Bottle()
+    state = {"start_time": time(), "parameters": {}}
+
+    def get_n_written_frames():
+        return min(arguments.n_frames, int((time() - state["start_time"]) * arguments.frame_rate))
+
+    def get_status():
+        return "finished" if get_n_written_frames() >= arguments.n_frames else "writing"
+
+    def exit_later():
+        # Let the response go out before terminating.
+        threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM)).start()
+
+    @app.get("/status")
+    def status():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": get_status()}
+
+    @app.get("/statistics")
+    def statistics():
+        simulate_response_time(arguments)
+        return {"state": "ok", "status": get_status(),
+                "n_received_frames": get_n_written_frames(), "n_written_frames": get_n_written_frames()}
+
+    @app.post("/parameters")
+    def parameters():
+        simulate_response_time(arguments)
+        state["parameters"] = bottle.request.json or {}
+        return {"state": "ok", "status": get_status()}
+
+    @app.get("/stop")
+    @app.get("/kill")
+    def stop():
+        simulate_response_time(arguments)
+        exit_later()
+        return {"state": "ok", "status": "stopped"}
+
+    return app
+
+
+def main():
+    parser = get_argument_parser("Simulated writer process.", 10001)
+    # Positional arguments as given by SfCppWriterClient.get_execution_command.
+    parser.add_argument("stream_url")
+    parser.add_argument("output_file")
+    parser.add_argument("n_frames", type=int)
+    parser.add_argument("writer_port", type=int)
+    parser.add_argument("user_id")
+    parser.add_argument("broker_url")
+    parser.add_argument("n_modules")
+    parser.add_argument("n_bad_modules")
+    parser.add_argument("detector_name")
+    parser.add_argument("--frame_rate", type=float, default=100, help="Simulated frames per second.")
+    parser.add_argument("--startup_time", type=float, default=0.0, help="Delay before serving requests.")
+    arguments = parser.parse_args()
+    arguments.port = arguments.writer_port
+
+    _logger.info("Simulated writer for %s writing %d frames to %s.",
+                 arguments.detector_name, arguments.n_frames, arguments.output_file)
+
+    threading.Event().wait(arguments.startup_time)
+    run_server(create_app(arguments), arguments)
+
+
+if __name__ == "__main__":
+    main()
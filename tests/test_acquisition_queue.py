@@ -0,0 +1,67 @@
+import unittest
+from time import sleep, time
+
+from sf_dia import manager
+from sf_dia.validation import IntegrationStatus
+from tests.utils import get_test_integration_manager, get_valid_config, finish_acquisition
+
+
+def wait_until(condition, timeout=5):
+    end_time = time() + timeout
+    while not condition():
+        if time() > end_time:
+            raise AssertionError("Condition not met in %s seconds." % timeout)
+        sleep(0.01)
+
+
+class TestAcquisitionQueue(unittest.TestCase):
+
+    def test_runs_with_same_bsread_config(self):
+        integration_manager = get_test_integration_manager(manager)
+        queue = integration_manager.acquisition_queue
+
+        configs = [get_valid_config(), get_valid_config()]
+        for index, config in enumerate(configs):
+            config["writer"]["output_file"] = "/tmp/run%d.h5" % index
+            config["bsread"]["output_file"] = "/dev/null"
+
+        queue.submit(configs, {"trigger_start": True})
+
+        for index in range(len(configs)):
+            wait_until(lambda: queue.get_status()["runs"][index]["state"] == "running" and
+                       integration_manager.get_acquisition_status() == IntegrationStatus.RUNNING)
+            self.assertEqual(queue.get_status()["current_run"], index)
+
+            finish_acquisition(integration_manager)
+
+        wait_until(lambda: queue.get_status()["state"] != "running")
+        status = queue.get_status()
+
+        self.assertEqual(status["state"], "finished")
+        self.assertEqual([run["state"] for run in status["runs"]], ["finished", "finished"])
+        self.assertEqual(set(status["runs"][0]["timings"]), {"prepare", "configure", "start", "acquisition"})
+        self.assertIn("stop", status["runs"][1]["timings"])
+
+        # The second run was re-armed: bsread configured again with the same parameters, the backends kept theirs.
+        bsread_calls = [call[1] for call in integration_manager.client_calls if call[0] == "bsread"]
+        self.assertEqual(bsread_calls, ["set_parameters", "start", "stop", "reset", "set_parameters", "start", "stop", "reset"])
+        self.assertEqual([call[1] for call in integration_manager.client_calls if call[0] == "JF01 backend"],
+                         ["set_config", "open", "close", "open", "close", "reset"])
+        self.assertEqual(integration_manager.get_acquisition_status(), IntegrationStatus.INITIALIZED)
+
+    def test_failed_run(self):
+        integration_manager = get_test_integration_manager(manager)
+        queue = integration_manager.acquisition_queue
+
+        queue.submit([get_valid_config(), get_valid_config()], {"trigger_start": True})
+        # The run is started once its start timing is recorded, it then waits for the acquisition end.
+        wait_until(lambda: "start" in queue.get_status()["runs"][0]["timings"])
+
+        # The writer crashing ends the wait for the acquisition at once.
+        integration_manager.enabled_detectors["JF02"].writer_client.client.status = "error"
+        wait_until(lambda: queue.get_status()["state"] != "running")
+
+        status = queue.get_status()
+        self.assertEqual(status["state"], "failed")
+        self.assertEqual([run["state"] for run in status["runs"]], ["failed", "cancelled"])
+        self.assertRegex(status["runs"][0]["error"], "status changed")
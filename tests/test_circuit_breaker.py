@@ -0,0 +1,62 @@
+import unittest
+from time import sleep
+
+from sf_dia.circuit_breaker import CircuitBreaker, CircuitOpenError, StaleStatus, STATE_CLOSED, STATE_OPEN
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_after_threshold(self):
+        circuit_breaker = CircuitBreaker("test", probe=lambda: None, failure_threshold=2, reset_timeout=10)
+
+        circuit_breaker.record_failure("Connection refused.")
+        circuit_breaker.check()
+
+        circuit_breaker.record_failure("Connection refused.")
+        self.assertEqual(circuit_breaker.get_status()["state"], STATE_OPEN)
+
+        with self.assertRaisesRegex(CircuitOpenError, "Connection refused."):
+            circuit_breaker.check()
+
+        circuit_breaker.stop()
+
+    def test_success_resets_failures(self):
+        circuit_breaker = CircuitBreaker("test", probe=lambda: None, failure_threshold=2)
+
+        circuit_breaker.record_failure("Connection refused.")
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure("Connection refused.")
+
+        self.assertTrue(circuit_breaker.is_closed())
+        self.assertEqual(circuit_breaker.get_status()["consecutive_failures"], 1)
+
+    def test_probe_closes_circuit(self):
+        probe_results = [ValueError("Still down."), None]
+
+        def probe():
+            result = probe_results.pop(0)
+            if result is not None:
+                raise result
+
+        circuit_breaker = CircuitBreaker("test", probe=probe, failure_threshold=1, reset_timeout=0.01)
+
+        circuit_breaker.record_failure("Connection refused.")
+
+        self.assertFalse(circuit_breaker.is_closed())
+
+        for _ in range(100):
+            if circuit_breaker.is_closed():
+                break
+            sleep(0.01)
+
+        status = circuit_breaker.get_status()
+        self.assertEqual(status["state"], STATE_CLOSED)
+        self.assertEqual(status["consecutive_failures"], 0)
+        self.assertEqual(status["n_probes"], 2)
+
+    def test_stale_status(self):
+        status = StaleStatus("receiving", 1234.5)
+
+        self.assertEqual(status, "receiving")
+        self.assertTrue(status.stale)
+        self.assertEqual(status.timestamp, 1234.5)
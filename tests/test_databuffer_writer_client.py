@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import MagicMock
+
+import requests
+
+from sf_dia.circuit_breaker import CircuitOpenError
+from sf_dia.client.databuffer_writer_client import DataBufferWriterClient
+
+
+def get_response(json_response):
+    response = MagicMock()
+    response.json.return_value = json_response
+    return response
+
+
+class TestDataBufferWriterClient(unittest.TestCase):
+
+    def get_client(self, *responses):
+        client = DataBufferWriterClient("http://localhost:10002", request_deadline=5)
+        client.session.request = MagicMock(side_effect=list(responses))
+        return client
+
+    def test_retry(self):
+        client = self.get_client(requests.ConnectionError("Connection refused."),
+                                 get_response({"state": "ok", "status": "receiving"}))
+
+        self.assertEqual(client.get_status(), "receiving")
+        self.assertEqual(client.session.request.call_count, 2)
+        self.assertIsNone(client.last_error)
+
+    def test_connection_error(self):
+        client = self.get_client(*[requests.ConnectionError("Connection refused.")] * 10)
+
+        with self.assertRaisesRegex(ValueError, "Cannot connect to databuffer_writer"):
+            client.get_status()
+
+    def test_error_reply(self):
+        client = self.get_client(*[get_response({"state": "error", "status": "Writer busy."})] * 10)
+
+        with self.assertRaisesRegex(ValueError, "replied to .* with: Writer busy."):
+            client.get_statistics()
+
+        # Refused by the broker: raised at once, not retried.
+        self.assertEqual(client.session.request.call_count, 1)
+
+        with self.assertRaisesRegex(ValueError, "replied to .* with: Writer busy."):
+            client.set_parameters({"output_file": "/dev/null"})
+        self.assertEqual(client.session.request.call_count, 2)
+
+        # Broker not reachable: retried with backoff.
+        client = self.get_client(requests.ConnectionError("Connection refused."),
+                                 requests.Timeout("Read timed out."),
+                                 get_response({"state": "error", "status": "Writer busy."}))
+
+        with self.assertRaisesRegex(ValueError, "replied to .* with: Writer busy."):
+            client.get_statistics()
+        self.assertEqual(client.session.request.call_count, 3)
+
+    def test_non_object_reply(self):
+        client = self.get_client(*[get_response(["ok"])] * 10)
+
+        with self.assertRaisesRegex(ValueError, r"replied to .* with: \['ok'\]"):
+            client.get_status()
+
+        # Valid JSON from a reachable broker: not retried, nor counted against the circuit.
+        self.assertEqual(client.session.request.call_count, 1)
+        self.assertEqual(client.circuit_breaker.get_status()["consecutive_failures"], 0)
+
+    def test_deadline(self):
+        client = DataBufferWriterClient("http://localhost:10002", request_deadline=0)
+        client.session.request = MagicMock(side_effect=[requests.Timeout("Read timed out.")] * 10)
+        self.assertEqual(client.request_deadline, 0)
+
+        self.assertFalse(client._send_request_to_process("get", client.broker_url + "/status"))
+        self.assertEqual(client.session.request.call_count, 1)
+
+    def test_stale_status(self):
+        client = self.get_client(get_response({"state": "ok", "status": "receiving"}),
+                                 *[requests.ConnectionError("Connection refused.")] * 10)
+        client.request_deadline = 0
+        client.circuit_breaker.failure_threshold = 1
+        client.circuit_breaker.reset_timeout = 10
+
+        self.assertEqual(client.get_status(), "receiving")
+
+        with self.assertRaisesRegex(ValueError, "Connection refused."):
+            client.get_status()
+
+        n_requests = client.session.request.call_count
+        status = client.get_status()
+
+        self.assertEqual(status, "receiving")
+        self.assertTrue(status.stale)
+        self.assertEqual(client.session.request.call_count, n_requests)
+
+        with self.assertRaises(CircuitOpenError):
+            client.get_statistics()
+
+        client.circuit_breaker.stop()
+
+    def test_circuit_failures(self):
+        client = self.get_client(*[get_response({"state": "error", "status": "Writer busy."})] * 2,
+                                 *[MagicMock(json=MagicMock(side_effect=ValueError("No JSON.")))] * 10)
+        client.request_deadline = 0
+        client.circuit_breaker.failure_threshold = 1
+
+        # Error and invalid replies come from a reachable broker.
+        self.assertRaises(ValueError, client.get_status)
+        self.assertRaises(ValueError, client.get_statistics)
+        self.assertRaises(ValueError, client.get_status)
+        self.assertTrue(client.circuit_breaker.is_closed())
+
+    def test_stop_and_kill_with_open_circuit(self):
+        client = self.get_client(requests.ConnectionError("Connection refused."),
+                                 get_response({"state": "ok", "status": "stopped"}),
+                                 get_response({"state": "ok", "status": "killed"}))
+        client.request_deadline = 0
+        client.circuit_breaker.failure_threshold = 1
+        client.circuit_breaker.reset_timeout = 10
+
+        self.assertRaises(ValueError, client.get_status)
+        self.assertFalse(client.circuit_breaker.is_closed())
+
+        client.stop()
+        client.kill()
+        self.assertEqual(client.session.request.call_count, 3)
+
+        client.circuit_breaker.stop()
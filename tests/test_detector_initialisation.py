@@ -0,0 +1,48 @@
+import unittest
+from threading import Event
+from time import sleep
+
+from sf_dia.detector_initialisation import DetectorInitialisation
+
+
+class TestDetectorInitialisation(unittest.TestCase):
+
+    def test_initialisation(self):
+        initialisation = DetectorInitialisation()
+        release = Event()
+        n_calls = {"JF02": 0}
+
+        def fail():
+            n_calls["JF02"] += 1
+            if n_calls["JF02"] == 1:
+                raise RuntimeError("Detector not reachable.")
+
+        initialisation.submit({"JF01": release.wait, "JF02": fail})
+        sleep(0.1)
+
+        status = initialisation.get_status()
+        self.assertFalse(status["ready"])
+        self.assertEqual(status["detectors"]["JF01"]["state"], "initialising")
+        self.assertEqual(status["detectors"]["JF02"]["state"], "failed")
+        self.assertEqual(status["detectors"]["JF02"]["error"], "Detector not reachable.")
+        self.assertEqual(initialisation.get_not_ready(), ["JF01", "JF02"])
+        self.assertEqual(initialisation.get_failed(), {"JF02": "Detector not reachable."})
+
+        release.set()
+        self.assertEqual(initialisation.retry_failed(), ["JF02"])
+        sleep(0.1)
+
+        self.assertTrue(initialisation.is_ready())
+        self.assertEqual(initialisation.get_failed(), {})
+        self.assertEqual(initialisation.get_status()["n_ready"], 2)
+
+    def test_remove(self):
+        initialisation = DetectorInitialisation()
+        initialisation.submit({"JF01": lambda: sleep(0.1)})
+
+        initialisation.remove("JF01")
+        sleep(0.2)
+
+        self.assertTrue(initialisation.is_ready())
+        self.assertTrue(initialisation.is_ready("JF01"))
+        self.assertEqual(initialisation.get_status()["detectors"], {})
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from time import sleep
+
+from sf_dia import manager as manager_module
+from sf_dia.detector_topology import DetectorTopology
+from tests.utils import get_test_integration_manager
+
+
+class Pipeline(object):
+    def __init__(self, settings):
+        self.settings = settings
+        self.config = ({}, {}, {})
+
+    def set_config(self, detector_config, backend_config, writer_config):
+        self.config = (detector_config, backend_config, writer_config)
+
+    def get_config(self):
+        return self.config
+
+
+class Manager(object):
+    def __init__(self, ready=True):
+        self.ready = ready
+        self.detectors = {}
+        self.initialised = []
+
+    def check_topology_change(self):
+        if not self.ready:
+            raise ValueError("Cannot change detectors in IntegrationStatus.RUNNING state.")
+
+    def get_client_configuration(self, detector):
+        return dict(zip(("detector", "backend", "writer"), self.detectors[detector].get_config()))
+
+    def change_detectors(self, removed, added):
+        self.check_topology_change()
+        removed_pipelines = {detector: self.detectors.pop(detector) for detector in removed}
+
+        for detector, (pipeline, initialise) in added.items():
+            self.detectors[detector] = pipeline
+            if initialise is not None:
+                self.initialised.append(detector)
+
+        return removed_pipelines
+
+
+class TestDetectorTopology(unittest.TestCase):
+
+    def setUp(self):
+        self.config_directory = tempfile.mkdtemp()
+
+    def write_available_detectors(self, available_detectors):
+        with open(os.path.join(self.config_directory, "available_detectors.json"), "w") as output_file:
+            json.dump(available_detectors, output_file)
+
+    def get_topology(self, manager, available_detectors):
+        def build_pipeline(detector, settings):
+            return Pipeline(settings), lambda: None
+
+        for detector, settings in available_detectors.items():
+            manager.detectors[detector] = Pipeline(settings)
+
+        self.write_available_detectors(available_detectors)
+
+        return DetectorTopology(manager, self.config_directory, build_pipeline, dict(available_detectors))
+
+    def test_reload(self):
+        manager = Manager()
+        topology = self.get_topology(manager, {"JF01": {"writer_port": 10001},
+                                               "JF02": {"writer_port": 10002},
+                                               "JF03": {"writer_port": 10003}})
+        unchanged_pipeline = manager.detectors["JF01"]
+        manager.detectors["JF02"].set_config({"exptime": 0.01}, {}, {})
+
+        self.write_available_detectors({"JF01": {"writer_port": 10001},
+                                        "JF02": {"writer_port": 10012},
+                                        "JF04": {"writer_port": 10004}})
+
+        self.assertEqual(topology.reload(), {"added": ["JF04"], "removed": ["JF03"], "changed": ["JF02"]})
+
+        self.assertEqual(sorted(manager.detectors), ["JF01", "JF02", "JF04"])
+        self.assertIs(manager.detectors["JF01"], unchanged_pipeline)
+        self.assertEqual(manager.detectors["JF02"].settings, {"writer_port": 10012})
+        self.assertEqual(manager.detectors["JF02"].get_config(), ({"exptime": 0.01}, {}, {}))
+        self.assertEqual(sorted(manager.initialised), ["JF02", "JF04"])
+        self.assertEqual(topology.get_available_detectors()["JF02"], {"writer_port": 10012})
+
+        self.assertEqual(topology.reload(), {"added": [], "removed": [], "changed": []})
+
+    def test_reload_refused(self):
+        manager = Manager(ready=False)
+        topology = self.get_topology(manager, {"JF01": {"writer_port": 10001}})
+
+        self.write_available_detectors({})
+
+        self.assertRaisesRegex(ValueError, "Cannot change detectors", topology.reload)
+        self.assertEqual(sorted(manager.detectors), ["JF01"])
+
+    def test_failed_reload(self):
+        integration_manager = get_test_integration_manager(manager_module)
+        integration_manager.initialise_detectors({"JF01": lambda: None, "JF02": lambda: None})
+        sleep(0.05)
+        available_detectors = {"JF01": {"writer_port": 10001}, "JF02": {"writer_port": 10002}}
+        self.write_available_detectors(available_detectors)
+
+        def build_pipeline(detector, settings):
+            # Not a valid pipeline, the manager cannot add it.
+            return None, None
+
+        topology = DetectorTopology(integration_manager, self.config_directory, build_pipeline,
+                                    dict(available_detectors))
+        previous_pipelines = dict(integration_manager.enabled_detectors)
+
+        self.write_available_detectors({"JF01": {"writer_port": 10001}, "JF02": {"writer_port": 10012}})
+        self.assertRaises(AttributeError, topology.reload)
+
+        # The detectors are untouched: still running and initialised.
+        self.assertEqual(integration_manager.enabled_detectors, previous_pipelines)
+        self.assertNotIn("kill", [call[1] for call in integration_manager.client_calls])
+        self.assertTrue(integration_manager.get_readiness()["ready"])
+        self.assertEqual(sorted(integration_manager.get_readiness()["detectors"]), ["JF01", "JF02"])
+        self.assertEqual(topology.get_available_detectors(), available_detectors)
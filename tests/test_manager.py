@@ -0,0 +1,281 @@
+import json
+import unittest
+from threading import Thread, Event
+from time import sleep
+
+from sf_dia import manager
+from sf_dia.circuit_breaker import StaleStatus
+from sf_dia.client.detector_pipeline import DetectorPipeline
+from sf_dia.utils import ParallelExecutionError
+from sf_dia.validation import IntegrationStatus
+from tests.utils import get_test_integration_manager, get_valid_config, finish_acquisition, \
+    RecordingDetectorClient, RecordingBackendClient, RecordingWriterClient
+
+
+class TestIntegrationManager(unittest.TestCase):
+
+    def test_status_snapshot_freshness(self):
+        integration_manager = get_test_integration_manager(manager)
+        collect_status_details = integration_manager._collect_status_details
+
+        slow_started = Event()
+        slow_release = Event()
+        self.addCleanup(slow_release.set)
+
+        def slow_collect_status_details():
+            details = collect_status_details()
+            slow_started.set()
+            slow_release.wait()
+            return details
+
+        integration_manager._collect_status_details = slow_collect_status_details
+        slow_refresh = Thread(target=integration_manager.refresh_status)
+        slow_refresh.start()
+        slow_started.wait()
+
+        # A refresh started after the slow one, seeing the backend in error.
+        integration_manager._collect_status_details = collect_status_details
+        integration_manager.enabled_detectors["JF01"].backend_client.client.status = "ERROR"
+        fresh_snapshot = integration_manager.refresh_status()
+        self.assertEqual(fresh_snapshot.details["JF01"]["backend"], "ERROR")
+
+        # The slow refresh completes last, but its older result does not replace the snapshot.
+        slow_release.set()
+        slow_refresh.join()
+
+        self.assertIs(integration_manager._status_snapshot, fresh_snapshot)
+        self.assertEqual(fresh_snapshot.version, 2)
+
+    def test_configuration_rollback(self):
+        integration_manager = get_test_integration_manager(manager)
+        integration_manager.enabled_detectors["JF02"].backend_client.client.failures.add("set_config")
+
+        with self.assertRaisesRegex(ParallelExecutionError, "JF02: Injected failure"):
+            integration_manager.set_acquisition_config(get_valid_config())
+
+        # No detector is left configured: every client was reset after the failure.
+        for client_name in ("JF01 backend", "JF01 writer", "JF02 backend", "JF02 writer", "bsread"):
+            self.assertIn((client_name, "reset"), integration_manager.client_calls)
+
+        self.assertFalse(integration_manager.last_config_successful)
+        self.assertEqual(integration_manager.get_acquisition_status(), IntegrationStatus.INITIALIZED)
+
+    def test_reconfigure_changed_clients(self):
+        integration_manager = get_test_integration_manager(manager)
+        config = get_valid_config()
+        integration_manager.set_acquisition_config(config)
+
+        del integration_manager.client_calls[:]
+        config["writer"]["general/user"] = "p11058"
+        status = integration_manager.set_acquisition_config(config)
+
+        self.assertEqual(status, IntegrationStatus.CONFIGURED)
+
+        # Only the writers have a new config, the backends and detectors are left alone.
+        called_clients = {call[0] for call in integration_manager.client_calls}
+        self.assertEqual(called_clients, {"JF01 writer", "JF02 writer"})
+        self.assertEqual([call[1] for call in integration_manager.client_calls if call[0] == "JF01 writer"],
+                         ["reset", "set_parameters"])
+
+    def test_rearm_unchanged_bsread_config(self):
+        integration_manager = get_test_integration_manager(manager)
+        config = get_valid_config()
+        config["bsread"]["output_file"] = "/dev/null"
+        integration_manager.set_acquisition_config(config)
+
+        for run_number in (1, 2):
+            integration_manager.start_acquisition({"trigger_start": True})
+            finish_acquisition(integration_manager)
+
+            del integration_manager.client_calls[:]
+            status = integration_manager.rearm_acquisition()
+
+            # bsread was stopped with the detectors, it is configured again with the same parameters.
+            self.assertEqual(status, IntegrationStatus.CONFIGURED)
+            self.assertEqual([call[1] for call in integration_manager.client_calls if call[0] == "bsread"],
+                             ["stop", "reset", "set_parameters"])
+            self.assertEqual(integration_manager.get_acquisition_config()["writer"]["output_file"],
+                             "/tmp/out.h5_run%04d" % run_number)
+            self.assertEqual(integration_manager.get_acquisition_config()["bsread"]["output_file"], "/dev/null")
+
+        # The backends keep their config.
+        self.assertNotIn(("JF01 backend", "set_config"), [call[:2] for call in integration_manager.client_calls])
+
+    def test_rearm_config_read_back(self):
+        integration_manager = get_test_integration_manager(manager)
+        integration_manager.set_acquisition_config(get_valid_config())
+        integration_manager.start_acquisition({"trigger_start": True})
+        finish_acquisition(integration_manager)
+        integration_manager.rearm_acquisition()
+
+        # Setting the config of the re-armed run again does not stack the run suffixes.
+        integration_manager.set_acquisition_config(integration_manager.get_acquisition_config())
+        integration_manager.start_acquisition({"trigger_start": True})
+        finish_acquisition(integration_manager)
+        integration_manager.rearm_acquisition()
+
+        config = integration_manager.get_acquisition_config()
+        self.assertEqual(config["writer"]["output_file"], "/tmp/out.h5_run0002")
+        self.assertEqual(config["bsread"]["output_file"], "/tmp/out.h5_run0002")
+
+    def test_metrics_without_bsread(self):
+        integration_manager = get_test_integration_manager(manager, metrics_interval=0.05)
+        self.addCleanup(integration_manager.metrics_collector.stop)
+        integration_manager.set_clients_enabled({"bsread": False})
+
+        def collect_metrics():
+            raise AssertionError("Clients queried while the collector samples are available.")
+
+        integration_manager._collect_metrics = collect_metrics
+        # Samples taken with bsread enabled are dropped.
+        integration_manager.metrics_collector.clear()
+        integration_manager.metrics_collector.collect()
+
+        metrics = integration_manager.get_metrics()
+
+        self.assertEqual(metrics["JF01"]["writer"], {})
+        self.assertEqual(metrics["bsread"], {"bsread": None})
+
+    def test_reset_without_timing_pv(self):
+        integration_manager = get_test_integration_manager(manager, caput_timeout=0.1)
+        integration_manager.set_acquisition_config(get_valid_config())
+        integration_manager.timing_event_pv.pv.connected = False
+
+        # The stop event is lost, but the clients are still reset.
+        self.assertEqual(integration_manager.reset(), IntegrationStatus.INITIALIZED)
+        self.assertIn(("JF01 backend", "reset"), integration_manager.client_calls)
+        self.assertRegex(integration_manager.timing_event_pv.get_status()["last_error"]["message"], "not connected")
+
+    def test_failed_initialisation(self):
+        integration_manager = get_test_integration_manager(manager)
+
+        def initialise():
+            raise RuntimeError("Detector not reachable.")
+
+        integration_manager.detector_initialisation.submit({"JF01": initialise})
+        sleep(0.1)
+
+        snapshot = integration_manager.refresh_status()
+        self.assertEqual(snapshot.details["JF01"]["detector"], "initialisation failed: Detector not reachable.")
+        self.assertEqual(snapshot.breakdown["detectors"]["JF01"], str(IntegrationStatus.ERROR))
+
+        with self.assertRaisesRegex(ValueError, "initialisation of detectors \\['JF01'\\] failed"):
+            integration_manager.set_acquisition_config(get_valid_config())
+
+    def test_change_detectors_rollback(self):
+        integration_manager = get_test_integration_manager(manager)
+        integration_manager.initialise_detectors({"JF01": lambda: None, "JF02": lambda: None})
+        sleep(0.05)
+        previous_pipelines = dict(integration_manager.enabled_detectors)
+
+        calls = integration_manager.client_calls
+        new_pipeline = DetectorPipeline(RecordingDetectorClient("JF02 detector", calls),
+                                        RecordingBackendClient("JF02 backend", calls),
+                                        RecordingWriterClient("JF02 writer", calls))
+
+        def initialise():
+            pass
+
+        # JF03 cannot be added, the replaced JF02 is left running and initialised.
+        with self.assertRaises(AttributeError):
+            integration_manager.change_detectors(["JF02"], {"JF02": (new_pipeline, initialise),
+                                                            "JF03": (None, None)})
+
+        self.assertEqual(integration_manager.enabled_detectors, previous_pipelines)
+        self.assertEqual({detector: progress["state"]
+                          for detector, progress in integration_manager.get_readiness()["detectors"].items()},
+                         {"JF01": "ready", "JF02": "ready"})
+        self.assertNotIn("kill", [call[1] for call in calls])
+
+        removed_pipelines = integration_manager.change_detectors(["JF02"], {"JF02": (new_pipeline, None)})
+
+        self.assertIs(removed_pipelines["JF02"], previous_pipelines["JF02"])
+        self.assertIs(integration_manager.enabled_detectors["JF02"].backend_client.client, new_pipeline.backend_client)
+        self.assertEqual(integration_manager.get_acquisition_status(), IntegrationStatus.INITIALIZED)
+
+    def test_metrics_during_command(self):
+        integration_manager = get_test_integration_manager(manager)
+        command_started = Event()
+        command_release = Event()
+        self.addCleanup(command_release.set)
+
+        def command():
+            integration_manager._command_lock.acquire_write()
+            command_started.set()
+            command_release.wait()
+            integration_manager._command_lock.release_write()
+
+        Thread(target=command).start()
+        command_started.wait()
+
+        # No metrics collected yet, and the command is not waited for.
+        self.assertEqual(integration_manager.get_metrics(), {})
+
+        command_release.set()
+        sleep(0.05)
+        self.assertEqual(integration_manager.get_metrics()["JF01"]["writer"], {})
+
+    def test_stale_status(self):
+        integration_manager = get_test_integration_manager(manager)
+        integration_manager.set_acquisition_config(get_valid_config())
+
+        # bsread behind an open circuit breaker, last seen configured.
+        integration_manager.bsread_client.client.status = StaleStatus("configured", 1234.5)
+        snapshot = integration_manager.refresh_status()
+
+        self.assertEqual(snapshot.details["bsread"], "configured")
+        self.assertEqual(snapshot.breakdown["stale"], {"bsread": 1234.5})
+        self.assertEqual(snapshot.status, IntegrationStatus.ERROR)
+
+        # Also reported with the details, where the statuses are plain strings once serialized.
+        details = json.loads(json.dumps(integration_manager.get_status_details()))
+        self.assertEqual(details["stale_statuses"], {"bsread": 1234.5})
+        self.assertEqual(details["bsread"], "configured")
+
+        with self.assertRaisesRegex(ValueError, "Cannot start acquisition"):
+            integration_manager.start_acquisition({"trigger_start": True})
+
+    def test_slow_status_read_during_command(self):
+        integration_manager = get_test_integration_manager(manager, command_queue_timeout=0)
+        collect_status_details = integration_manager._collect_status_details
+
+        read_started = Event()
+        read_release = Event()
+        self.addCleanup(read_release.set)
+
+        def slow_collect_status_details():
+            details = collect_status_details()
+            if not read_started.is_set():
+                read_started.set()
+                read_release.wait()
+            return details
+
+        integration_manager._collect_status_details = slow_collect_status_details
+        reader = Thread(target=integration_manager.get_status_details)
+        reader.start()
+        read_started.wait()
+
+        # The status read still querying the clients does not hold up the command.
+        self.assertEqual(integration_manager.set_acquisition_config(get_valid_config()), IntegrationStatus.CONFIGURED)
+
+        read_release.set()
+        reader.join()
+
+    def test_command_lock_timeout(self):
+        integration_manager = get_test_integration_manager(manager, command_queue_timeout=0)
+        lock_held = Event()
+        lock_release = Event()
+        self.addCleanup(lock_release.set)
+
+        def hold_command_lock():
+            integration_manager._command_lock.acquire_read()
+            lock_held.set()
+            lock_release.wait()
+            integration_manager._command_lock.release_read()
+
+        Thread(target=hold_command_lock).start()
+        lock_held.wait()
+
+        # No command in progress, the message does not name one.
+        with self.assertRaisesRegex(ValueError, "Cannot reset, timed out waiting for the command lock"):
+            integration_manager.reset()
@@ -0,0 +1,108 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from sf_dia.metrics_collector import MetricsCollector
+from sf_dia.timing import Timings
+
+
+class CountingClient(object):
+    def __init__(self, **frames_per_call):
+        self.frames_per_call = frames_per_call
+        self.counters = {key: 0 for key in frames_per_call}
+
+    def is_client_enabled(self):
+        return True
+
+    def get_statistics(self):
+        for key, n_frames in self.frames_per_call.items():
+            self.counters[key] += n_frames
+        return dict(self.counters)
+
+    get_metrics = get_statistics
+
+
+class Pipeline(object):
+    def __init__(self):
+        self.backend_client = CountingClient(n_opened=1)
+        self.writer_client = CountingClient(n_received_frames=10, n_written_frames=8)
+
+    def return_clients(self):
+        return None, self.backend_client, self.writer_client
+
+
+class Manager(object):
+    status_timeout = 1
+
+    def __init__(self):
+        self.timings = Timings()
+        self.enabled_detectors = {"JF01": Pipeline()}
+        self.bsread_client = CountingClient(n_written_frames=1)
+
+
+class TestMetricsCollector(unittest.TestCase):
+
+    def test_history_and_rates(self):
+        collector = MetricsCollector(Manager(), ThreadPoolExecutor(max_workers=4), history_size=3)
+
+        for _ in range(5):
+            collector.collect()
+            sleep(0.05)
+
+        history = collector.get_history()
+        self.assertEqual(set(history), {"JF01", "bsread"})
+        self.assertEqual(len(history["JF01"]), 3)
+        self.assertEqual(history["JF01"][-1]["writer"], {"n_received_frames": 50, "n_written_frames": 40})
+
+        rates = collector.get_rates(source="JF01")["JF01"]
+        self.assertEqual(rates["n_samples"], 3)
+        # 2 frames per sample fall behind in the writer.
+        self.assertEqual(rates["backlog"], 10)
+        self.assertGreater(rates["received_frames_rate"], rates["written_frames_rate"])
+        self.assertEqual(rates["missing_counters"], [])
+
+        self.assertEqual(collector.get_history(window=0), {"JF01": [], "bsread": []})
+
+    def test_counter_reset(self):
+        manager = Manager()
+        collector = MetricsCollector(manager, ThreadPoolExecutor(max_workers=4))
+
+        collector.collect()
+        sleep(0.05)
+        collector.collect()
+        # A new run restarts the writer counters.
+        manager.enabled_detectors["JF01"].writer_client.counters = {"n_received_frames": 0, "n_written_frames": 0}
+        sleep(0.05)
+        collector.collect()
+
+        rates = collector.get_rates()["JF01"]
+        self.assertGreater(rates["written_frames_rate"], 0)
+
+    def test_errors(self):
+        manager = Manager()
+
+        def fail():
+            raise ValueError("Writer not reachable.")
+
+        manager.enabled_detectors["JF01"].writer_client.get_statistics = fail
+
+        sample = MetricsCollector(manager, ThreadPoolExecutor(max_workers=4)).collect()["JF01"]
+
+        self.assertNotIn("writer", sample)
+        self.assertEqual(sample["errors"], {"writer": "Writer not reachable."})
+
+    def test_missing_counters(self):
+        manager = Manager()
+        manager.enabled_detectors["JF01"].writer_client = CountingClient(n_frames=8)
+        collector = MetricsCollector(manager, ThreadPoolExecutor(max_workers=4))
+
+        collector.collect()
+        sleep(0.05)
+        collector.collect()
+
+        with self.assertLogs("sf_dia.metrics_collector", "WARNING"):
+            rates = collector.get_rates()["JF01"]
+
+        self.assertEqual(rates["missing_counters"], ["writer/n_received_frames", "writer/n_written_frames"])
+        self.assertIsNone(rates["written_frames_rate"])
+        self.assertIsNone(rates["backlog"])
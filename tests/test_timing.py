@@ -0,0 +1,66 @@
+import unittest
+
+from sf_dia.timing import Timings, timed_command, COMMAND_METRIC, CLIENT_METRIC
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_histogram(self):
+        timings = Timings(buckets=(0.1, 1))
+
+        for duration in (0.05, 0.1, 0.5, 2):
+            timings.observe(CLIENT_METRIC, duration, detector="JF01", client="backend", operation="open")
+        timings.observe(CLIENT_METRIC, 0.5, detector="JF02", client="backend", operation="open")
+
+        histograms = timings.get_timings()[CLIENT_METRIC]
+        self.assertEqual(len(histograms), 2)
+
+        histogram = histograms[0]
+        self.assertEqual(histogram["labels"], {"detector": "JF01", "client": "backend", "operation": "open"})
+        self.assertEqual(histogram["count"], 4)
+        self.assertAlmostEqual(histogram["sum"], 2.65)
+        self.assertEqual(histogram["max"], 2)
+        self.assertEqual(histogram["buckets"], [[0.1, 2], [1, 3], ["+Inf", 4]])
+
+        timings.clear()
+        self.assertEqual(timings.get_timings(), {})
+
+    def test_measure(self):
+        timings = Timings()
+
+        with timings.measure(CLIENT_METRIC, client="writer"):
+            pass
+
+        def fail():
+            raise ValueError("Writer not reachable.")
+
+        self.assertRaises(ValueError, timings.wrap(fail, CLIENT_METRIC, client="writer"))
+
+        results = {histogram["labels"]["result"]: histogram["count"]
+                   for histogram in timings.get_timings()[CLIENT_METRIC]}
+        self.assertEqual(results, {"ok": 1, "error": 1})
+
+    def test_timed_command(self):
+
+        class Manager(object):
+            timings = Timings()
+
+            @timed_command("reset")
+            def reset(self):
+                return "INITIALIZED"
+
+        self.assertEqual(Manager().reset(), "INITIALIZED")
+        self.assertEqual(Manager.timings.get_timings()[COMMAND_METRIC][0]["labels"],
+                         {"command": "reset", "result": "ok"})
+
+    def test_prometheus_text(self):
+        timings = Timings(buckets=(1,))
+        timings.observe(COMMAND_METRIC, 0.5, command="start", result="ok")
+
+        lines = timings.get_prometheus_text().splitlines()
+
+        self.assertIn("# TYPE dia_command_duration_seconds histogram", lines)
+        self.assertIn('dia_command_duration_seconds_bucket{command="start",result="ok",le="1"} 1', lines)
+        self.assertIn('dia_command_duration_seconds_bucket{command="start",result="ok",le="+Inf"} 1', lines)
+        self.assertIn('dia_command_duration_seconds_sum{command="start",result="ok"} 0.500000', lines)
+        self.assertIn('dia_command_duration_seconds_count{command="start",result="ok"} 1', lines)
@@ -0,0 +1,73 @@
+import unittest
+from threading import Timer
+from unittest.mock import patch
+
+from sf_dia.timing_pv import TimingEventPV
+
+
+class FakePV(object):
+    def __init__(self, pv_name, connection_callback=None):
+        self.connected = True
+        self.complete_after = 0.05
+        self.values = []
+
+    def wait_for_connection(self, timeout=None):
+        return self.connected
+
+    def put(self, value, wait=False, timeout=None, use_complete=False, callback=None):
+        self.values.append(value)
+
+        if not wait and self.complete_after is not None:
+            Timer(self.complete_after, callback, kwargs={"pvname": "TIMING"}).start()
+
+        return 1
+
+
+@patch("sf_dia.timing_pv.epics.PV", FakePV)
+class TestTimingEventPV(unittest.TestCase):
+
+    def test_put(self):
+        timing_pv = TimingEventPV("TIMING", 1)
+        self.assertTrue(timing_pv.put(255))
+
+        self.assertEqual(timing_pv.pv.values, [255])
+        self.assertEqual(timing_pv.get_status()["last_put"]["value"], 255)
+        self.assertIsNone(timing_pv.get_status()["last_error"])
+
+        # Not fatal, as with caput: the error is only reported.
+        timing_pv.pv.connected = False
+        with self.assertLogs("sf_dia.timing_pv", "WARNING"):
+            self.assertFalse(timing_pv.put(254))
+        self.assertFalse(timing_pv.put_async(254))
+
+        self.assertEqual(timing_pv.pv.values, [255])
+        self.assertRegex(timing_pv.get_status()["last_error"]["message"], "not connected")
+
+    def test_put_async(self):
+        completed = []
+        timing_pv = TimingEventPV("TIMING", 1, put_callback=lambda value, duration: completed.append(value))
+
+        self.assertTrue(timing_pv.put_async(254))
+        self.assertTrue(timing_pv.get_status()["put_pending"])
+
+        self.assertTrue(timing_pv.wait_for_put())
+        self.assertEqual(completed, [254])
+        self.assertFalse(timing_pv.get_status()["put_pending"])
+
+        # A put sent before the previous one completed replaces it.
+        timing_pv.put_async(254)
+        timing_pv.put_async(255)
+        self.assertRegex(timing_pv.get_status()["last_error"]["message"], "Giving up the put of 254")
+
+        self.assertTrue(timing_pv.wait_for_put())
+        self.assertEqual(timing_pv.get_status()["last_put"]["value"], 255)
+
+    def test_put_async_timeout(self):
+        timing_pv = TimingEventPV("TIMING", 0.1)
+        timing_pv.pv.complete_after = None
+
+        timing_pv.put_async(254)
+        self.assertIsNone(timing_pv.get_put_error())
+        self.assertFalse(timing_pv.wait_for_put())
+        self.assertIsNone(timing_pv.get_put_error())
+        self.assertRegex(timing_pv.get_status()["last_error"]["message"], "did not complete")
@@ -0,0 +1,192 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from time import sleep, time
+
+from sf_dia.utils import call_in_parallel, ParallelCallTimeout, ParallelExecutionError, run_dependency_graph, \
+    ReadWriteLock, SingleFlight, prefetch_file, Deadline, DeadlineExceeded, deadline_scope, call_with_deadline, get_deadline_errors
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_call_in_parallel(self):
+        executor = ThreadPoolExecutor(max_workers=4)
+
+        def fail():
+            raise ValueError("Client not reachable.")
+
+        start_time = time()
+        results, errors = call_in_parallel(executor, {"fast": lambda: "ok",
+                                                      "slow": lambda: sleep(0.2) or "slow ok",
+                                                      "hanging": lambda: sleep(2),
+                                                      "failing": fail},
+                                           timeout=0.5)
+
+        self.assertLess(time() - start_time, 1)
+        self.assertEqual(results, {"fast": "ok", "slow": "slow ok"})
+        self.assertIsInstance(errors["hanging"], ParallelCallTimeout)
+        self.assertIsInstance(errors["failing"], ValueError)
+
+    def test_call_in_parallel_in_flight(self):
+        executor = ThreadPoolExecutor(max_workers=4)
+        in_flight = {}
+        n_calls = []
+
+        def hanging():
+            n_calls.append(1)
+            sleep(0.5)
+
+        _, errors = call_in_parallel(executor, {"hanging": hanging}, timeout=0.1, in_flight=in_flight)
+        self.assertIsInstance(errors["hanging"], ParallelCallTimeout)
+
+        # The previous call is still running, it is not submitted again.
+        _, errors = call_in_parallel(executor, {"hanging": hanging}, timeout=0.1, in_flight=in_flight)
+        self.assertRegex(str(errors["hanging"]), "still running")
+        self.assertEqual(len(n_calls), 1)
+
+        sleep(0.5)
+        results, _ = call_in_parallel(executor, {"hanging": lambda: "ok"}, timeout=0.1, in_flight=in_flight)
+        self.assertEqual(results, {"hanging": "ok"})
+        self.assertEqual(in_flight, {})
+
+    def test_parallel_execution_error(self):
+        error = ParallelExecutionError("Cannot set acquisition config.", {"JF2": RuntimeError("writer failed"),
+                                                                         "JF1": ValueError("backend failed")})
+
+        self.assertEqual(str(error), "Cannot set acquisition config.\n\tJF1: backend failed\n\tJF2: writer failed")
+        self.assertEqual(set(error.errors), {"JF1", "JF2"})
+
+    def test_run_dependency_graph(self):
+        executed = []
+
+        def run_step(name):
+            if name == "failing":
+                raise ValueError("Step failed.")
+
+            sleep(0.1)
+            executed.append(name)
+
+        start_time = time()
+        timings = run_dependency_graph({"first": [], "second": ["first"], "independent": [], "third": ["first"]},
+                                       run_step)
+
+        # Only the critical path (first -> second/third) is waited for.
+        self.assertLess(time() - start_time, 0.3)
+        self.assertEqual(set(timings), {"first", "second", "independent", "third"})
+        self.assertLess(executed.index("first"), executed.index("second"))
+
+        with self.assertRaisesRegex(ParallelExecutionError, "Skipped because"):
+            run_dependency_graph({"failing": [], "dependent": ["failing"]}, run_step)
+
+        with self.assertRaisesRegex(ValueError, "Circular dependency"):
+            run_dependency_graph({"first": ["second"], "second": ["first"]}, run_step)
+
+    def test_read_write_lock(self):
+        lock = ReadWriteLock()
+
+        results = {}
+
+        # Reentrant writer, also allowed to read.
+        self.assertTrue(lock.acquire_write())
+        self.assertTrue(lock.acquire_write(blocking=False))
+        self.assertTrue(lock.acquire_read(blocking=False))
+        lock.release_read()
+        lock.release_write()
+        lock.release_write()
+
+        writer = Thread(target=lambda: results.update(write=lock.acquire_write(blocking=False)) or lock.release_write())
+        writer.start()
+        writer.join()
+        self.assertTrue(results["write"])
+
+        # Readers do not block each other, but block the writers.
+        lock.acquire_read()
+        reader = Thread(target=lambda: self.assertTrue(lock.acquire_read(blocking=False)) or lock.release_read())
+        reader.start()
+        reader.join()
+
+        writer = Thread(target=lambda: results.update(write=lock.acquire_write(timeout=0.1)))
+        writer.start()
+        writer.join()
+        self.assertFalse(results["write"])
+
+        self.assertRaises(RuntimeError, lock.acquire_write)
+        lock.release_read()
+
+        # A writer blocks the readers until it is done.
+        lock.acquire_write()
+        reader = Thread(target=lambda: results.update(read=lock.acquire_read(timeout=0.1)))
+        reader.start()
+        reader.join()
+        self.assertFalse(results["read"])
+        lock.release_write()
+
+        self.assertTrue(lock.acquire_read(blocking=False))
+        lock.release_read()
+
+    def test_single_flight(self):
+        single_flight = SingleFlight()
+        n_executions = {"status": 0}
+
+        def get_status():
+            n_executions["status"] += 1
+            sleep(0.2)
+            return "ok"
+
+        executor = ThreadPoolExecutor(max_workers=8)
+        futures = [executor.submit(single_flight.call, "status", get_status) for _ in range(8)]
+
+        self.assertEqual([future.result() for future in futures], ["ok"] * 8)
+        self.assertEqual(n_executions["status"], 1)
+        self.assertEqual(single_flight.get_statistics(), {"n_calls": 8, "n_shared_calls": 7, "in_flight": []})
+
+        # The next call runs again, errors are shared as well.
+        def fail():
+            raise ValueError("Broker not reachable.")
+
+        self.assertRaises(ValueError, single_flight.call, "status", fail)
+        self.assertEqual(single_flight.call("status", get_status), "ok")
+        self.assertEqual(n_executions["status"], 2)
+
+    def test_deadline(self):
+        executor = ThreadPoolExecutor(max_workers=4)
+
+        def reset_writer():
+            call_with_deadline(sleep, "JF1", "writer", "reset", 2)
+
+        start_time = time()
+        with deadline_scope(Deadline(0.2)):
+            results, errors = call_in_parallel(executor, {"JF1": reset_writer,
+                                                          "JF2": lambda: "ok"})
+
+        self.assertLess(time() - start_time, 1)
+        self.assertEqual(results, {"JF2": "ok"})
+        self.assertIsInstance(errors["JF1"], DeadlineExceeded)
+        self.assertEqual(errors["JF1"].to_dict(), {"timeout": 0.2, "detector": "JF1",
+                                                   "client": "writer", "operation": "reset"})
+        self.assertEqual(str(errors["JF1"]), "Deadline of 0.2 seconds exceeded in writer reset of detector JF1.")
+
+        # No call is started after the deadline, also in the dependency graph threads.
+        executed = []
+        with deadline_scope(Deadline(0.1)):
+            with self.assertRaises(ParallelExecutionError) as context:
+                run_dependency_graph({"first": [], "second": ["first"]},
+                                     lambda name: call_with_deadline(lambda: executed.append(name) or sleep(0.2),
+                                                                     "JF1", name, "stop"))
+
+        self.assertEqual(executed, ["first"])
+        self.assertEqual([error.client for error in get_deadline_errors(context.exception)], ["second"])
+
+        # Without deadline.
+        self.assertEqual(call_with_deadline(lambda: "ok", "JF1", "writer", "reset"), "ok")
+
+    def test_prefetch_file(self):
+        with tempfile.NamedTemporaryFile() as temp_file:
+            temp_file.write(b"gains" * 1000)
+            temp_file.flush()
+
+            prefetch_file(temp_file.name)
+
+        with self.assertRaises(OSError):
+            prefetch_file("/non/existing/gains.h5")
@@ -1,6 +1,13 @@
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
 
-from sf_dia.validation import validate_writer_config, validate_bsread_config
+from detector_integration_api.utils import ClientDisableWrapper
+
+from sf_dia.validation import validate_writer_config, validate_bsread_config, interpret_status, \
+    interpret_status_breakdown, set_status_rules, IntegrationStatus, STATUS_RULES, get_config_errors, \
+    validate_config, ConfigValidationError, get_capacity_report, MODULE_N_PIXELS, get_corrections_problems, h5py
 from tests.utils import get_valid_config
 
 
@@ -37,3 +44,141 @@ class TestValidation(unittest.TestCase):
         bsread_config = get_valid_config()["bsread"]
 
         validate_bsread_config(bsread_config)
+
+    def test_config_errors(self):
+        config = get_valid_config()
+        self.assertEqual(get_config_errors(config), [])
+
+        # Every problem is reported at once.
+        config["writer"]["user_id"] = 30000
+        config["writer"]["unexpected"] = "jup"
+        del config["detector"]["exptime"]
+        config["bsread"]["general/user"] = 1
+        config["backend"]["bit_depth"] = 32
+
+        errors = get_config_errors(config)
+        self.assertEqual(len(errors), 5)
+        self.assertRegex(errors[0], "Received unexpected parameters for writer")
+        self.assertRegex(errors[1], "Provided user_id 30000")
+
+        with self.assertRaisesRegex(ConfigValidationError, "Invalid config, 5 problems") as context:
+            validate_config(config)
+        self.assertEqual(context.exception.errors, errors)
+
+        # Only the sections of the enabled clients.
+        self.assertEqual(len(get_config_errors(config, sections=["backend"])), 1)
+
+        self.assertEqual(len(get_config_errors({"writer": {}})), 1)
+
+    def test_config_detector_overrides(self):
+        config = get_valid_config()
+
+        errors = get_config_errors(config, detector_overrides={"JF1": {"detector": {"dr": 32}, "writer": {}},
+                                                               "JF2": {"writer": {"user_id": 1}},
+                                                               "JF3": {}})
+
+        self.assertEqual(len(errors), 2)
+        self.assertRegex(errors[0], r"^\(JF1\) Invalid config. Backend 'bit_depth'")
+        self.assertRegex(errors[1], r"^\(JF2\) Provided user_id 1")
+
+    def test_capacity_report(self):
+        config = get_valid_config()
+        detector_configs = {detector: (config["detector"], config["backend"],
+                                       dict(config["writer"], output_file="/tmp/out.%s.h5" % detector))
+                            for detector in ("JF1", "JF2", "JF3")}
+
+        report = get_capacity_report(detector_configs, {"JF1": 1, "JF2": 4, "JF3": None}, timing_rate=100)
+
+        # 16 bit pixels.
+        self.assertEqual(report["detectors"]["JF1"]["frame_size"], MODULE_N_PIXELS * 2)
+        self.assertEqual(report["detectors"]["JF2"]["data_rate"], MODULE_N_PIXELS * 2 * 4 * 100)
+        self.assertEqual(report["detectors"]["JF2"]["file_size"], MODULE_N_PIXELS * 2 * 4 * 10)
+        self.assertNotIn("JF3", report["detectors"])
+        self.assertEqual(report["data_rate"], MODULE_N_PIXELS * 2 * 5 * 100)
+        self.assertEqual(report["filesystems"][0]["detectors"], ["JF1", "JF2"])
+        self.assertEqual(report["problems"], [])
+
+        report = get_capacity_report(detector_configs, {"JF1": 1, "JF2": 4}, timing_rate=100,
+                                     writer_bandwidth=200e6, disk_bandwidth=400e6)
+        self.assertEqual(len(report["problems"]), 2)
+        self.assertRegex(report["problems"][0], r"^\(JF2\) Data rate of 419.4 MB/s over the writer bandwidth")
+        self.assertRegex(report["problems"][1], "^Total data rate of 524.3 MB/s over the disk bandwidth")
+
+        # Not enough space for 10^9 frames.
+        config["detector"]["cycles"] = 10 ** 9
+        report = get_capacity_report(detector_configs, {"JF1": 1}, timing_rate=100)
+        self.assertRegex(report["problems"][0], r"^Files of detectors \['JF1'\] need 1048576.0 GB on /tmp")
+
+        # A filesystem that cannot be inspected is a problem of its detectors, not a failure of the report.
+        with patch("sf_dia.validation.shutil.disk_usage", side_effect=PermissionError("Permission denied")):
+            report = get_capacity_report(detector_configs, {"JF1": 1}, timing_rate=100)
+        self.assertEqual(report["filesystems"], [])
+        self.assertEqual(report["problems"], ["(JF1) Cannot check the free space for /tmp/out.JF1.h5: "
+                                              "Permission denied"])
+
+    def test_corrections_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pedestal_file = os.path.join(directory, "pedestal.JF1.res.h5")
+            open(pedestal_file, "w").close()
+
+            detector_configs = {"JF1": ({}, {"pede_corrections_filename": pedestal_file,
+                                             "gain_corrections_filename": os.path.join(directory, "JF1/gains.h5")}, {}),
+                                "JF2": ({}, {"pede_corrections_filename": ""}, {})}
+
+            problems = get_corrections_problems(detector_configs, {"JF1": None, "JF2": None})
+
+        self.assertEqual(len(problems), 1)
+        self.assertRegex(problems[0], r"^\(JF1\) Gain file .*/JF1/gains.h5 does not exist.")
+
+    @unittest.skipIf(h5py is None, "h5py not available.")
+    def test_corrections_files_shape(self):
+        import numpy
+
+        with tempfile.TemporaryDirectory() as directory:
+            gain_file = os.path.join(directory, "gains.h5")
+            with h5py.File(gain_file, "w") as output_file:
+                output_file["gains"] = numpy.zeros((4, 1024, 1024), dtype="float32")
+
+            detector_configs = {"JF1": ({}, {"gain_corrections_filename": gain_file}, {})}
+
+            self.assertEqual(get_corrections_problems(detector_configs, {"JF1": 2}), [])
+
+            problems = get_corrections_problems(detector_configs, {"JF1": 4})
+            self.assertRegex(problems[0], r"of shape \(4, 1024, 1024\), expected \(2048, 1024\) for 4 modules.")
+
+    def test_interpret_status_breakdown(self):
+        statuses = {"JF1": {"writer": "writing", "detector": "running", "backend": "OPEN"},
+                    "JF2": {"writer": "crashed", "detector": "running", "backend": "OPEN"},
+                    "bsread": "receiving"}
+
+        status, breakdown = interpret_status_breakdown(statuses)
+
+        self.assertEqual(status, IntegrationStatus.INCONSISTENT)
+        self.assertEqual(breakdown["detectors"], {"JF1": str(IntegrationStatus.RUNNING),
+                                                  "JF2": str(IntegrationStatus.ERROR)})
+        self.assertEqual(breakdown["errors"], {"JF2": {"writer": "crashed", "detector": "running", "backend": "OPEN",
+                                                       "bsread": "receiving"}})
+
+        statuses["JF2"]["writer"] = ClientDisableWrapper.STATUS_DISABLED
+        self.assertEqual(interpret_status(statuses), IntegrationStatus.RUNNING)
+
+    def test_status_rules(self):
+        statuses = {"JF1": {"writer": "stopped", "detector": "idle", "backend": "OPEN"},
+                    "bsread": ClientDisableWrapper.STATUS_DISABLED}
+        self.assertEqual(interpret_status(statuses), IntegrationStatus.FINISHED)
+
+        # The bsread writer is required to be running for BSREAD_STILL_RUNNING.
+        statuses["bsread"] = "receiving"
+        self.assertEqual(interpret_status(statuses), IntegrationStatus.BSREAD_STILL_RUNNING)
+
+        try:
+            set_status_rules([{"status": "FINISHED", "writer": ["done"], "detector": ["idle"], "backend": ["OPEN"],
+                               "bsread": ["stopped"]}] + STATUS_RULES)
+
+            statuses["JF1"]["writer"] = "done"
+            statuses["bsread"] = "stopped"
+            self.assertEqual(interpret_status(statuses), IntegrationStatus.FINISHED)
+        finally:
+            set_status_rules(STATUS_RULES)
+
+        self.assertEqual(interpret_status(statuses), IntegrationStatus.ERROR)
@@ -1,10 +1,13 @@
 import json
+from unittest.mock import patch
 
 import bottle
 import os
 from detector_integration_api.rest_api.rest_server import register_rest_interface
 from detector_integration_api.tests.utils import MockBackendClient, MockDetectorClient, MockExternalProcessClient
 
+from sf_dia.client.detector_pipeline import DetectorPipeline
+
 
 def get_test_bsread_integration_manager(manager_module):
     backend_client = MockBackendClient()
@@ -40,3 +43,151 @@ def get_valid_config():
         configuration = json.load(input_file)
 
     return configuration
+
+
+class FakeTimingPV(object):
+    # Connected timing PV completing every put at once.
+
+    def __init__(self, pv_name, connection_callback=None):
+        self.connected = True
+        self.values = []
+
+    def wait_for_connection(self, timeout=None):
+        return self.connected
+
+    def put(self, value, wait=False, timeout=None, use_complete=False, callback=None):
+        self.values.append(value)
+
+        if not wait and callback is not None:
+            callback(pvname="TIMING")
+
+        return 1
+
+
+class RecordingClient(object):
+    # Mock client recording its calls as (name, method, args) in the shared calls list.
+    # Methods listed in failures raise instead.
+
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+        self.failures = set()
+
+    def _call(self, method, *args):
+        self.calls.append((self.name, method) + args)
+
+        if method in self.failures:
+            raise RuntimeError("Injected failure in %s %s." % (self.name, method))
+
+    def get_status(self):
+        return self.status
+
+    def get_statistics(self):
+        return {}
+
+
+class RecordingBackendClient(RecordingClient):
+    status = "INITIALIZED"
+
+    def set_config(self, configuration):
+        self._call("set_config", configuration)
+        self.status = "CONFIGURED"
+
+    def open(self):
+        self._call("open")
+        self.status = "OPEN"
+
+    def close(self):
+        self._call("close")
+        self.status = "CONFIGURED"
+
+    def reset(self):
+        self._call("reset")
+        self.status = "INITIALIZED"
+
+    def get_metrics(self):
+        return {}
+
+
+class RecordingDetectorClient(RecordingClient):
+    status = "idle"
+
+    def set_config(self, configuration):
+        self._call("set_config", configuration)
+
+    def start(self):
+        self._call("start")
+        self.status = "running"
+
+    def stop(self):
+        self._call("stop")
+        self.status = "idle"
+
+
+class RecordingProcessClient(RecordingClient):
+    # Writer and bsread writer, finished once the test calls finish().
+    status = "stopped"
+
+    def set_parameters(self, process_parameters):
+        self._call("set_parameters", process_parameters)
+        self.status = self.configured_status
+
+    def start(self):
+        self._call("start")
+        self.status = self.running_status
+
+    def finish(self):
+        self.status = self.finished_status
+
+    def stop(self):
+        self._call("stop")
+        self.status = "stopped"
+
+    def reset(self):
+        self._call("reset")
+        self.status = "stopped"
+
+    def kill(self):
+        self._call("kill")
+        self.status = "stopped"
+
+
+class RecordingWriterClient(RecordingProcessClient):
+    configured_status = "stopped"
+    running_status = "writing"
+    finished_status = "finished"
+
+
+class RecordingBsreadClient(RecordingProcessClient):
+    configured_status = "configured"
+    running_status = "receiving"
+    finished_status = "stopped"
+
+
+def get_test_integration_manager(manager_module, detectors=("JF01", "JF02"), **kwargs):
+    # Integration manager with recording mock clients. The calls to all clients are in manager.client_calls.
+    calls = []
+
+    enabled_detectors = {detector: DetectorPipeline(RecordingDetectorClient(detector + " detector", calls),
+                                                    RecordingBackendClient(detector + " backend", calls),
+                                                    RecordingWriterClient(detector + " writer", calls))
+                         for detector in detectors}
+
+    with patch("sf_dia.timing_pv.epics.PV", FakeTimingPV):
+        manager = manager_module.IntegrationManager(enabled_detectors=enabled_detectors,
+                                                    bsread_client=RecordingBsreadClient("bsread", calls),
+                                                    timing_pv="TIMING", timing_start_code=254, timing_stop_code=255,
+                                                    **kwargs)
+
+    manager.client_calls = calls
+
+    return manager
+
+
+def finish_acquisition(manager):
+    # Bring the mock clients from RUNNING to FINISHED, as at the end of the detector frames.
+    for pipeline in manager.enabled_detectors.values():
+        pipeline.detector_client.client.status = "idle"
+        pipeline.writer_client.client.finish()
+
+    manager.bsread_client.client.finish()